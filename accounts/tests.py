@@ -1,3 +1,74 @@
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
 from django.test import TestCase
+from django.urls import URLPattern, reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
 
-# Create your tests here.
+from backend.querybudget import QueryBudgetMixin
+from category.models import CourseCategory
+from courses import catalog
+
+from . import urls
+from .models import Account
+
+
+class AccountRouteQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every route in accounts.urls stays within settings.QUERY_BUDGETS."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for slug in ("cse", "eee", "bba"):
+            CourseCategory.objects.create(courseCategory=slug.upper(), dep_name=slug, slug=slug)
+        cls.user = Account.objects.create_user(
+            first_name="Student", last_name="One", username="student",
+            email="student@example.com", password="old-password",
+        )
+
+    def setUp(self):
+        catalog.bump_version()  # budgets are for a cold catalog cache
+
+    def token_args(self):
+        return [urlsafe_base64_encode(force_bytes(self.user.pk)), default_token_generator.make_token(self.user)]
+
+    def request_within_budget(self, name, args=(), data=None, status=200):
+        url = reverse(name, args=args)
+        with self.assertQueryBudget(name):
+            response = self.client.post(url, data) if data is not None else self.client.get(url)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_every_route_has_a_budget(self):
+        names = {p.name for p in urls.urlpatterns if isinstance(p, URLPattern)}
+        self.assertEqual(names - set(settings.QUERY_BUDGETS), set())
+
+    def test_register_form(self):
+        self.request_within_budget("register")
+
+    def test_login_form(self):
+        self.request_within_budget("login")
+
+    def test_login(self):
+        self.request_within_budget(
+            "login", data={"email": "student@example.com", "password": "old-password"}, status=302
+        )
+
+    def test_logout(self):
+        self.client.force_login(self.user)
+        self.request_within_budget("logout", status=302)
+
+    def test_activate(self):
+        self.request_within_budget("activate", self.token_args(), status=302)
+
+    def test_forgot_password(self):
+        self.request_within_budget("forgotPassword", data={"email": "student@example.com"}, status=302)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_reset_password_flow(self):
+        self.request_within_budget("resetpassword_validate", self.token_args(), status=302)
+        self.request_within_budget(
+            "resetPassword", data={"password": "new-password", "confirm_password": "new-password"}, status=302
+        )
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("new-password"))
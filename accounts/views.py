@@ -96,8 +96,8 @@ def activate(request, uidb64, token):
 def forgotPassword(request):
     if request.method == 'POST':
         email = request.POST['email']
-        if Account.objects.filter(email=email).exists():
-            user = Account.objects.get(email__exact=email)
+        user = Account.objects.filter(email__exact=email).first()
+        if user is not None:
 
             # Reset password email
             current_site = get_current_site(request)
@@ -0,0 +1,158 @@
+"""
+Per-view SQL instrumentation: query count, DB time and repeated queries.
+
+QueryRecorder hooks the connection's execute wrappers and records every
+statement with its duration. Statements are grouped by fingerprint (the
+SQL with literals and IN lists collapsed), so the same query running once
+per row of a listing (an N+1) shows up as one fingerprint repeated N times.
+
+QueryBudgetMiddleware (opt-in, settings.QUERY_BUDGET_ENABLED) records each
+request, adds a Server-Timing header and logs a warning when a view goes
+over its budget in settings.QUERY_BUDGETS (by URL name), over
+QUERY_TIME_BUDGET_MS, or repeats a query QUERY_REPEAT_THRESHOLD times.
+QueryBudgetMixin asserts the same budgets in tests.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERALS = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERALS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)")
+# transaction control (e.g. the savepoints of atomic blocks) is not a query
+_TRANSACTION_CONTROL = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+def fingerprint(sql):
+    """SQL with literals replaced by ? and IN (...) lists collapsed."""
+    sql = _STRING_LITERALS.sub("?", sql)
+    sql = _NUMBER_LITERALS.sub("?", sql)
+    sql = _IN_LISTS.sub("(...)", sql)
+    return " ".join(sql.split())
+
+
+def query_budget(name):
+    """Max queries allowed for the view with URL name `name`."""
+    return getattr(settings, "QUERY_BUDGETS", {}).get(name, getattr(settings, "QUERY_BUDGET_DEFAULT", 10))
+
+
+class QueryRecorder:
+    """
+    Records the queries run on one connection in this thread:
+
+        with QueryRecorder() as recorder:
+            ...
+        recorder.count, recorder.duration, recorder.repeated()
+
+    Queries other threads run (e.g. the image export pool) are not included.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+        self.queries = []  # (sql, seconds)
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith(_TRANSACTION_CONTROL):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    def __enter__(self):
+        self._connection = connections[self.using]
+        self._connection.execute_wrappers.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        self._connection.execute_wrappers.remove(self)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        """Total DB time in seconds."""
+        return sum(seconds for _, seconds in self.queries)
+
+    def repeated(self, threshold=None):
+        """[(fingerprint, times)] run at least `threshold` times, most repeated first."""
+        threshold = threshold or getattr(settings, "QUERY_REPEAT_THRESHOLD", 3)
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return [(fp, n) for fp, n in counts.most_common() if n >= threshold]
+
+    def problems(self, name):
+        """Human-readable budget violations for the view with URL name `name`."""
+        found = []
+        budget = query_budget(name)
+        if self.count > budget:
+            found.append(f"{self.count} queries (budget {budget})")
+        time_budget = getattr(settings, "QUERY_TIME_BUDGET_MS", 0)
+        if time_budget and self.duration * 1000 > time_budget:
+            found.append(f"{self.duration * 1000:.1f} ms in the DB (budget {time_budget} ms)")
+        for fp, n in self.repeated():
+            found.append(f"repeated {n}x: {fp}")
+        return found
+
+    def summary(self):
+        return "\n".join(f"{seconds * 1000:7.2f} ms  {sql}" for sql, seconds in self.queries)
+
+
+class QueryBudgetMiddleware:
+    """
+    Logs views that exceed their query budget. Put it first in MIDDLEWARE
+    so session and auth queries are counted too. Queries a streaming
+    response runs while being sent are not seen.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        name = match.view_name if match else request.path
+        response["Server-Timing"] = f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries"'
+
+        problems = recorder.problems(name)
+        if problems:
+            logger.warning(
+                "Query budget exceeded by %s %s (%s): %s",
+                request.method, request.path, name, "; ".join(problems),
+            )
+            logger.debug("Queries of %s %s:\n%s", request.method, request.path, recorder.summary())
+        return response
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin:
+
+        with self.assertQueryBudget("course"):
+            self.client.get(reverse("course"))
+
+    Fails if the block runs more queries than settings.QUERY_BUDGETS allows
+    for that URL name, or repeats one query QUERY_REPEAT_THRESHOLD times.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, name):
+        with QueryRecorder() as recorder:
+            yield recorder
+        budget = query_budget(name)
+        self.assertLessEqual(
+            recorder.count, budget,
+            f"{name}: {recorder.count} queries, budget {budget}\n{recorder.summary()}",
+        )
+        self.assertEqual(recorder.repeated(), [], f"{name}: repeated queries\n{recorder.summary()}")
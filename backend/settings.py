@@ -77,6 +77,42 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# ------------------------------------------------
+# QUERY BUDGETS (per-view query count / DB time)
+# ------------------------------------------------
+# Opt-in: log views that go over budget (backend.querybudget). The same
+# budgets are asserted by the route tests in courses/ and accounts/.
+QUERY_BUDGET_ENABLED = os.getenv("QUERY_BUDGET_ENABLED", "False") == "True"
+if QUERY_BUDGET_ENABLED:
+    MIDDLEWARE.insert(0, "backend.querybudget.QueryBudgetMiddleware")
+
+# Max queries per URL name, counting session / auth lookups, with a cold
+# catalog cache (warm home/course pages only run the session / auth ones)
+QUERY_BUDGETS = {
+    "home": 5,
+    # courses
+    "course": 5,
+    "course_by_category": 6,
+    "search": 6,
+    "course_autocomplete": 1,  # only when the prefix index is rebuilt
+    "course_detail": 6,
+    "course_detail_per_section": 7,
+    "download_lecture_notes_pdf": 5,
+    "download_user_images": 5,
+    # accounts
+    "register": 1,
+    "login": 5,
+    "logout": 4,
+    "activate": 2,
+    "forgotPassword": 1,
+    "resetpassword_validate": 3,
+    "resetPassword": 3,
+}
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT", "10"))
+QUERY_TIME_BUDGET_MS = int(os.getenv("QUERY_TIME_BUDGET_MS", "200"))
+# Same statement this many times in one request = likely N+1
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "3"))
+
 # ------------------------------------------------
 # URLS / WSGI
 # ------------------------------------------------
@@ -185,13 +221,144 @@ else:
     CELERY_BROKER_URL = os.getenv("REDIS_URL")
     CELERY_RESULT_BACKEND = os.getenv("REDIS_URL")
 
+# Run tasks in-process (local load tests against AI_PROVIDER=fake without a worker)
+CELERY_TASK_ALWAYS_EAGER = os.getenv("CELERY_TASK_ALWAYS_EAGER") == "True"
+
+# Lectures are generated by per-lecture ETA tasks; this sweep only catches
+# ones whose task was lost or failed
 CELERY_BEAT_SCHEDULE = {
     "process_due_lectures_every_hour": {
         "task": "courses.tasks.process_due_lectures_task",
-        "schedule": 3600.0,
+        "schedule": float(os.getenv("LECTURE_PDF_SWEEP_SECONDS", "3600")),
     },
 }
 
+# Per-lecture generation lock (courses.locks): Redis lease on the broker's Redis
+# so web and Celery processes share it, or the Django cache when set to "".
+# Busy tasks retry after LECTURE_LOCK_RETRY_SECONDS.
+LECTURE_LOCK_REDIS_URL = os.getenv("LECTURE_LOCK_REDIS_URL", CELERY_BROKER_URL or "")
+LECTURE_LOCK_LEASE_SECONDS = int(os.getenv("LECTURE_LOCK_LEASE_SECONDS", "900"))
+LECTURE_LOCK_RETRY_SECONDS = int(os.getenv("LECTURE_LOCK_RETRY_SECONDS", "30"))
+
+# ETA tasks wait in the worker up to a day ahead; keep Redis from redelivering
+# them meanwhile (duplicates would be skipped, but cost a message each)
+CELERY_BROKER_TRANSPORT_OPTIONS = {"visibility_timeout": 2 * 24 * 3600}
+
+# ------------------------------------------------
+# AI / OCR
+# ------------------------------------------------
+# "gemini", "fake" (local, deterministic, no network) or a dotted provider class path
+AI_PROVIDER = os.getenv("AI_PROVIDER", "gemini")
+
+# Simulated behaviour of the fake provider (seconds / fraction of calls)
+AI_FAKE_OPTIONS = {
+    "latency": float(os.getenv("AI_FAKE_LATENCY", "0.0")),
+    "jitter": float(os.getenv("AI_FAKE_JITTER", "0.0")),
+    "per_image_latency": float(os.getenv("AI_FAKE_PER_IMAGE_LATENCY", "0.0")),
+    "error_rate": float(os.getenv("AI_FAKE_ERROR_RATE", "0.0")),
+    "seed": os.getenv("AI_FAKE_SEED"),
+}
+
+# In-process LRU in front of the OCRCacheEntry table (0 disables it)
+OCR_CACHE_LRU_SIZE = int(os.getenv("OCR_CACHE_LRU_SIZE", "256"))
+
+# Run upload OCR as Celery jobs; "False" runs it inline with a thread pool
+OCR_USE_CELERY = os.getenv("OCR_USE_CELERY", "True") != "False"
+
+# Max concurrent OCR calls for one inline batch
+OCR_MAX_CONCURRENCY = int(os.getenv("OCR_MAX_CONCURRENCY", "8"))
+
+# Pages packed into one multi-image OCR request (1 = one request per page)
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "4"))
+
+# SectionNotes per structuring chunk; unchanged chunks are reused from StructuredChunk
+STRUCTURE_CHUNK_NOTES = int(os.getenv("STRUCTURE_CHUNK_NOTES", "4"))
+
+# Chunks over this many (estimated) tokens are split into overlapping windows
+STRUCTURE_WINDOW_TOKENS = int(os.getenv("STRUCTURE_WINDOW_TOKENS", "6000"))
+STRUCTURE_WINDOW_OVERLAP_TOKENS = int(os.getenv("STRUCTURE_WINDOW_OVERLAP_TOKENS", "200"))
+
+# Windows structured in parallel per lecture
+STRUCTURE_MAX_CONCURRENCY = int(os.getenv("STRUCTURE_MAX_CONCURRENCY", "4"))
+
+# Browser cache lifetime for lecture PDFs (revalidated by ETag after that)
+PDF_CACHE_MAX_AGE = int(os.getenv("PDF_CACHE_MAX_AGE", "86400"))
+
+# Concurrent fetch + enhance jobs per ZIP export, and per-image fetch timeout (s)
+IMAGE_EXPORT_CONCURRENCY = int(os.getenv("IMAGE_EXPORT_CONCURRENCY", "4"))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "15"))
+
+# Processes in the image enhancement pool (0 = one per available CPU)
+IMAGE_ENHANCE_WORKERS = int(os.getenv("IMAGE_ENHANCE_WORKERS", "0"))
+
+# Resolution factor for the shadow/background estimate (1.0 = full-res). Lower
+# is faster on 12-48 MP photos but changes which pixels count as ink on pages
+# with cast shadows; check `manage.py bench_shadow_removal --photos-dir` on
+# real photos before lowering it
+IMAGE_ENHANCE_BACKGROUND_SCALE = float(os.getenv("IMAGE_ENHANCE_BACKGROUND_SCALE", "1.0"))
+
+# Detect the page and crop/deskew before enhancing. Off by default: the
+# full-res warp alone is ~80 ms on a 12 MP photo (`manage.py bench_document_crop`)
+IMAGE_ENHANCE_CROP = os.getenv("IMAGE_ENHANCE_CROP", "False") == "True"
+
+# Longest side photos are decoded at before enhancement / sent to OCR at
+# (0 = full size). JPEGs are decoded at reduced DCT scale, never upscaled.
+IMAGE_ENHANCE_MAX_SIDE = int(os.getenv("IMAGE_ENHANCE_MAX_SIDE", "3000"))
+OCR_IMAGE_MAX_SIDE = int(os.getenv("OCR_IMAGE_MAX_SIDE", "2048"))
+OCR_IMAGE_QUALITY = int(os.getenv("OCR_IMAGE_QUALITY", "85"))
+
+# Gallery thumbnail/preview widths (px) for SectionNote photos; Cloudinary
+# images are resized by URL transformation, others get stored JPEGs
+IMAGE_DERIVATIVE_SIZES = {"thumb": 320, "preview": 640}
+IMAGE_DERIVATIVE_QUALITY = int(os.getenv("IMAGE_DERIVATIVE_QUALITY", "80"))
+
+# Hits per page of full-text search results (keyset-paged)
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+# Queries matching more entries than this are listed newest first
+# instead of ranked, keeping common-word searches fast (0 = always rank)
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "5000"))
+
+# Autocomplete: suggestions per keystroke, how often workers check the
+# shared index version, and max index age when the cache is not shared
+AUTOCOMPLETE_LIMIT = int(os.getenv("AUTOCOMPLETE_LIMIT", "8"))
+AUTOCOMPLETE_CHECK_SECONDS = float(os.getenv("AUTOCOMPLETE_CHECK_SECONDS", "1"))
+AUTOCOMPLETE_MAX_AGE = float(os.getenv("AUTOCOMPLETE_MAX_AGE", "300"))
+
+# Gemini quota shared by all workers (0 disables a limit)
+GEMINI_REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
+GEMINI_TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TOKENS_PER_MINUTE", "250000"))
+
+# Backoff on 429/503: full jitter, base * 2^attempt capped at GEMINI_BACKOFF_MAX
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "4"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "1.0"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "30.0"))
+
+# ------------------------------------------------
+# CACHE (shared across workers when Redis is available)
+# ------------------------------------------------
+REDIS_URL = os.getenv("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Catalog cache (category menu, home grid, course listings): entry
+# lifetime, and how many lookups a worker counts before adding its
+# hits/misses to the shared stats (catalog_cache_stats command)
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", "3600"))
+CATALOG_CACHE_STATS_FLUSH = int(os.getenv("CATALOG_CACHE_STATS_FLUSH", "100"))
+HOME_COURSES_PER_PAGE = int(os.getenv("HOME_COURSES_PER_PAGE", "9"))
+
 # ------------------------------------------------
 # REST FRAMEWORK
 # ------------------------------------------------
@@ -1,13 +1,15 @@
+from django.conf import settings
 from django.shortcuts import render
+from courses.catalog import CachedPaginator
 from courses.models import Course
 
 def home(request):
-    courses=Course.objects.all().filter()
-    
+    courses = Course.objects.select_related('category').order_by('pk')
+    paginator = CachedPaginator(courses, getattr(settings, 'HOME_COURSES_PER_PAGE', 9), 'home')
+
     context={
-        'courses':courses,
+        'courses':paginator.get_page(request.GET.get('page')),
     }
 
 
     return render(request,'home.html',context)
-
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Course, SectionNote, LectureFinalNote
+from .models import Course, SectionNote, LectureFinalNote, OCRCacheEntry
 
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
@@ -17,3 +17,8 @@ class SectionNoteAdmin(admin.ModelAdmin):
 class LectureFinalNoteAdmin(admin.ModelAdmin):
     list_display = ("course", "lecture", "is_generated", "next_pdf_time", "created_at")
     readonly_fields = ("created_at",)
+
+@admin.register(OCRCacheEntry)
+class OCRCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ("digest", "key_version", "hit_count", "created_at")
+    readonly_fields = ("created_at",)
@@ -1,75 +1,531 @@
-from django.shortcuts import render, get_object_or_404,redirect
-from .models import Course, SectionNote,LectureFinalNote
-from category.models import CourseCategory
-from PIL import Image
-import google.generativeai as genai
-import os
-from django.http import HttpResponse
-from io import BytesIO
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import inch
-from django.contrib.auth.decorators import login_required
-
-from django.http import FileResponse
-from collections import defaultdict
-
 from dotenv import load_dotenv
 
 load_dotenv()
 
-genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+import io
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import LRUCache
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, connection
+from django.db.models import F
+from google.api_core import exceptions as google_exceptions
+from image_enhancer.utils.prep import prepare_image
+from .providers import TransientAIError, get_provider
+
+logger = logging.getLogger(__name__)
 
+OCR_MODEL_NAME = "gemini-2.5-flash"
+STRUCTURE_MODEL_NAME = "gemini-2.5-flash"
+OCR_PROMPT = "Extract handwritten text accurately from this image."
+OCR_ERROR_TEXT = "(Error extracting text)"
 
+OCR_IMAGE_MAX_SIDE = getattr(settings, "OCR_IMAGE_MAX_SIDE", 2048)
+OCR_IMAGE_QUALITY = getattr(settings, "OCR_IMAGE_QUALITY", 85)
 
-from PIL import Image
-import io
+# Changes whenever the prompt, model or image preparation does, so stale
+# cache rows stop matching (combined with the provider, see provider_key_version)
+OCR_CACHE_KEY_VERSION = hashlib.sha1(
+    f"{OCR_MODEL_NAME}\n{OCR_PROMPT}\n{OCR_IMAGE_MAX_SIDE}/{OCR_IMAGE_QUALITY}".encode("utf-8")
+).hexdigest()[:16]
+
+
+def provider_key_version(base):
+    """
+    `base` (a *_KEY_VERSION) for the configured provider, so results cached
+    while load testing with the fake are never served as Gemini output.
+    """
+    return hashlib.sha1(f"{get_provider().name}\n{base}".encode("utf-8")).hexdigest()[:16]
+
+
+# -----------------------------
+# SHARED MODEL CLIENT (rate limiting + backoff)
+# -----------------------------
+class TokenBucket:
+    """
+    Token bucket refilled at `per_minute` tokens/minute, holding at most
+    `capacity`. State lives in the Django cache so every worker process
+    draws from the same budget. Callers that overdraw reserve their tokens
+    (the balance goes negative) and sleep until the refill covers them.
+    """
+
+    LOCK_TIMEOUT = 5
+
+    def __init__(self, name, per_minute, capacity=None, cache_alias="default"):
+        self.key = f"gemini:bucket:{name}"
+        self.lock_key = f"{self.key}:lock"
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _locked(self):
+        deadline = time.monotonic() + self.LOCK_TIMEOUT
+        while not self.cache.add(self.lock_key, 1, timeout=self.LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def _take(self, amount):
+        """Debit `amount` and return how long the caller must wait for it."""
+        if not self._locked():
+            logger.warning("Rate limiter lock %s timed out; not limiting", self.key)
+            return 0.0
+        try:
+            now = time.time()
+            tokens, stamp = self.cache.get(self.key) or (self.capacity, now)
+            tokens = min(self.capacity, tokens + (now - stamp) * self.rate)
+            tokens = min(self.capacity, tokens - amount)
+            self.cache.set(self.key, (tokens, now), timeout=None)
+        finally:
+            self.cache.delete(self.lock_key)
+        return -tokens / self.rate if tokens < 0 else 0.0
+
+    def acquire(self, amount=1):
+        """Block until `amount` tokens are available; returns seconds waited."""
+        if self.rate <= 0 or amount <= 0:
+            return 0.0
+        try:
+            wait = self._take(amount)
+        except Exception:
+            logger.exception("Rate limiter %s unavailable; not limiting", self.key)
+            return 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def adjust(self, amount):
+        """Debit (or credit, if negative) tokens without waiting."""
+        if self.rate <= 0 or not amount:
+            return
+        try:
+            self._take(amount)
+        except Exception:
+            logger.exception("Rate limiter %s unavailable", self.key)
+
+
+_limiter_lock = threading.Lock()
+_limiter_stats = {"requests": 0, "waited": 0, "wait_seconds": 0.0, "max_wait": 0.0, "retries": 0}
+
+
+def _record_wait(seconds):
+    with _limiter_lock:
+        _limiter_stats["requests"] += 1
+        if seconds > 0:
+            _limiter_stats["waited"] += 1
+            _limiter_stats["wait_seconds"] += seconds
+            _limiter_stats["max_wait"] = max(_limiter_stats["max_wait"], seconds)
+    if seconds > 0:
+        logger.info("AI call waited %.2fs for the rate limiter", seconds)
+
+
+def model_client_stats():
+    """Per-process limiter waits and retries, for sizing workers against quota."""
+    with _limiter_lock:
+        stats = dict(_limiter_stats)
+    stats["avg_wait"] = stats["wait_seconds"] / stats["requests"] if stats["requests"] else 0.0
+    return stats
+
+
+# Images are billed at a flat ~258 tokens; text at roughly 4 chars/token
+IMAGE_TOKEN_ESTIMATE = 258
+
+
+def estimate_tokens(contents):
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    total = 0
+    for part in parts:
+        total += len(part) // 4 + 1 if isinstance(part, str) else IMAGE_TOKEN_ESTIMATE
+    return total
 
-def extract_text_from_image(file):
+
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    TransientAIError,
+)
+
+
+class ModelClient:
+    """
+    Rate-limited, retrying wrapper around one provider model.
+    Exposes the same generate_content() the helpers call on a raw model.
+    """
+
+    def __init__(self, provider, model_name):
+        self.provider = provider
+        self.model_name = model_name
+        self.model = provider.get_model(model_name)
+
+    def generate_content(self, contents):
+        estimated = estimate_tokens(contents)
+        waited = _token_bucket.acquire(estimated)
+        max_retries = getattr(settings, "GEMINI_MAX_RETRIES", 4)
+        base = getattr(settings, "GEMINI_BACKOFF_BASE", 1.0)
+        cap = getattr(settings, "GEMINI_BACKOFF_MAX", 30.0)
+
+        for attempt in range(max_retries + 1):
+            waited += _request_bucket.acquire(1)
+            try:
+                response = self.model.generate_content(contents)
+                break
+            except RETRYABLE_ERRORS as e:
+                if attempt == max_retries:
+                    _record_wait(waited)
+                    raise
+                # exponential backoff with full jitter
+                delay = random.uniform(0, min(cap, base * 2 ** attempt))
+                with _limiter_lock:
+                    _limiter_stats["retries"] += 1
+                logger.warning(
+                    "%s %s (%s); retry %d in %.1fs",
+                    self.provider.name, self.model_name, getattr(e, "code", "error"), attempt + 1, delay,
+                )
+                time.sleep(delay)
+
+        _record_wait(waited)
+        usage = getattr(response, "usage_metadata", None)
+        actual = getattr(usage, "total_token_count", 0) or 0
+        if actual:
+            _token_bucket.adjust(actual - estimated)
+        return response
+
+
+_request_bucket = TokenBucket("rpm", getattr(settings, "GEMINI_REQUESTS_PER_MINUTE", 60))
+_token_bucket = TokenBucket("tpm", getattr(settings, "GEMINI_TOKENS_PER_MINUTE", 250000))
+_clients = {}
+
+
+def get_model_client(model_name):
+    """One ModelClient per model name per process, for the configured provider."""
+    provider = get_provider()
+    with _limiter_lock:
+        client = _clients.get(model_name)
+        if client is None or client.provider is not provider:
+            client = _clients[model_name] = ModelClient(provider, model_name)
+    return client
+
+
+
+def image_part(data: bytes) -> dict:
+    """
+    Model input part for raw image bytes, downscaled and re-encoded by the
+    shared prep stage (OCR_IMAGE_MAX_SIDE / OCR_IMAGE_QUALITY). Sent as an
+    inline blob: a PIL image would be re-encoded as lossless WebP by the SDK.
+    """
+    prepared, mime_type = prepare_image(data, max_side=OCR_IMAGE_MAX_SIDE, quality=OCR_IMAGE_QUALITY)
+    return {"mime_type": mime_type, "data": prepared}
+
+
+def extract_text_from_image(file, model=None):
     """
     file: BytesIO or path
+    model: optional object with generate_content(); defaults to the
+    configured provider behind the shared rate-limited client
     """
-    ocr_model = genai.GenerativeModel("gemini-2.5-flash")
-    
-    # If BytesIO
-    if isinstance(file, io.BytesIO):
-        img = Image.open(file)
-    else:  # path
-        img = Image.open(file)
+    ocr_model = model or get_model_client(OCR_MODEL_NAME)
     
-    prompt = "Extract handwritten text accurately from this image."
+    prompt = OCR_PROMPT
 
     try:
+        img = image_part(_read_image_bytes(file))
         response = ocr_model.generate_content([prompt, img])
         return response.text.strip() if response.text else "(No text found)"
     except:
-        return "(Error extracting text)"
-
-def structure_text_with_gemini(all_text):
-    model = genai.GenerativeModel("gemini-2.5-flash")
-    prompt = (
-        "The following text was extracted using OCR and may contain mistakes, formatting errors, "
-        "and broken structure. Your job is to CLEAN and RECONSTRUCT it, not rewrite it.\n\n"
-        "📌 STRICT RULES:\n"
-        "- Convert everything into clean, structured Markdown.\n"
-        "- Use # for main headings.\n"
-        "- Use ## for subheadings.\n"
-        "- Use bullet points for lists.\n"
-        "- Use fenced code blocks for code.\n"
-        "- Fix indentation, spacing, and incorrect formatting.\n"
-        "- DO NOT summarize information.\n"
-        "- Preserve technical meaning.\n"
-        "- Do not use * or ** or *** in text.\n"
-        "- If OCR text is wrong, correct it and explain simply in 1–2 lines.\n"
-        "- When you detect a topic change, create a section heading.\n"
-        "- Make sure output is clean, readable, and well-structured.\n\n"
-        "📌 INPUT OCR TEXT (very messy):\n"
-        f"{all_text}\n\n"
-        "📌 OUTPUT (clean Markdown only):"
-    )
+        return OCR_ERROR_TEXT
+
+
+# -----------------------------
+# MULTI-IMAGE OCR (several pages per request)
+# -----------------------------
+OCR_BATCH_PROMPT = (
+    "Extract handwritten text accurately from each of the {count} images below. "
+    "Answer for every image in the given order. Start each answer with a line "
+    "'=== PAGE n ===' (n = image number, starting at 1) and output nothing else."
+)
+PAGE_DELIMITER_RE = re.compile(r"^\s*=== PAGE (\d+) ===\s*$", re.MULTILINE)
+
+
+def split_page_delimited(text, count):
+    """
+    Split model output on '=== PAGE n ===' lines.
+    Returns `count` page texts, or None if the delimiters are missing,
+    duplicated or out of order.
+    """
+    matches = list(PAGE_DELIMITER_RE.finditer(text or ""))
+    if [int(m.group(1)) for m in matches] != list(range(1, count + 1)):
+        return None
+
+    pages = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        pages.append(text[match.end():end].strip() or "(No text found)")
+    return pages
+
+
+def extract_text_from_image_batch(images, model=None):
+    """
+    OCR up to OCR_BATCH_SIZE images (raw bytes) with a single model call.
+    Falls back to one call per image if the page delimiters come back malformed.
+    """
+    if len(images) == 1:
+        return [extract_text_from_image(io.BytesIO(images[0]), model=model)]
+
+    ocr_model = model or get_model_client(OCR_MODEL_NAME)
     try:
-        response = model.generate_content(prompt)
-        return response.text.strip() if response.text else (all_text or "(No text found)")
+        parts = [OCR_BATCH_PROMPT.format(count=len(images))]
+        for page_no, data in enumerate(images, start=1):
+            parts.append(f"=== PAGE {page_no} ===")
+            parts.append(image_part(data))
+
+        response = ocr_model.generate_content(parts)
+        pages = split_page_delimited(response.text, len(images))
+    except Exception:
+        logger.exception("Batched OCR call failed for %d images", len(images))
+        pages = None
+
+    if pages is None:
+        logger.warning("Batched OCR output malformed; retrying %d images one by one", len(images))
+        return [extract_text_from_image(io.BytesIO(data), model=ocr_model) for data in images]
+    return pages
+
+
+# -----------------------------
+# OCR RESULT CACHE (content-addressed)
+# -----------------------------
+_ocr_lru_size = getattr(settings, "OCR_CACHE_LRU_SIZE", 256)
+_ocr_lru = LRUCache(maxsize=_ocr_lru_size) if _ocr_lru_size > 0 else None
+_ocr_lock = threading.Lock()
+_ocr_stats = {"lru_hits": 0, "db_hits": 0, "misses": 0}
+
+
+def _count(stat):
+    with _ocr_lock:
+        _ocr_stats[stat] += 1
+
+
+def ocr_cache_stats():
+    """Per-process hit/miss counters for the OCR cache."""
+    with _ocr_lock:
+        stats = dict(_ocr_stats)
+    lookups = sum(stats.values())
+    stats["hit_rate"] = (stats["lru_hits"] + stats["db_hits"]) / lookups if lookups else 0.0
+    return stats
+
+
+def image_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _ocr_cache_get(digest):
+    """Cached text for `digest`, or None on a miss (counted either way)."""
+    from .models import OCRCacheEntry
+
+    key_version = provider_key_version(OCR_CACHE_KEY_VERSION)
+    if _ocr_lru is not None:
+        with _ocr_lock:
+            cached = _ocr_lru.get((key_version, digest))
+        if cached is not None:
+            _count("lru_hits")
+            return cached
+
+    entry = OCRCacheEntry.objects.filter(
+        digest=digest, key_version=key_version
+    ).only("pk", "extracted_text").first()
+    if not entry:
+        _count("misses")
+        return None
+
+    _count("db_hits")
+    OCRCacheEntry.objects.filter(pk=entry.pk).update(hit_count=F("hit_count") + 1)
+    if _ocr_lru is not None:
+        with _ocr_lock:
+            _ocr_lru[key_version, digest] = entry.extracted_text
+    return entry.extracted_text
+
+
+def _ocr_cache_put(digest, text):
+    from .models import OCRCacheEntry
+
+    if text == OCR_ERROR_TEXT:
+        # never cache failures
+        return
+    key_version = provider_key_version(OCR_CACHE_KEY_VERSION)
+    try:
+        OCRCacheEntry.objects.create(
+            digest=digest, key_version=key_version, extracted_text=text
+        )
+    except IntegrityError:
+        # another worker cached the same image first
+        pass
+    if _ocr_lru is not None:
+        with _ocr_lock:
+            _ocr_lru[key_version, digest] = text
+
+
+def extract_text_from_image_cached(data: bytes) -> str:
+    """
+    OCR raw image bytes, reusing an earlier result for identical bytes.
+    Lookup order: in-process LRU → OCRCacheEntry table → Gemini.
+    """
+    digest = image_digest(data)
+    text = _ocr_cache_get(digest)
+    if text is None:
+        text = extract_text_from_image(io.BytesIO(data))
+        _ocr_cache_put(digest, text)
+    return text
+
+# -----------------------------
+# BATCH OCR (bounded thread pool)
+# -----------------------------
+def _read_image_bytes(image):
+    """Accept raw bytes, an uploaded/stored file, or a filesystem path."""
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    if hasattr(image, "open") and hasattr(image, "storage"):  # FieldFile
+        with image.open("rb") as fh:
+            return fh.read()
+    if hasattr(image, "read"):
+        if hasattr(image, "seek"):
+            image.seek(0)
+        return image.read()
+    with open(image, "rb") as fh:
+        return fh.read()
+
+
+def _in_worker(func):
+    """Run func in a pool thread, releasing that thread's DB connection afterwards."""
+    def run(*args):
+        try:
+            return func(*args)
+        finally:
+            connection.close()
+    return run
+
+
+def _ocr_one(image):
+    try:
+        return extract_text_from_image_cached(_read_image_bytes(image))
+    except Exception:
+        logger.exception("OCR failed for batch image")
+        return OCR_ERROR_TEXT
+
+
+def _ocr_chunk(chunk):
+    """chunk: list of (digest, bytes) cache misses sharing one model call."""
+    try:
+        texts = extract_text_from_image_batch([data for _, data in chunk])
+    except Exception:
+        logger.exception("OCR failed for a batch of %d images", len(chunk))
+        return [OCR_ERROR_TEXT] * len(chunk)
+    for (digest, _), text in zip(chunk, texts):
+        _ocr_cache_put(digest, text)
+    return texts
+
+
+def _read_or_none(image):
+    try:
+        return _read_image_bytes(image)
+    except Exception:
+        logger.exception("Could not read image for OCR")
+        return None
+
+
+def extract_text_from_images(images, max_workers=None, batch_size=None):
+    """
+    OCR several images concurrently, at most `max_workers` at a time
+    (default settings.OCR_MAX_CONCURRENCY).
+    With batch_size > 1 (default settings.OCR_BATCH_SIZE) uncached images are
+    packed up to batch_size per model call.
+    Returns texts in input order; a failing image yields OCR_ERROR_TEXT.
+    """
+    images = list(images)
+    if not images:
+        return []
+
+    limit = max_workers or getattr(settings, "OCR_MAX_CONCURRENCY", 8)
+    workers = max(1, min(limit, len(images)))
+    batch_size = batch_size or getattr(settings, "OCR_BATCH_SIZE", 1)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr") as pool:
+        if batch_size <= 1:
+            return list(pool.map(_in_worker(_ocr_one), images))
+
+        results = [OCR_ERROR_TEXT] * len(images)
+        misses = []  # (index, digest, bytes)
+        for index, data in enumerate(pool.map(_in_worker(_read_or_none), images)):
+            if data is None:
+                continue
+            digest = image_digest(data)
+            cached = _ocr_cache_get(digest)
+            if cached is None:
+                misses.append((index, digest, data))
+            else:
+                results[index] = cached
+
+        chunks = [misses[i:i + batch_size] for i in range(0, len(misses), batch_size)]
+        chunk_texts = pool.map(
+            _in_worker(_ocr_chunk),
+            [[(digest, data) for _, digest, data in chunk] for chunk in chunks],
+        )
+        for chunk, texts in zip(chunks, chunk_texts):
+            for (index, _, _), text in zip(chunk, texts):
+                results[index] = text
+        return results
+
+
+STRUCTURE_PROMPT = (
+    "The following text was extracted using OCR and may contain mistakes, formatting errors, "
+    "and broken structure. Your job is to CLEAN and RECONSTRUCT it, not rewrite it.\n\n"
+    "📌 STRICT RULES:\n"
+    "- Convert everything into clean, structured Markdown.\n"
+    "- Use # for main headings.\n"
+    "- Use ## for subheadings.\n"
+    "- Use bullet points for lists.\n"
+    "- Use fenced code blocks for code.\n"
+    "- Fix indentation, spacing, and incorrect formatting.\n"
+    "- DO NOT summarize information.\n"
+    "- Preserve technical meaning.\n"
+    "- Do not use * or ** or *** in text.\n"
+    "- If OCR text is wrong, correct it and explain simply in 1–2 lines.\n"
+    "- When you detect a topic change, create a section heading.\n"
+    "- Make sure output is clean, readable, and well-structured.\n\n"
+    "📌 OUTPUT: clean Markdown only.\n\n"
+    "📌 INPUT OCR TEXT (very messy):\n"
+)
+
+
+# Changes whenever the structuring prompt or model does (see StructuredChunk);
+# combined with the provider by provider_key_version
+STRUCTURE_KEY_VERSION = hashlib.sha1(
+    f"{STRUCTURE_MODEL_NAME}\n{STRUCTURE_PROMPT}".encode("utf-8")
+).hexdigest()[:16]
+
+
+def structure_text(all_text, model=None):
+    """Structure OCR text into Markdown; raises if the model call fails or returns nothing."""
+    model = model or get_model_client(STRUCTURE_MODEL_NAME)
+    # OCR text goes last as its own part
+    response = model.generate_content([STRUCTURE_PROMPT, all_text])
+    text = (response.text or "").strip()
+    if not text:
+        raise ValueError("empty structuring response")
+    return text
+
+
+def structure_text_with_gemini(all_text, model=None):
+    try:
+        return structure_text(all_text, model=model)
     except:
         return all_text or "(No text found)"
-
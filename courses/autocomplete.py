@@ -0,0 +1,137 @@
+"""
+Per-process prefix index for course / faculty autocomplete.
+
+Each worker keeps sorted arrays of lowercase keys (course initials,
+faculty initials, words of course names) and answers a prefix with two
+bisects, so a keystroke costs no SQL. Course and category changes bump
+a version number in the shared cache (after commit); a worker that sees
+a newer version rebuilds its arrays with one query. The version is
+checked at most every AUTOCOMPLETE_CHECK_SECONDS, and arrays older than
+AUTOCOMPLETE_MAX_AGE are rebuilt regardless, so workers also converge
+when the cache is not shared between them (LocMem).
+"""
+import bisect
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "course-autocomplete:version"
+# upper bound for every key starting with a prefix
+PREFIX_END = "\U0010ffff"
+
+
+class PrefixIndex:
+    """
+    Sorted (key, entry) arrays, one per field in match priority order:
+    course initial, faculty initial, course-name word.
+    """
+
+    def __init__(self, courses):
+        self.entries = []
+        fields = ([], [], [])
+        for course in courses:
+            position = len(self.entries)
+            self.entries.append({
+                "label": f"{course.course_initial} – {course.course_name} (Section {course.section})",
+                "course_initial": course.course_initial,
+                "course_name": course.course_name,
+                "faculty_initial": course.faculty_initial,
+                "section": course.section,
+                "url": course.get_url(),
+            })
+            fields[0].append((course.course_initial.lower(), position))
+            fields[1].append((course.faculty_initial.lower(), position))
+            fields[2].append((course.course_name.lower(), position))
+            fields[2].extend((word, position) for word in set(course.course_name.lower().split()[1:]))
+        self.keys = []
+        self.positions = []
+        for pairs in fields:
+            pairs.sort()
+            self.keys.append([key for key, _ in pairs])
+            self.positions.append([position for _, position in pairs])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, prefix, limit):
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        results, seen = [], set()
+        for keys, positions in zip(self.keys, self.positions):
+            start = bisect.bisect_left(keys, prefix)
+            end = bisect.bisect_left(keys, prefix + PREFIX_END, lo=start)
+            for position in positions[start:end]:
+                if position in seen:
+                    continue
+                seen.add(position)
+                results.append(self.entries[position])
+                if len(results) >= limit:
+                    return results
+        return results
+
+
+_index = None
+_index_version = None
+_built_at = 0.0
+_checked_at = 0.0
+_build_lock = threading.Lock()
+
+
+def current_version():
+    return cache.get(VERSION_KEY, 0)
+
+
+def bump_version():
+    """Make every worker rebuild its index on its next lookup."""
+    cache.add(VERSION_KEY, 0, None)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:  # evicted in between
+        cache.set(VERSION_KEY, 1, None)
+
+
+def build_index():
+    from .models import Course
+
+    courses = Course.objects.select_related("category").only(
+        "course_initial", "course_name", "faculty_initial", "section", "slug", "category__slug"
+    ).order_by("course_initial", "section")
+    return PrefixIndex(courses)
+
+
+def get_index():
+    """This process's index, rebuilt if the shared version moved on or it got too old."""
+    global _index, _index_version, _built_at, _checked_at
+
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < getattr(settings, "AUTOCOMPLETE_CHECK_SECONDS", 1):
+        return _index
+
+    version = current_version()
+    _checked_at = now
+    max_age = getattr(settings, "AUTOCOMPLETE_MAX_AGE", 300)
+    if _index is not None and version == _index_version and now - _built_at < max_age:
+        return _index
+
+    with _build_lock:
+        if _index is None or version != _index_version or now - _built_at >= max_age:
+            started = time.perf_counter()
+            _index = build_index()
+            _index_version, _built_at = version, now
+            logger.info(
+                "Built course autocomplete index (version %s, %d courses) in %.1f ms",
+                version, len(_index), (time.perf_counter() - started) * 1000,
+            )
+    return _index
+
+
+def complete(prefix, limit=None):
+    """Top `limit` courses whose initial, faculty initial or a name word starts with `prefix`."""
+    limit = limit or getattr(settings, "AUTOCOMPLETE_LIMIT", 8)
+    return get_index().search(prefix, limit)
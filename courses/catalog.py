@@ -0,0 +1,145 @@
+"""
+Versioned cache for the course catalog: the category menu, the home
+course grid and the paginated course listings.
+
+Every key embeds a catalog version number kept in the shared cache.
+Saving or deleting a Course or CourseCategory bumps the version (after
+commit), so every cached page is superseded at once without tracking
+which keys exist; the old entries expire after CATALOG_CACHE_TIMEOUT.
+
+Hits and misses are counted per process and added to shared counters
+every CATALOG_CACHE_STATS_FLUSH lookups; stats() reports the hit rate
+(see the catalog_cache_stats command).
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+VERSION_KEY = "catalog:version"
+STATS_KEYS = {"hits": "catalog:stats:hits", "misses": "catalog:stats:misses"}
+
+_counts = {"hits": 0, "misses": 0}
+_counts_lock = threading.Lock()
+
+
+def _incr(key, delta=1):
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:  # evicted in between
+        cache.set(key, delta, None)
+        return delta
+
+
+def current_version():
+    return cache.get(VERSION_KEY, 0)
+
+
+def bump_version():
+    """Supersede every cached catalog entry."""
+    _incr(VERSION_KEY)
+
+
+def _count(outcome):
+    with _counts_lock:
+        _counts[outcome] += 1
+        if sum(_counts.values()) < getattr(settings, "CATALOG_CACHE_STATS_FLUSH", 100):
+            return
+        pending = dict(_counts)
+        _counts.update(hits=0, misses=0)
+    flush_stats(pending)
+
+
+def flush_stats(pending=None):
+    """Add this process's unflushed hit/miss counts to the shared counters."""
+    if pending is None:
+        with _counts_lock:
+            pending = dict(_counts)
+            _counts.update(hits=0, misses=0)
+    for outcome, n in pending.items():
+        if n:
+            _incr(STATS_KEYS[outcome], n)
+
+
+def stats():
+    """Shared hit/miss counts (plus this process's unflushed ones) and the hit rate."""
+    shared = cache.get_many(STATS_KEYS.values())
+    with _counts_lock:
+        hits = shared.get(STATS_KEYS["hits"], 0) + _counts["hits"]
+        misses = shared.get(STATS_KEYS["misses"], 0) + _counts["misses"]
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / lookups if lookups else None,
+        "version": current_version(),
+    }
+
+
+def reset_stats():
+    cache.delete_many(STATS_KEYS.values())
+    with _counts_lock:
+        _counts.update(hits=0, misses=0)
+
+
+def get_or_set(name, produce):
+    """The cached value of `name` for the current catalog version, or produce() it."""
+    key = f"catalog:{current_version()}:{name}"
+    value = cache.get(key)
+    if value is not None:
+        _count("hits")
+        return value
+    _count("misses")
+    value = produce()
+    cache.set(key, value, getattr(settings, "CATALOG_CACHE_TIMEOUT", 3600))
+    return value
+
+
+def menu_categories():
+    from category.models import CourseCategory
+
+    return get_or_set("menu", lambda: list(CourseCategory.objects.only("courseCategory", "slug")))
+
+
+def category_by_slug(slug):
+    """The CourseCategory with `slug`, or None."""
+    from category.models import CourseCategory
+
+    def load():
+        # False marks a missing slug (None reads as a cache miss)
+        return CourseCategory.objects.filter(slug=slug).first() or False
+
+    return get_or_set(f"category:{slug}", load) or None
+
+
+class CachedPaginator(Paginator):
+    """
+    Paginator whose total and pages are cached under `name`:
+
+        CachedPaginator(courses, 9, "courses:all").get_page(request.GET.get("page"))
+
+    A warm page costs no queries. Page objects hold a plain list, so the
+    queryset must already select what the template needs.
+    """
+
+    def __init__(self, object_list, per_page, name, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.name = name
+
+    @cached_property
+    def count(self):
+        return get_or_set(f"{self.name}:count", lambda: Paginator(self.object_list, self.per_page).count)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+        objects = get_or_set(
+            f"{self.name}:{self.per_page}:{number}", lambda: list(self.object_list[bottom:top])
+        )
+        return self._get_page(objects, number, self)
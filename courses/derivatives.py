@@ -0,0 +1,133 @@
+"""
+Fixed-width thumbnails / previews of SectionNote photos for the gallery.
+
+Images hosted on Cloudinary are resized by Cloudinary itself through a URL
+transformation, so nothing is stored. With any other storage, JPEG files
+are generated once by a Celery task (queued by the upload pipeline, or by
+the first render that finds them missing, which serves the original
+meanwhile) under section_derivatives/<width>/ next to the original, and
+their existence is remembered in the cache so later renders do not touch
+the storage.
+"""
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from PIL import Image
+
+from image_enhancer.utils.prep import open_reduced
+
+from .utils import read_stored_image
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_PREFIX = "section_derivatives"
+CLOUDINARY_UPLOAD_SEGMENT = "/image/upload/"
+# a render re-queues missing derivatives at most this often per image
+QUEUE_INTERVAL_SECONDS = 600
+# after a failed publish, stop queueing for a while
+QUEUE_DOWN_KEY = "image-derivative-queue-down"
+QUEUE_DOWN_SECONDS = 60
+
+
+def derivative_sizes():
+    """{name: width in px}, smallest first."""
+    sizes = getattr(settings, "IMAGE_DERIVATIVE_SIZES", {"thumb": 320, "preview": 640})
+    return dict(sorted(sizes.items(), key=lambda item: item[1]))
+
+
+def is_cloudinary_url(url):
+    return "res.cloudinary.com" in url and CLOUDINARY_UPLOAD_SEGMENT in url
+
+
+def cloudinary_derivative_url(url, width):
+    """Same asset, scaled down by Cloudinary to `width` px, format/quality picked per browser."""
+    return url.replace(
+        CLOUDINARY_UPLOAD_SEGMENT, f"{CLOUDINARY_UPLOAD_SEGMENT}c_limit,w_{width},q_auto,f_auto/", 1
+    )
+
+
+def derivative_name(name, width):
+    return f"{DERIVATIVE_PREFIX}/{width}/{os.path.splitext(name)[0]}.jpg"
+
+
+def make_derivatives(field_file, data=None):
+    """
+    Write every configured size of a stored image (local/non-Cloudinary
+    storage). `data` is the original's bytes if already at hand.
+    Returns the stored names.
+    """
+    widths = sorted(derivative_sizes().values(), reverse=True)
+    data = read_stored_image(field_file) if data is None else data
+
+    # decode once, at reduced size, comfortably above the widest derivative
+    img = open_reduced(data, max_side=widths[0] * 2)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    storage = field_file.storage
+    names = []
+    for width in widths:
+        height = max(1, round(img.height * width / img.width))
+        scaled = img.resize((width, height), Image.BICUBIC) if img.width > width else img
+        buf = io.BytesIO()
+        scaled.save(buf, format="JPEG", quality=getattr(settings, "IMAGE_DERIVATIVE_QUALITY", 80),
+                    optimize=True, progressive=True)
+
+        name = derivative_name(field_file.name, width)
+        if storage.exists(name):
+            storage.delete(name)
+        names.append(storage.save(name, ContentFile(buf.getvalue())))
+        cache.set(_exists_key(name), True, None)
+    return names
+
+
+def _exists_key(name):
+    return f"image-derivative:{name}"
+
+
+def _queue_derivatives(field_file):
+    """Have a worker make the missing sizes of a SectionNote photo."""
+    from .tasks import make_note_derivatives_task
+
+    note_id = getattr(field_file.instance, "pk", None)
+    if note_id is None or not getattr(settings, "OCR_USE_CELERY", True) or cache.get(QUEUE_DOWN_KEY):
+        return
+    if not cache.add(f"image-derivative-queued:{field_file.name}", True, QUEUE_INTERVAL_SECONDS):
+        return
+    try:
+        make_note_derivatives_task.delay(note_id)
+    except Exception:
+        # don't make every other photo on the page wait on the broker too
+        cache.set(QUEUE_DOWN_KEY, True, QUEUE_DOWN_SECONDS)
+        logger.warning("Could not queue derivatives of %s", field_file.name, exc_info=True)
+
+
+def derivative_url(field_file, size):
+    """
+    URL of one named size of a stored image. Never renders during the
+    request: while the derivative is missing, the original's URL is
+    returned and generation is queued.
+    """
+    url = field_file.url
+    width = derivative_sizes()[size]
+    if is_cloudinary_url(url):
+        return cloudinary_derivative_url(url, width)
+
+    name = derivative_name(field_file.name, width)
+    if not cache.get(_exists_key(name)):
+        if not field_file.storage.exists(name):
+            _queue_derivatives(field_file)
+            return url
+        cache.set(_exists_key(name), True, None)
+    return field_file.storage.url(name)
+
+
+def derivative_srcset(field_file):
+    """srcset value listing every configured size."""
+    return ", ".join(
+        f"{derivative_url(field_file, size)} {width}w" for size, width in derivative_sizes().items()
+    )
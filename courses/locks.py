@@ -0,0 +1,120 @@
+"""
+Per-lecture generation lock shared by web views and Celery tasks.
+
+Structuring a lecture and rendering / uploading its PDF must not run twice
+at once for the same (course, lecture): that doubles Gemini calls and
+storage uploads, and the last writer wins. Every generation path takes
+this lock first.
+
+The lock is a lease in Redis (settings.LECTURE_LOCK_REDIS_URL, by default
+the Celery broker's, which web and worker processes all reach), taken
+with SET NX PX and released / extended only by its owner's token. A
+holder that dies simply lets the lease expire. With the URL set to ""
+it falls back to the Django cache (cache.add), which is only shared
+between processes if the cache is.
+"""
+import logging
+import time
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def _redis_client(url):
+    import redis
+
+    return redis.Redis.from_url(url)
+
+
+class LectureLock:
+    """
+    Lease lock for one lecture.
+
+        lock = LectureLock(course_id, lecture)
+        if lock.acquire(wait=5):
+            try:
+                ...
+                lock.extend()  # between long stages
+            finally:
+                lock.release()
+    """
+
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, course_id, lecture, lease=None):
+        self.key = f"lecture-generation:{course_id}:{lecture}"
+        self.lease = lease or getattr(settings, "LECTURE_LOCK_LEASE_SECONDS", 900)
+        self.token = uuid.uuid4().hex
+        url = getattr(settings, "LECTURE_LOCK_REDIS_URL", "")
+        self._lock = _redis_client(url).lock(self.key, timeout=self.lease, thread_local=False) if url else None
+        self.held = False
+
+    def __repr__(self):
+        return f"<LectureLock {self.key}>"
+
+    def _try_acquire(self):
+        if self._lock is not None:
+            return self._lock.acquire(blocking=False)
+        return cache.add(self.key, self.token, timeout=self.lease)
+
+    def acquire(self, wait=0):
+        """Take the lock, polling up to `wait` seconds while someone else holds it."""
+        deadline = time.monotonic() + wait
+        while True:
+            if self._try_acquire():
+                self.held = True
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.POLL_INTERVAL)
+
+    def extend(self):
+        """Restart the lease; False if it had already expired (someone may have taken over)."""
+        if not self.held:
+            return False
+        if self._lock is not None:
+            try:
+                self._lock.reacquire()
+                return True
+            except Exception:
+                logger.warning("%r lease lost", self, exc_info=True)
+                return False
+        if cache.get(self.key) != self.token:
+            logger.warning("%r lease lost", self)
+            return False
+        return cache.touch(self.key, self.lease)
+
+    def release(self):
+        if not self.held:
+            return
+        self.held = False
+        if self._lock is not None:
+            try:
+                self._lock.release()
+            except Exception:
+                logger.warning("%r expired before release", self, exc_info=True)
+        elif cache.get(self.key) == self.token:
+            cache.delete(self.key)
+
+    def is_locked(self):
+        """Whether anyone currently holds this lecture's lock."""
+        if self._lock is not None:
+            return self._lock.locked()
+        return cache.get(self.key) is not None
+
+    def __enter__(self):
+        if not self.acquire():
+            raise LectureBusy(self.key)
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class LectureBusy(Exception):
+    """Another worker or request is generating this lecture."""
@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from courses.models import SectionNote
+from courses.tasks import enhance_section_note_task
+from courses.utils import enhance_pages, read_stored_image, save_enhanced_image
+
+
+def _read_or_none(note):
+    try:
+        return read_stored_image(note.image)
+    except Exception:
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate enhanced derivatives for SectionNotes that have none. "
+        "Safe to interrupt: rerun (or pass --after) to continue where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=16)
+        parser.add_argument("--limit", type=int, default=0, help="Stop after this many notes (0 = all)")
+        parser.add_argument("--after", type=int, default=0, help="Only notes with a higher id")
+        parser.add_argument("--queue", action="store_true",
+                            help="Enqueue Celery tasks instead of enhancing in this process")
+
+    def handle(self, *args, **opts):
+        pending = SectionNote.objects.filter(enhanced_image="").only("pk", "image").order_by("pk")
+        last_pk, done, failed = opts["after"], 0, 0
+        limit = opts["limit"]
+
+        while not limit or done + failed < limit:
+            size = opts["batch_size"] if not limit else min(opts["batch_size"], limit - done - failed)
+            batch = list(pending.filter(pk__gt=last_pk)[:size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            if opts["queue"]:
+                for note in batch:
+                    enhance_section_note_task.delay(note.pk)
+                done += len(batch)
+            else:
+                with ThreadPoolExecutor(max_workers=len(batch)) as pool:
+                    originals = list(pool.map(_read_or_none, batch))
+                readable = [(note, data) for note, data in zip(batch, originals) if data is not None]
+                enhanced = enhance_pages([data for _, data in readable])
+                failed += len(batch) - len(readable)
+                for (note, _), result in zip(readable, enhanced):
+                    if result is None:
+                        failed += 1
+                        continue
+                    save_enhanced_image(note, result.getvalue())
+                    done += 1
+
+            self.stdout.write(f"up to note {last_pk}: {done} {'queued' if opts['queue'] else 'enhanced'}, {failed} failed")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Finished: {done} {'queued' if opts['queue'] else 'enhanced'}, {failed} failed"
+            + (f" (resume with --after {last_pk})" if limit and last_pk else "")
+        ))
@@ -0,0 +1,62 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from courses.ai_helpers import OCR_MODEL_NAME, extract_text_from_image, extract_text_from_image_batch
+from courses.providers import FakeProvider
+
+
+def _sample_images(count):
+    images = []
+    for i in range(count):
+        buf = io.BytesIO()
+        Image.new("L", (64 + i, 64), color=i % 256).save(buf, format="PNG")
+        images.append(buf.getvalue())
+    return images
+
+
+class Command(BaseCommand):
+    help = "Compare per-image vs batched OCR requests against a fake model with simulated latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", type=int, default=12)
+        parser.add_argument("--batch-size", type=int, default=4)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--latency", type=float, default=0.5,
+                            help="Simulated fixed cost per request (seconds)")
+        parser.add_argument("--per-image", type=float, default=0.05,
+                            help="Simulated extra cost per attached image (seconds)")
+
+    def handle(self, *args, **opts):
+        images = _sample_images(opts["images"])
+        batch_size = opts["batch_size"]
+
+        def per_image(model):
+            with ThreadPoolExecutor(max_workers=opts["workers"]) as pool:
+                return list(pool.map(lambda d: extract_text_from_image(io.BytesIO(d), model=model), images))
+
+        def batched(model):
+            chunks = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+            with ThreadPoolExecutor(max_workers=opts["workers"]) as pool:
+                results = pool.map(lambda c: extract_text_from_image_batch(c, model=model), chunks)
+                return [text for chunk in results for text in chunk]
+
+        baseline = None
+        for label, run in (("per-image", per_image), (f"batched(k={batch_size})", batched)):
+            provider = FakeProvider(latency=opts["latency"], per_image_latency=opts["per_image"], jitter=0, error_rate=0)
+            model = provider.get_model(OCR_MODEL_NAME)
+            start = time.perf_counter()
+            texts = run(model)
+            elapsed = time.perf_counter() - start
+
+            if baseline is None:
+                baseline = texts
+            elif texts != baseline:
+                self.stderr.write(self.style.ERROR(f"{label}: output differs from per-image run"))
+
+            self.stdout.write(
+                f"{label:<16} images={len(texts):<4} calls={provider.calls:<4} wall={elapsed:.2f}s"
+            )
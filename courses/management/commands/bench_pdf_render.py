@@ -0,0 +1,152 @@
+import random
+import re
+import time
+import tracemalloc
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+from courses.pdf_renderer import render_markdown_pdf
+
+PAGE_RE = re.compile(rb"/Type /Page\b(?!s)")
+
+
+def legacy_create_pdf(md_text: str) -> BytesIO:
+    """The per-line renderer courses.utils used before courses.pdf_renderer."""
+    buffer = BytesIO()
+
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        leftMargin=40,
+        rightMargin=40,
+        topMargin=40,
+        bottomMargin=40,
+    )
+    
+    styles = getSampleStyleSheet()
+    
+    header = ParagraphStyle(
+        name="Header",
+        parent=styles["Heading1"],
+        fontSize=20,
+        spaceAfter=12,
+        spaceBefore=12,
+    )
+    
+    subheader = ParagraphStyle(
+        name="SubHeader",
+        parent=styles["Heading2"],
+        fontSize=16,
+        spaceAfter=10,
+        spaceBefore=10,
+    )
+    
+    body = ParagraphStyle(
+        name="Body",
+        parent=styles["BodyText"],
+        fontSize=12,
+        leading=16,
+    )
+    
+    bullet = ParagraphStyle(
+        name="Bullet",
+        parent=styles["BodyText"],
+        bulletIndent=20,
+        leftIndent=20,
+        spaceAfter=5,
+    )
+    
+    elements = []
+    
+    for line in md_text.split("\n"):
+        line = line.strip()
+    
+        if not line:
+            elements.append(Spacer(1, 10))
+            continue
+    
+        # Headers
+        if line.startswith("# "):
+            elements.append(Paragraph(line[2:], header))
+            continue
+    
+        if line.startswith("### "):
+            elements.append(Paragraph(line[3:], subheader))
+            continue
+    
+        # Bullet points
+        if line.startswith("* "):
+            elements.append(Paragraph("• " + line[2:], bullet))
+            continue
+    
+        # Normal paragraph
+        elements.append(Paragraph(line, body))
+    
+    doc.build(elements)
+    buffer.seek(0)
+    return buffer
+
+
+def sample_markdown(lines, seed=0):
+    """Lecture-like Markdown: headings, paragraphs, bullet lists and code."""
+    rng = random.Random(seed)
+    words = "stack queue graph vertex edge pointer heap sort merge array index cost".split()
+    out = []
+    while len(out) < lines:
+        kind = rng.random()
+        if kind < 0.05:
+            out += [f"## Topic {len(out)}", ""]
+        elif kind < 0.25:
+            out += [f"- {' '.join(rng.choices(words, k=8))}" for _ in range(4)] + [""]
+        elif kind < 0.30:
+            out += ["```", "for (int i = 0; i < n; i++) {", "    sum += a[i];", "}", "```", ""]
+        else:
+            out += [" ".join(rng.choices(words, k=12)) for _ in range(3)] + [""]
+    return "\n".join(out[:lines])
+
+
+def sample_ocr_text(lines, seed=0):
+    """Raw OCR text (and the download view's combined notes): no blank lines at all."""
+    rng = random.Random(seed)
+    words = "stack queue graph vertex edge pointer heap sort merge array index cost".split()
+    return "\n".join(" ".join(rng.choices(words, k=rng.randint(3, 12))) for _ in range(lines))
+
+
+SHAPES = {"markdown": sample_markdown, "ocr": sample_ocr_text}
+
+
+class Command(BaseCommand):
+    help = "Benchmark Markdown → PDF rendering (pages/sec, peak memory) against the legacy per-line renderer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", type=int, nargs="+", default=[1000, 10000])
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--shape", choices=SHAPES, default="markdown")
+
+    def handle(self, *args, **opts):
+        for lines in opts["lines"]:
+            md_text = SHAPES[opts["shape"]](lines)
+            for label, render in (("legacy", legacy_create_pdf), ("renderer", render_markdown_pdf)):
+                render(md_text)  # warm-up (fonts, styles)
+
+                best = None
+                for _ in range(opts["repeat"]):
+                    start = time.perf_counter()
+                    pdf = render(md_text).getvalue()
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+
+                tracemalloc.start()
+                render(md_text)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                pages = len(PAGE_RE.findall(pdf))
+                self.stdout.write(
+                    f"lines={lines:<6} {label:<9} pages={pages:<5} time={best:.3f}s "
+                    f"pages/s={pages / best:8.1f} peak={peak / 1e6:6.1f}MB"
+                )
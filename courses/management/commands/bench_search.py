@@ -0,0 +1,104 @@
+import itertools
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from accounts.models import Account
+from category.models import CourseCategory
+from courses.models import Course, SectionNote
+from courses.search import index_notes, search_entries
+
+
+class Rollback(Exception):
+    pass
+
+
+def word(n):
+    """Distinct pronounceable word for vocabulary index n."""
+    consonants, vowels = "bcdfghklmnprstvz", "aeiou"
+    letters = []
+    while True:
+        n, c = divmod(n, len(consonants))
+        n, v = divmod(n, len(vowels))
+        letters += [consonants[c], vowels[v]]
+        if not n:
+            return "".join(letters)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic OCR notes (Zipf-distributed vocabulary) inside a transaction, "
+        "time full-text searches for rare, medium and common terms, then roll back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--notes", type=int, default=1_000_000)
+        parser.add_argument("--words", type=int, default=60, help="Words per note")
+        parser.add_argument("--vocabulary", type=int, default=20_000)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **opts):
+        try:
+            with transaction.atomic():
+                self.seed(opts)
+                self.bench(opts)
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Seed data rolled back.")
+
+    def seed(self, opts):
+        rng = random.Random(0)
+        vocabulary = [word(n) for n in range(opts["vocabulary"])]
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+
+        category = CourseCategory.objects.create(dep_name="Bench", slug="bench-search")
+        course = Course.objects.create(course_name="Bench", course_initial="BENCH", slug="bench", category=category)
+        user = Account.objects.create(
+            first_name="Bench", last_name="Search", username="bench-search", email="bench-search@example.com"
+        )
+
+        started = time.perf_counter()
+        for offset in range(0, opts["notes"], opts["batch_size"]):
+            count = min(opts["batch_size"], opts["notes"] - offset)
+            notes = SectionNote.objects.bulk_create(
+                SectionNote(
+                    user=user, course=course, lecture=rng.randint(1, 24), image="section_uploads/bench.jpg",
+                    extracted_text=" ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=opts["words"])),
+                )
+                for _ in range(count)
+            )
+            index_notes(notes)
+        self.stdout.write(f"Seeded and indexed {opts['notes']} notes in {time.perf_counter() - started:.1f} s")
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.vocabulary = vocabulary
+
+    def time_query(self, text, repeat, after=None):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            hits, cursor = search_entries(text, after=after)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), max(timings), hits, cursor
+
+    def bench(self, opts):
+        vocabulary = self.vocabulary
+        queries = {
+            "common term": vocabulary[0],
+            "medium term": vocabulary[200],
+            "rare term": vocabulary[-1],
+            "two terms": f"{vocabulary[50]} {vocabulary[900]}",
+            "prefix": vocabulary[300][:3],
+        }
+        self.stdout.write(f"{'query':<14}{'text':<20}{'median':>10}{'max':>10}{'next page':>12}")
+        for label, text in queries.items():
+            median, worst, hits, cursor = self.time_query(text, opts["repeat"])
+            next_page = self.time_query(text, opts["repeat"], after=cursor)[0] if cursor else 0
+            self.stdout.write(
+                f"{label:<14}{text:<20}{median:>8.1f}ms{worst:>8.1f}ms{next_page:>10.1f}ms  ({len(hits)} hits)"
+            )
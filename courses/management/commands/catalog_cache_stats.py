@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from courses import catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Print hits, misses and hit rate of the catalog cache (category menu, home grid, "
+        "course listings) across workers. Workers add their counts every CATALOG_CACHE_STATS_FLUSH lookups."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Zero the shared counters after printing")
+
+    def handle(self, *args, **opts):
+        stats = catalog.stats()
+        rate = "n/a" if stats["hit_rate"] is None else f"{stats['hit_rate']:.1%}"
+        self.stdout.write(
+            f"catalog version {stats['version']}: {stats['hits']} hits, {stats['misses']} misses, hit rate {rate}"
+        )
+        if opts["reset"]:
+            catalog.reset_stats()
+            self.stdout.write("Counters reset.")
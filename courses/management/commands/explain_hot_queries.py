@@ -0,0 +1,96 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import Account
+from category.models import CourseCategory
+from courses.models import Course, LectureFinalNote, SectionNote
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed notes/lectures at scale inside a transaction, print EXPLAIN plans for "
+        "the lecture page, per-user export and due-lecture sweep queries, then roll back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--courses", type=int, default=200)
+        parser.add_argument("--lectures", type=int, default=30, help="Lectures per course")
+        parser.add_argument("--notes", type=int, default=10, help="Notes per lecture")
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument("--analyze", action="store_true",
+                            help="EXPLAIN ANALYZE (PostgreSQL): run the queries and show real timings")
+        parser.add_argument("--keep", action="store_true", help="Commit the seeded rows instead of rolling back")
+
+    def handle(self, *args, **opts):
+        try:
+            with transaction.atomic():
+                course, user = self.seed(opts)
+                self.explain_all(course, user, opts["analyze"])
+                if not opts["keep"]:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write("Seed data rolled back.")
+
+    def seed(self, opts):
+        rng = random.Random(0)
+        now = timezone.now()
+        category = CourseCategory.objects.create(dep_name="Explain", slug="explain-seed")
+        courses = Course.objects.bulk_create(
+            Course(course_name=f"Seed course {i}", course_initial=f"SEED{i}", slug=f"seed-{i}",
+                   faculty_initial="SEED", category=category)
+            for i in range(opts["courses"])
+        )
+        users = Account.objects.bulk_create(
+            Account(first_name="Seed", last_name=str(i), username=f"explain-seed-{i}",
+                    email=f"explain-seed-{i}@example.com")
+            for i in range(opts["users"])
+        )
+
+        notes, finals = [], []
+        for course in courses:
+            for lecture in range(1, opts["lectures"] + 1):
+                finals.append(LectureFinalNote(
+                    course=course, lecture=lecture,
+                    # most lectures are long done; a few are pending
+                    is_generated=rng.random() < 0.95,
+                    next_pdf_time=now + timedelta(hours=rng.randint(-720, 48)),
+                ))
+                for _ in range(opts["notes"]):
+                    notes.append(SectionNote(
+                        user=rng.choice(users), course=course, lecture=lecture,
+                        image="section_uploads/seed.jpg", extracted_text="seed",
+                    ))
+        LectureFinalNote.objects.bulk_create(finals, batch_size=2000)
+        SectionNote.objects.bulk_create(notes, batch_size=2000)
+        self.stdout.write(
+            f"Seeded {len(courses)} courses, {len(finals)} lectures, {len(notes)} notes, {len(users)} users"
+        )
+
+        with connection.cursor() as cursor:
+            # fresh planner statistics, as autovacuum / sqlite_stat1 would have
+            cursor.execute("ANALYZE")
+        return courses[len(courses) // 2], users[0]
+
+    def explain_all(self, course, user, analyze):
+        lecture = 1
+        queries = {
+            "lecture page: notes of one lecture, newest first":
+                SectionNote.objects.filter(course=course, lecture=lecture).order_by("-uploaded_at"),
+            "download_user_images: one user's notes of a lecture":
+                SectionNote.objects.filter(user_id=user.pk, course=course, lecture=lecture),
+            "beat sweep: due, not yet generated lectures":
+                LectureFinalNote.objects.filter(is_generated=False, next_pdf_time__lte=timezone.now()),
+        }
+        options = {"analyze": True} if analyze and connection.vendor == "postgresql" else {}
+        for label, queryset in queries.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(queryset.explain(**options))
+            self.stdout.write("")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_alter_course_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lecturefinalnote',
+            name='pending_batches',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_structuredchunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lecturefinalnote',
+            name='pdf_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='lecturefinalnote',
+            name='pdf_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_lecturefinalnote_pdf_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sectionnote',
+            name='enhanced_image',
+            field=models.ImageField(blank=True, default='', upload_to='section_enhanced/'),
+        ),
+    ]
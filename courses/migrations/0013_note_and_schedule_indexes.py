@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0012_sectionnote_enhanced_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lecturefinalnote',
+            index=models.Index(condition=models.Q(('is_generated', False)), fields=['next_pdf_time'], name='lecturefinal_pending_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sectionnote',
+            index=models.Index(fields=['course', 'lecture', 'uploaded_at'], name='sectionnote_lecture_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sectionnote',
+            index=models.Index(fields=['course', 'lecture', 'user'], name='sectionnote_lecture_user_idx'),
+        ),
+    ]
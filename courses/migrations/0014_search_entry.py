@@ -0,0 +1,112 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Full-text index over SearchEntry(title, body), per backend. Title ranks
+# above body. NB: on SQLite, a later migration that rebuilds the
+# courses_searchentry table drops these triggers and must recreate them.
+POSTGRES_INDEX = [
+    """
+    ALTER TABLE courses_searchentry ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english'::regconfig, coalesce(body, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX courses_searchentry_vector_idx ON courses_searchentry USING GIN (search_vector)",
+]
+POSTGRES_DROP = ["ALTER TABLE courses_searchentry DROP COLUMN search_vector"]
+
+SQLITE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE courses_searchentry_fts USING fts5(
+        title, body,
+        content='courses_searchentry', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER courses_searchentry_fts_insert AFTER INSERT ON courses_searchentry BEGIN
+        INSERT INTO courses_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER courses_searchentry_fts_delete AFTER DELETE ON courses_searchentry BEGIN
+        INSERT INTO courses_searchentry_fts(courses_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER courses_searchentry_fts_update AFTER UPDATE OF title, body ON courses_searchentry BEGIN
+        INSERT INTO courses_searchentry_fts(courses_searchentry_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO courses_searchentry_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    # default ORDER BY rank: title hits count 10x
+    "INSERT INTO courses_searchentry_fts(courses_searchentry_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+]
+SQLITE_DROP = ["DROP TABLE IF EXISTS courses_searchentry_fts"]
+
+# Index what already exists (set-based: fine for millions of notes)
+BACKFILL = [
+    """
+    INSERT INTO courses_searchentry (kind, object_id, course_id, lecture, title, body, updated_at)
+    SELECT 'course', id, id, NULL, course_initial || ' ' || course_name,
+           faculty_name || ' ' || faculty_initial, CURRENT_TIMESTAMP
+    FROM courses_course
+    """,
+    """
+    INSERT INTO courses_searchentry (kind, object_id, course_id, lecture, title, body, updated_at)
+    SELECT 'note', id, course_id, lecture, '', extracted_text, CURRENT_TIMESTAMP
+    FROM courses_sectionnote
+    WHERE extracted_text IS NOT NULL AND extracted_text <> ''
+    """,
+    """
+    INSERT INTO courses_searchentry (kind, object_id, course_id, lecture, title, body, updated_at)
+    SELECT 'lecture', id, course_id, lecture, '', notes, CURRENT_TIMESTAMP
+    FROM courses_lecturefinalnote
+    WHERE notes IS NOT NULL AND notes <> ''
+    """,
+]
+
+
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"postgresql": POSTGRES_INDEX, "sqlite": SQLITE_INDEX}.get(vendor, [])
+    for sql in statements + BACKFILL:
+        schema_editor.execute(sql)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for sql in {"postgresql": POSTGRES_DROP, "sqlite": SQLITE_DROP}.get(vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0013_note_and_schedule_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('course', 'Course'), ('note', 'Note'), ('lecture', 'Lecture notes')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('lecture', models.PositiveIntegerField(blank=True, null=True)),
+                ('title', models.CharField(blank=True, default='', max_length=600)),
+                ('body', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='courses.course')),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
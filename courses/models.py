@@ -34,9 +34,19 @@ class SectionNote(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name="notes")
     lecture = models.PositiveIntegerField()
     image = models.ImageField(upload_to='section_uploads/')
+    # Enhanced (binarized) page, generated in the background after upload
+    enhanced_image = models.ImageField(upload_to='section_enhanced/', blank=True, default="")
     extracted_text = models.TextField(null=True, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # lecture page / structuring: one lecture's notes by upload time
+            models.Index(fields=["course", "lecture", "uploaded_at"], name="sectionnote_lecture_time_idx"),
+            # per-user image export
+            models.Index(fields=["course", "lecture", "user"], name="sectionnote_lecture_user_idx"),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.course.course_name} - Sec {self.course.section}, Lec {self.lecture}"
 
@@ -46,15 +56,94 @@ class LectureFinalNote(models.Model):
     lecture = models.IntegerField()
     notes = models.TextField(blank=True, null=True)
     pdf_file = models.FileField(upload_to="final_pdfs/", null=True, blank=True)
+    # Fingerprint of the SectionNotes pdf_file was rendered from
+    pdf_fingerprint = models.CharField(max_length=64, blank=True, default="")
+    pdf_updated_at = models.DateTimeField(null=True, blank=True)
 
     # When to run PDF generation (next-day at same course.class_time)
     next_pdf_time = models.DateTimeField(null=True, blank=True)
     is_generated = models.BooleanField(default=False)
 
+    # Upload batches whose OCR / structuring is still running in Celery
+    pending_batches = models.PositiveIntegerField(default=0)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('course', 'lecture')
+        indexes = [
+            # due-lecture sweep: only pending rows are ever looked up by time
+            models.Index(
+                fields=["next_pdf_time"],
+                condition=models.Q(is_generated=False),
+                name="lecturefinal_pending_time_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.course.course_name} - L{self.lecture}"
+
+
+class OCRCacheEntry(models.Model):
+    """
+    OCR result for an exact image, keyed by the SHA-256 of its bytes.
+    key_version changes with the OCR prompt/model and the AI provider, so old
+    (or fake) entries stop matching.
+    """
+    digest = models.CharField(max_length=64)
+    key_version = models.CharField(max_length=16)
+    extracted_text = models.TextField()
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('digest', 'key_version')
+
+    def __str__(self):
+        return f"{self.digest[:12]} ({self.key_version})"
+
+
+class StructuredChunk(models.Model):
+    """
+    Structured Markdown for one chunk of lecture OCR text, keyed by a hash of
+    the source text, the structuring prompt/model version and the AI provider.
+    """
+    source_hash = models.CharField(max_length=64, unique=True)
+    markdown = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.source_hash[:12]
+
+
+class SearchEntry(models.Model):
+    """
+    One searchable document: a course's metadata, a note's OCR text or a
+    lecture's structured notes. Kept in step with its source by
+    courses.search; the full-text index itself is backend specific (a
+    generated tsvector column + GIN index on PostgreSQL, an FTS5 table on
+    SQLite), created in migration 0014 and queried with raw SQL.
+    """
+    KIND_COURSE = "course"
+    KIND_NOTE = "note"
+    KIND_LECTURE = "lecture"
+    KIND_CHOICES = [
+        (KIND_COURSE, "Course"),
+        (KIND_NOTE, "Note"),
+        (KIND_LECTURE, "Lecture notes"),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name="+")
+    lecture = models.PositiveIntegerField(null=True, blank=True)
+    # weighted above body when ranking
+    title = models.CharField(max_length=600, blank=True, default="")
+    body = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
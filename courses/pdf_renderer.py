@@ -0,0 +1,198 @@
+"""
+Markdown → PDF rendering for lecture notes.
+
+Styles are built once per process. The Markdown is parsed in a single
+linear pass into block-level flowables: consecutive lines merge into one
+Paragraph, fenced code becomes Preformatted, and list items become a real
+ListFlowable, so even very long notes produce a bounded number of
+flowables.
+
+reportlab splits a flowable across pages by re-laying out its remainder,
+which is quadratic in the flowable's size. Merged paragraphs are therefore
+cut at a line boundary once they reach PARAGRAPH_MAX_CHARS (raw OCR text
+has no blank lines at all), longer lines at a space, and lists every
+LIST_MAX_ITEMS items.
+"""
+import re
+from functools import lru_cache
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.platypus import (
+    HRFlowable,
+    ListFlowable,
+    ListItem,
+    Paragraph,
+    Preformatted,
+    SimpleDocTemplate,
+)
+
+PAGE_OPTIONS = dict(
+    pagesize=A4,
+    leftMargin=40,
+    rightMargin=40,
+    topMargin=40,
+    bottomMargin=40,
+)
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*$")
+BULLET_RE = re.compile(r"^[-*+•]\s+(.*)$")
+ORDERED_RE = re.compile(r"^\d+[.)]\s+(.*)$")
+RULE_RE = re.compile(r"^(-{3,}|\*{3,}|_{3,})$")
+INLINE_CODE_RE = re.compile(r"`([^`]+)`")
+
+PARAGRAPH_MAX_CHARS = 2000
+LIST_MAX_ITEMS = 100
+
+
+@lru_cache(maxsize=None)
+def get_styles():
+    """Paragraph styles shared by every render in this process."""
+    base = getSampleStyleSheet()
+    return {
+        1: ParagraphStyle(name="Header", parent=base["Heading1"], fontSize=20, leading=24,
+                          spaceAfter=12, spaceBefore=12),
+        2: ParagraphStyle(name="SubHeader", parent=base["Heading2"], fontSize=16, leading=20,
+                          spaceAfter=10, spaceBefore=10),
+        3: ParagraphStyle(name="SubSubHeader", parent=base["Heading3"], fontSize=14, leading=18,
+                          spaceAfter=8, spaceBefore=8),
+        "body": ParagraphStyle(name="Body", parent=base["BodyText"], fontSize=12, leading=16,
+                               spaceAfter=8),
+        "bullet": ParagraphStyle(name="Bullet", parent=base["BodyText"], fontSize=12, leading=16),
+        "code": ParagraphStyle(name="Code", parent=base["Code"], fontSize=9, leading=11,
+                               backColor="#f4f4f4", borderPadding=4, spaceBefore=4, spaceAfter=10),
+    }
+
+
+def _inline(text):
+    """Escape reportlab markup and render `inline code`."""
+    return INLINE_CODE_RE.sub(r'<font name="Courier">\1</font>', escape(text))
+
+
+def _line_pieces(line, limit=PARAGRAPH_MAX_CHARS):
+    """`line` in pieces of at most `limit` chars, cut at spaces where there are any."""
+    start = 0
+    while len(line) - start > limit:
+        cut = line.rfind(" ", start, start + limit + 1)
+        if cut <= start:
+            yield line[start:start + limit]
+            start += limit
+        else:
+            yield line[start:cut]
+            start = cut + 1
+    yield line[start:]
+
+
+def markdown_to_flowables(md_text):
+    styles = get_styles()
+    flowables = []
+    para, items, code = [], [], None
+    para_chars = 0
+    list_kind = None  # "bullet" or "1"
+    list_number = 1  # first number of the next ordered ListFlowable
+
+    def flush_para():
+        nonlocal para_chars
+        if para:
+            flowables.append(Paragraph(_inline(" ".join(para)), styles["body"]))
+            para.clear()
+            para_chars = 0
+
+    def emit_items():
+        nonlocal list_number
+        if items:
+            flowables.append(ListFlowable(
+                [ListItem(Paragraph(_inline(" ".join(item)), styles["bullet"])) for item in items],
+                bulletType=list_kind,
+                start="•" if list_kind == "bullet" else list_number,
+                leftIndent=20,
+                spaceAfter=8,
+            ))
+            list_number += len(items)
+            items.clear()
+
+    def flush_list():
+        nonlocal list_kind, list_number
+        emit_items()
+        list_kind = None
+        list_number = 1
+
+    for line in md_text.splitlines():
+        stripped = line.strip()
+
+        if code is not None:
+            if stripped.startswith("```"):
+                flowables.append(Preformatted("\n".join(code), styles["code"]))
+                code = None
+            else:
+                code.append(line.rstrip())
+            continue
+
+        if stripped.startswith("```"):
+            flush_para()
+            flush_list()
+            code = []
+            continue
+
+        if not stripped:
+            flush_para()
+            flush_list()
+            continue
+
+        heading = HEADING_RE.match(stripped)
+        if heading:
+            flush_para()
+            flush_list()
+            level = min(len(heading.group(1)), 3)
+            flowables.append(Paragraph(_inline(heading.group(2)), styles[level]))
+            continue
+
+        if RULE_RE.match(stripped):
+            flush_para()
+            flush_list()
+            flowables.append(HRFlowable(width="100%", color="#999999", spaceBefore=4, spaceAfter=8))
+            continue
+
+        bullet = BULLET_RE.match(stripped)
+        ordered = None if bullet else ORDERED_RE.match(stripped)
+        if bullet or ordered:
+            kind = "bullet" if bullet else "1"
+            flush_para()
+            if list_kind != kind:
+                flush_list()
+                list_kind = kind
+            elif len(items) >= LIST_MAX_ITEMS:
+                emit_items()  # same list, numbering continues
+            items.append([(bullet or ordered).group(1)])
+            continue
+
+        if items and line[:1].isspace():
+            # indented continuation of the previous list item
+            items[-1].append(stripped)
+            continue
+
+        flush_list()
+        for piece in _line_pieces(stripped):
+            if para_chars + len(piece) > PARAGRAPH_MAX_CHARS:
+                flush_para()
+            para.append(piece)
+            para_chars += len(piece) + 1
+
+    if code is not None:
+        flowables.append(Preformatted("\n".join(code), styles["code"]))
+    flush_para()
+    flush_list()
+    return flowables
+
+
+def render_markdown_pdf(md_text: str) -> BytesIO:
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, **PAGE_OPTIONS)
+    flowables = markdown_to_flowables(md_text or "")
+    if not flowables:
+        flowables = [Paragraph("(No text available)", get_styles()["body"])]
+    doc.build(flowables)
+    buffer.seek(0)
+    return buffer
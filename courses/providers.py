@@ -0,0 +1,162 @@
+"""
+AI backends used by courses.ai_helpers.
+
+A provider hands out model objects exposing generate_content(contents),
+where contents is a prompt string or a list of strings and images (PIL
+images or {"mime_type", "data"} blobs), and the result has a .text
+attribute. settings.AI_PROVIDER picks the backend:
+"gemini" (default), "fake", or a dotted path to a provider class.
+"""
+import hashlib
+import io
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from PIL import Image
+
+
+class TransientAIError(Exception):
+    """Retryable backend failure (the fake's stand-in for a 429/503)."""
+    code = 503
+
+
+# -----------------------------
+# GEMINI
+# -----------------------------
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self):
+        import google.generativeai as genai
+
+        genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+        self._genai = genai
+
+    def get_model(self, model_name):
+        return self._genai.GenerativeModel(model_name)
+
+
+# -----------------------------
+# LOCAL FAKE (load testing, no network / quota)
+# -----------------------------
+FAKE_WORDS = (
+    "lecture note algorithm array pointer graph tree node edge queue stack "
+    "memory process thread cache index query matrix vector proof lemma theorem "
+    "example definition input output function loop recursion complexity"
+).split()
+
+
+def _fake_page_text(image):
+    """Deterministic pseudo-OCR text derived from the image pixels."""
+    digest = hashlib.sha256(image.tobytes()).hexdigest()
+    rng = random.Random(digest)
+    lines = [f"Page {digest[:12]}"]
+    for _ in range(rng.randint(4, 12)):
+        lines.append(" ".join(rng.choice(FAKE_WORDS) for _ in range(rng.randint(4, 10))))
+    return "\n".join(lines)
+
+
+def _as_image(part):
+    if isinstance(part, dict):
+        return Image.open(io.BytesIO(part["data"]))
+    return part
+
+
+def _fake_markdown(text):
+    """Deterministic 'structured' Markdown for a text-only request."""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    body = [line.strip() for line in text.splitlines() if line.strip()]
+    return f"# Notes {digest[:8]}\n\n" + "\n".join(f"- {line}" for line in body)
+
+
+class FakeModel:
+    def __init__(self, provider, model_name):
+        self.provider = provider
+        self.model_name = model_name
+
+    def generate_content(self, contents):
+        parts = contents if isinstance(contents, (list, tuple)) else [contents]
+        images = [_as_image(p) for p in parts if isinstance(p, (Image.Image, dict))]
+        texts = [p for p in parts if isinstance(p, str)]
+
+        self.provider.simulate_call(len(images))
+
+        if len(images) > 1:
+            text = "\n".join(
+                f"=== PAGE {n} ===\n{_fake_page_text(img)}" for n, img in enumerate(images, start=1)
+            )
+        elif images:
+            text = _fake_page_text(images[0])
+        else:
+            text = _fake_markdown(texts[-1] if texts else "")
+
+        tokens = sum(len(t) // 4 + 1 for t in texts) + 258 * len(images) + len(text) // 4
+        return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(total_token_count=tokens))
+
+
+class FakeProvider:
+    """
+    Answers like Gemini, deterministically from the input, after sleeping
+    `latency` (+/- `jitter`) plus `per_image_latency` per attached image.
+    A fraction `error_rate` of calls raise TransientAIError.
+    """
+    name = "fake"
+
+    def __init__(self, latency=None, jitter=None, per_image_latency=None, error_rate=None, seed=None):
+        opts = getattr(settings, "AI_FAKE_OPTIONS", {})
+        self.latency = opts.get("latency", 0.0) if latency is None else latency
+        self.jitter = opts.get("jitter", 0.0) if jitter is None else jitter
+        self.per_image_latency = opts.get("per_image_latency", 0.0) if per_image_latency is None else per_image_latency
+        self.error_rate = opts.get("error_rate", 0.0) if error_rate is None else error_rate
+        self._rng = random.Random(opts.get("seed") if seed is None else seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def simulate_call(self, image_count):
+        with self._lock:
+            self.calls += 1
+            jitter = self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        delay = max(0.0, self.latency + jitter + self.per_image_latency * image_count)
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise TransientAIError("fake provider injected error")
+
+    def get_model(self, model_name):
+        return FakeModel(self, model_name)
+
+
+PROVIDERS = {
+    "gemini": GeminiProvider,
+    "fake": FakeProvider,
+}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    """The configured provider, built once per process."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            name = getattr(settings, "AI_PROVIDER", "gemini")
+            cls = PROVIDERS.get(name) or import_string(name)
+            _provider = cls()
+    return _provider
+
+
+def reset_provider():
+    """Drop the cached provider (after changing settings.AI_PROVIDER in tests/benchmarks)."""
+    global _provider
+    with _provider_lock:
+        _provider = None
@@ -0,0 +1,323 @@
+"""
+Full-text search over courses, OCR'd notes and structured lecture notes.
+
+Every searchable object has a SearchEntry row (title + body), upserted
+when the object is saved (signals, plus explicit calls where the pipeline
+writes text with queryset.update()). The index itself lives in the
+database and follows the rows on its own:
+
+- PostgreSQL: generated, weighted tsvector column with a GIN index,
+  ranked with ts_rank_cd, snippets from ts_headline.
+- SQLite: external-content FTS5 table kept in sync by triggers, ranked
+  with bm25, snippets from snippet().
+- Anything else: unranked icontains matching, newest first.
+
+Results are paged by keyset on (rank, id): the next page continues after
+the last hit instead of counting past an OFFSET.
+"""
+import base64
+import re
+from functools import reduce
+from operator import and_
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Course, LectureFinalNote, SearchEntry, SectionNote
+
+PG_CONFIG = "english"  # must match the generated column (migration 0014)
+TERM_RE = re.compile(r"\w+")
+MAX_TERMS = 8
+# snippet highlight markers, swapped for <mark> after HTML-escaping
+HIT_START, HIT_END = "\x02", "\x03"
+
+INDEX_FIELDS = ["course", "lecture", "title", "body"]
+
+
+# -----------------------------
+# Indexing
+# -----------------------------
+def _upsert(entries):
+    if not entries:
+        return
+    SearchEntry.objects.bulk_create(
+        entries,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=["kind", "object_id"],
+        update_fields=INDEX_FIELDS + ["updated_at"],
+    )
+
+
+def _remove(kind, ids):
+    SearchEntry.objects.filter(kind=kind, object_id__in=ids).delete()
+
+
+COURSE_FIELDS = {"course_initial", "course_name", "faculty_name", "faculty_initial"}
+
+
+def index_courses(courses):
+    _upsert([
+        SearchEntry(
+            kind=SearchEntry.KIND_COURSE, object_id=course.pk, course_id=course.pk,
+            title=f"{course.course_initial} {course.course_name}",
+            body=f"{course.faculty_name} {course.faculty_initial}",
+        )
+        for course in courses
+    ])
+
+
+def index_notes(notes):
+    """(Re)index SectionNotes; notes without text are dropped from the index."""
+    _upsert([
+        SearchEntry(
+            kind=SearchEntry.KIND_NOTE, object_id=note.pk, course_id=note.course_id,
+            lecture=note.lecture, body=note.extracted_text,
+        )
+        for note in notes if note.extracted_text
+    ])
+    empty = [note.pk for note in notes if not note.extracted_text]
+    if empty:
+        _remove(SearchEntry.KIND_NOTE, empty)
+
+
+def index_lectures(lectures):
+    """(Re)index LectureFinalNotes; lectures without notes are dropped from the index."""
+    _upsert([
+        SearchEntry(
+            kind=SearchEntry.KIND_LECTURE, object_id=lecture.pk, course_id=lecture.course_id,
+            lecture=lecture.lecture, body=lecture.notes,
+        )
+        for lecture in lectures if lecture.notes
+    ])
+    empty = [lecture.pk for lecture in lectures if not lecture.notes]
+    if empty:
+        _remove(SearchEntry.KIND_LECTURE, empty)
+
+
+def reindex_notes(note_ids):
+    """For text written with queryset.update(), which sends no signals."""
+    index_notes(SectionNote.objects.filter(pk__in=note_ids).only("pk", "course_id", "lecture", "extracted_text"))
+
+
+def reindex_lectures(lecture_ids):
+    index_lectures(LectureFinalNote.objects.filter(pk__in=lecture_ids).only("pk", "course_id", "lecture", "notes"))
+
+
+def unindex(kind, object_id):
+    _remove(kind, [object_id])
+
+
+# -----------------------------
+# Querying
+# -----------------------------
+# Matches are ranked when the query is selective. Ranking reads every
+# match (and FTS5's bm25 rescans a term's whole doclist for its IDF), so a
+# query matching more than SEARCH_RANK_WINDOW entries lists them newest
+# first instead, which both indexes serve by walking matches in id order.
+RANKED, NEWEST = "ranked", "newest"
+
+
+def query_terms(text):
+    """Word terms of a user query; punctuation and query syntax are dropped."""
+    return TERM_RE.findall(text.lower())[:MAX_TERMS]
+
+
+def encode_cursor(mode, rank, entry_id):
+    return base64.urlsafe_b64encode(f"{mode}:{rank!r}:{entry_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(mode, rank, id) from encode_cursor(), or None if missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        mode, rank, entry_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":")
+        if mode not in (RANKED, NEWEST):
+            return None
+        return mode, float(rank), int(entry_id)
+    except ValueError:
+        return None
+
+
+def _in_kinds(kinds, column):
+    """SQL condition (and params) limiting hits to `kinds`; none for all kinds."""
+    if not kinds:
+        return "", []
+    return f"AND {column} IN ({', '.join(['%s'] * len(kinds))})", list(kinds)
+
+
+def _highlight(snippet):
+    return mark_safe(escape(snippet or "").replace(HIT_START, "<mark>").replace(HIT_END, "</mark>"))
+
+
+class PostgresSearch:
+    # every term must match; each one as a prefix ("cse" finds "cse221")
+    @staticmethod
+    def match(terms):
+        return " & ".join(f"{term}:*" for term in terms)
+
+    @classmethod
+    def count_sql(cls, terms, kinds, cap):
+        in_kinds, kind_params = _in_kinds(kinds, "kind")
+        sql = f"""
+            SELECT count(*) FROM (
+                SELECT 1 FROM courses_searchentry
+                WHERE search_vector @@ to_tsquery(%s::regconfig, %s) {in_kinds} LIMIT %s
+            ) capped
+        """
+        return sql, [PG_CONFIG, cls.match(terms), *kind_params, cap]
+
+    @classmethod
+    def hits_sql(cls, terms, kinds, mode, after, limit):
+        headline_options = f"StartSel={HIT_START}, StopSel={HIT_END}, MaxWords=30, MinWords=10, MaxFragments=2"
+        in_kinds, kind_params = _in_kinds(kinds, "e.kind")
+        params = [PG_CONFIG, headline_options, PG_CONFIG, cls.match(terms), *kind_params]
+        if mode == RANKED:
+            rank, order = "ts_rank_cd(e.search_vector, q)", "rank DESC, e.id"
+            # higher rank first, ties by id
+            keyset = f"AND ({rank} < %s OR ({rank} = %s AND e.id > %s))" if after else ""
+            params += [after[1], after[1], after[2]] if after else []
+        else:
+            rank, order = "0", "e.id DESC"
+            keyset = "AND e.id < %s" if after else ""
+            params += [after[2]] if after else []
+        params.append(limit)
+        # headlines only for the page of hits, not for every match
+        sql = f"""
+            SELECT hit.id, hit.kind, hit.object_id, hit.course_id, hit.lecture, hit.title, hit.rank,
+                   ts_headline(%s::regconfig, CASE WHEN hit.body <> '' THEN hit.body ELSE hit.title END, hit.q, %s)
+            FROM (
+                SELECT e.id, e.kind, e.object_id, e.course_id, e.lecture, e.title, e.body, q, {rank} AS rank
+                FROM courses_searchentry e, to_tsquery(%s::regconfig, %s) q
+                WHERE e.search_vector @@ q {in_kinds} {keyset}
+                ORDER BY {order}
+                LIMIT %s
+            ) hit
+            ORDER BY {order.replace("e.", "hit.")}
+        """
+        return sql, params
+
+
+class SqliteSearch:
+    @staticmethod
+    def match(terms):
+        return " AND ".join(f'"{term}"*' for term in terms)
+
+    @classmethod
+    def count_sql(cls, terms, kinds, cap):
+        in_kinds, kind_params = _in_kinds(kinds, "e.kind")
+        join = "JOIN courses_searchentry e ON e.id = f.rowid" if kinds else ""
+        sql = f"""
+            SELECT count(*) FROM (
+                SELECT 1 FROM courses_searchentry_fts f {join}
+                WHERE courses_searchentry_fts MATCH %s {in_kinds} LIMIT %s
+            )
+        """
+        return sql, [cls.match(terms), *kind_params, cap]
+
+    @classmethod
+    def hits_sql(cls, terms, kinds, mode, after, limit):
+        in_kinds, kind_params = _in_kinds(kinds, "e.kind")
+        params = [HIT_START, HIT_END, cls.match(terms), *kind_params]
+        if mode == RANKED:
+            rank, order = "f.rank", "f.rank, e.id"
+            # bm25: lower is better, ties by id
+            keyset = "AND (f.rank > %s OR (f.rank = %s AND e.id > %s))" if after else ""
+            params += [after[1], after[1], after[2]] if after else []
+        else:
+            rank, order = "0", "f.rowid DESC"
+            keyset = "AND f.rowid < %s" if after else ""
+            params += [after[2]] if after else []
+        params.append(limit)
+        sql = f"""
+            SELECT e.id, e.kind, e.object_id, e.course_id, e.lecture, e.title, {rank},
+                   snippet(courses_searchentry_fts, -1, %s, %s, '…', 16)
+            FROM courses_searchentry_fts f
+            JOIN courses_searchentry e ON e.id = f.rowid
+            WHERE courses_searchentry_fts MATCH %s {in_kinds} {keyset}
+            ORDER BY {order}
+            LIMIT %s
+        """
+        return sql, params
+
+
+BACKENDS = {"postgresql": PostgresSearch, "sqlite": SqliteSearch}
+SNIPPET_CHARS = 160
+
+
+def _plain_snippet(text, terms):
+    """About SNIPPET_CHARS of `text` around the first term, terms marked."""
+    pattern = re.compile("(" + "|".join(map(re.escape, terms)) + ")", re.IGNORECASE)
+    found = pattern.search(text)
+    start = max(0, found.start() - SNIPPET_CHARS // 4) if found else 0
+    snippet = pattern.sub(f"{HIT_START}\\1{HIT_END}", text[start:start + SNIPPET_CHARS])
+    return ("…" if start else "") + snippet + ("…" if start + SNIPPET_CHARS < len(text) else "")
+
+
+def _icontains_hits(terms, kinds, after, limit):
+    """
+    Rows shaped like the backends' hits_sql() for databases without a
+    full-text index: every term as a substring of title or body, newest first.
+    """
+    entries = SearchEntry.objects.filter(
+        reduce(and_, (Q(title__icontains=term) | Q(body__icontains=term) for term in terms))
+    )
+    if kinds:
+        entries = entries.filter(kind__in=kinds)
+    if after:
+        entries = entries.filter(id__lt=after[2])
+    return [
+        (entry.id, entry.kind, entry.object_id, entry.course_id, entry.lecture, entry.title, 0,
+         _plain_snippet(entry.body or entry.title, terms))
+        for entry in entries.order_by("-id")[:limit]
+    ]
+
+
+def _fetch(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def search_entries(text, after=None, limit=None, kinds=None):
+    """
+    Hits for a user query, best first (or newest first for very common terms).
+    kinds: SearchEntry kinds to search, all when None.
+    returns: (hits, next_cursor). Each hit is a dict with kind, object_id,
+    course (with category), lecture, title, snippet (safe HTML) and rank;
+    next_cursor (for `after=`) is None on the last page.
+    """
+    terms = query_terms(text)
+    if not terms:
+        return [], None
+    backend = BACKENDS.get(connection.vendor)
+    limit = limit or getattr(settings, "SEARCH_PAGE_SIZE", 20)
+
+    after = decode_cursor(after)
+    if backend is None:
+        mode = NEWEST
+        rows = _icontains_hits(terms, kinds, after, limit + 1)
+    else:
+        if after:
+            mode = after[0]
+        else:
+            window = getattr(settings, "SEARCH_RANK_WINDOW", 5000)
+            common = window and _fetch(*backend.count_sql(terms, kinds, window + 1))[0][0] > window
+            mode = NEWEST if common else RANKED
+        rows = _fetch(*backend.hits_sql(terms, kinds, mode, after, limit + 1))
+    more = len(rows) > limit
+    rows = rows[:limit]
+    courses = Course.objects.select_related("category").in_bulk({row[3] for row in rows})
+    hits = [
+        {
+            "id": entry_id, "kind": kind, "object_id": object_id, "course": courses.get(course_id),
+            "lecture": lecture, "title": title, "rank": rank, "snippet": _highlight(snippet),
+        }
+        for entry_id, kind, object_id, course_id, lecture, title, rank, snippet in rows
+    ]
+    next_cursor = encode_cursor(mode, rows[-1][6], rows[-1][0]) if more else None
+    return [hit for hit in hits if hit["course"] is not None], next_cursor
@@ -1,58 +1,158 @@
-from django.db.models.signals import post_save, pre_save
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 from datetime import datetime, timedelta
-from .models import LectureFinalNote, Course
+from category.models import CourseCategory
+
+from . import autocomplete, catalog, search
+from .models import LectureFinalNote, Course, SearchEntry, SectionNote
+from .tasks import schedule_lecture_pdf, schedule_lecture_pdfs
+
+
+def next_pdf_time_for(created_at, class_time):
+    """Next day (after created_at) at the course's class time, or None without one."""
+    if not class_time:
+        return None
+    next_day = (created_at + timedelta(minutes=10)).date()   # testing: 10 mins
+    dt_naive = datetime.combine(next_day, class_time)
+    return timezone.make_aware(dt_naive, timezone.get_current_timezone())
 
 
 # ---------------------------------------------------------
-#  When a LectureFinalNote is created → schedule PDF time
+#  New LectureFinalNote → schedule PDF time before the INSERT
 # ---------------------------------------------------------
-@receiver(post_save, sender=LectureFinalNote)
-def set_next_pdf_time_on_create(sender, instance, created, **kwargs):
-    if created and not instance.next_pdf_time:
-        course = instance.course
-        now = timezone.now()
+@receiver(pre_save, sender=LectureFinalNote)
+def set_next_pdf_time_on_create(sender, instance, **kwargs):
+    if not instance._state.adding or instance.next_pdf_time:
+        return
+    now = timezone.now()
 
-        # If course has class_time → schedule next day same class time
-        if course.class_time:
-            next_day = (instance.created_at + timedelta(minutes=10)).date()   # testing: 10 mins
-            dt_naive = datetime.combine(next_day, course.class_time)
-            aware = timezone.make_aware(dt_naive, timezone.get_current_timezone())
-            instance.next_pdf_time = aware
+    # If course has class_time → schedule next day same class time
+    # No class time → simply wait 10 minutes
+    instance.next_pdf_time = (
+        next_pdf_time_for(now, instance.course.class_time) or now + timedelta(minutes=10)
+    )
 
-        else:
-            # No class time → simply wait 10 minutes
-            instance.next_pdf_time = now + timedelta(minutes=10)
 
-        instance.save()
+@receiver(post_save, sender=LectureFinalNote)
+def schedule_new_lecture(sender, instance, created, **kwargs):
+    if created:
+        schedule_lecture_pdf(instance)
 
 
 # ---------------------------------------------------------
 # When Course.class_time changes → update pending lectures
 # ---------------------------------------------------------
-@receiver(pre_save, sender=Course)
-def update_lectures_when_course_time_changes(sender, instance, **kwargs):
-    if not instance.pk:
-        return
+@receiver(post_init, sender=Course)
+def remember_class_time(sender, instance, **kwargs):
+    # the value loaded from the DB, so a later save can tell if it changed
+    # (skipped when deferred: reading it would cost a query per instance)
+    if "class_time" in instance.__dict__:
+        instance._loaded_class_time = instance.class_time
+
 
-    try:
-        old = Course.objects.get(pk=instance.pk)
-    except Course.DoesNotExist:
+@receiver(post_save, sender=Course)
+def update_lectures_when_course_time_changes(sender, instance, created, update_fields=None, **kwargs):
+    # saves of instances loaded with class_time deferred name only the loaded fields
+    if update_fields is not None and "class_time" not in update_fields:
         return
 
+    old_class_time = getattr(instance, "_loaded_class_time", None)
+    instance._loaded_class_time = instance.class_time
+
     # Only update if class time changed
-    if old.class_time != instance.class_time:
-        pending = LectureFinalNote.objects.filter(course=instance, is_generated=False)
-
-        for lec in pending:
-            if lec.created_at:
-                nd = (lec.created_at + timedelta(minutes=10)).date()  # testing: 10 mins
-                dt_naive = (
-                    datetime.combine(nd, instance.class_time)
-                    if instance.class_time else None
-                )
-                if dt_naive:
-                    aware = timezone.make_aware(dt_naive, timezone.get_current_timezone())
-                    lec.next_pdf_time = aware
-                    lec.save()
+    if created or not instance.class_time or old_class_time == instance.class_time:
+        return
+    reschedule_pending_lectures(instance)
+
+
+def reschedule_pending_lectures(course):
+    """
+    Recompute next_pdf_time for every pending lecture of `course` in one
+    SELECT (pk, created_at) and one UPDATE ... CASE. Lectures created on
+    the same day share a time, so the CASE has one branch per day.
+    """
+    pending = LectureFinalNote.objects.filter(course=course, is_generated=False)
+
+    by_time = defaultdict(list)
+    for pk, created_at in pending.values_list("pk", "created_at"):
+        if created_at:
+            by_time[next_pdf_time_for(created_at, course.class_time)].append(pk)
+    if not by_time:
+        return 0
+
+    pending.update(
+        next_pdf_time=Case(
+            *[When(pk__in=pks, then=Value(when)) for when, pks in by_time.items()],
+            default=F("next_pdf_time"),
+            output_field=DateTimeField(),
+        )
+    )
+    schedule_lecture_pdfs((pk, when) for when, pks in by_time.items() for pk in pks)
+    return sum(len(pks) for pks in by_time.values())
+
+
+# ---------------------------------------------------------
+#  Search index follows saved text (after commit, like the
+#  other follow-up work). Text written with .update() is
+#  reindexed by the code that writes it.
+# ---------------------------------------------------------
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not search.COURSE_FIELDS & set(update_fields):
+        return
+    transaction.on_commit(lambda: search.index_courses([instance]))
+
+
+@receiver(post_save, sender=SectionNote)
+def index_note(sender, instance, created, **kwargs):
+    # new uploads have no text until OCR runs
+    if created and not instance.extracted_text:
+        return
+    transaction.on_commit(lambda: search.index_notes([instance]))
+
+
+@receiver(post_save, sender=LectureFinalNote)
+def index_lecture(sender, instance, created, update_fields=None, **kwargs):
+    if created and not instance.notes:
+        return
+    if update_fields is not None and "notes" not in update_fields:
+        return
+    transaction.on_commit(lambda: search.index_lectures([instance]))
+
+
+@receiver(post_delete, sender=SectionNote)
+@receiver(post_delete, sender=LectureFinalNote)
+def unindex_deleted(sender, instance, origin=None, **kwargs):
+    # deleting a course removes its entries through SearchEntry.course
+    if isinstance(origin, Course):
+        return
+    kind = SearchEntry.KIND_NOTE if sender is SectionNote else SearchEntry.KIND_LECTURE
+    search.unindex(kind, instance.pk)
+
+
+# ---------------------------------------------------------
+#  Autocomplete: workers rebuild their prefix index when
+#  courses (or the category slugs in their URLs) change
+# ---------------------------------------------------------
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=CourseCategory)
+@receiver(post_delete, sender=CourseCategory)
+def refresh_autocomplete(sender, **kwargs):
+    transaction.on_commit(autocomplete.bump_version)
+
+
+# ---------------------------------------------------------
+#  Catalog cache: menu, home grid and course listings are
+#  superseded by bumping the catalog version
+# ---------------------------------------------------------
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=CourseCategory)
+@receiver(post_delete, sender=CourseCategory)
+def refresh_catalog_cache(sender, **kwargs):
+    transaction.on_commit(catalog.bump_version)
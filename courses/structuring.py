@@ -0,0 +1,272 @@
+"""
+Incremental, map-reduce structuring of lecture notes.
+
+A lecture's SectionNotes (oldest first) are grouped into fixed-size chunks
+of settings.STRUCTURE_CHUNK_NOTES notes; a chunk over the prompt budget is
+split further into overlapping token windows. Windows are structured in
+parallel (map) and each result is stored in StructuredChunk under a hash of
+its source text, so regenerating a lecture only sends new or changed
+windows to the model. The reduce step stitches the results and drops the
+headings and sections repeated across window boundaries.
+"""
+import hashlib
+import logging
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import IntegrityError, connection
+
+from .ai_helpers import STRUCTURE_KEY_VERSION, estimate_tokens, provider_key_version, structure_text
+from .models import SectionNote, StructuredChunk
+
+logger = logging.getLogger(__name__)
+
+MISSING_TEXT = "(No extracted text)"
+
+
+@contextmanager
+def _stage(timings, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def chunk_source_texts(notes, chunk_size=None):
+    """Group note texts into chunk sources; positions are stable as notes are appended."""
+    chunk_size = max(1, chunk_size or getattr(settings, "STRUCTURE_CHUNK_NOTES", 4))
+    texts = [note.extracted_text or MISSING_TEXT for note in notes]
+    return ["\n\n".join(texts[i:i + chunk_size]) for i in range(0, len(texts), chunk_size)]
+
+
+def split_into_windows(text, window_tokens=None, overlap_tokens=None):
+    """
+    Split text on line boundaries into windows of at most `window_tokens`
+    (estimated) tokens, each starting with the last ~`overlap_tokens` of the
+    previous one. Text within budget comes back as a single window.
+    """
+    window_tokens = window_tokens or getattr(settings, "STRUCTURE_WINDOW_TOKENS", 6000)
+    if overlap_tokens is None:
+        overlap_tokens = getattr(settings, "STRUCTURE_WINDOW_OVERLAP_TOKENS", 200)
+    overlap_tokens = min(overlap_tokens, window_tokens // 2)
+
+    if estimate_tokens(text) <= window_tokens:
+        return [text]
+
+    # a single line longer than the window is hard-split by characters
+    max_chars = window_tokens * 4
+    lines = []
+    for line in text.split("\n"):
+        while len(line) > max_chars:
+            lines.append(line[:max_chars])
+            line = line[max_chars:]
+        lines.append(line)
+    costs = [estimate_tokens(line) for line in lines]
+
+    windows = []
+    start = 0
+    while start < len(lines):
+        end, used = start, 0
+        while end < len(lines) and (end == start or used + costs[end] <= window_tokens):
+            used += costs[end]
+            end += 1
+        windows.append("\n".join(lines[start:end]))
+        if end >= len(lines):
+            break
+
+        # step back into the window for the overlap, but always make progress
+        next_start, carried = end, 0
+        while next_start - 1 > start and carried + costs[next_start - 1] <= overlap_tokens:
+            next_start -= 1
+            carried += costs[next_start]
+        start = next_start
+    return windows
+
+
+def chunk_hash(source, key_version=None):
+    key_version = key_version or provider_key_version(STRUCTURE_KEY_VERSION)
+    return hashlib.sha256(f"{key_version}\n{source}".encode("utf-8")).hexdigest()
+
+
+def _structure_chunk(source):
+    """Returns (markdown, ok); on failure the raw source stands in and is not stored."""
+    try:
+        return structure_text(source), True
+    except Exception:
+        logger.exception("Structuring failed for a %d-char chunk", len(source))
+        return source, False
+    finally:
+        connection.close()
+
+
+def structure_chunks(sources, max_workers=None, timings=None, failed=None):
+    """
+    Structured Markdown for each chunk source, in order, reusing stored chunks.
+    Only chunks whose hash is not in StructuredChunk reach the model; those
+    run in parallel, at most settings.STRUCTURE_MAX_CONCURRENCY at a time.
+    A chunk the model fails on stands in as its raw source and is appended
+    to `failed` (a list), if given.
+    """
+    timings = {} if timings is None else timings
+
+    with _stage(timings, "lookup"):
+        key_version = provider_key_version(STRUCTURE_KEY_VERSION)
+        hashes = [chunk_hash(source, key_version) for source in sources]
+        stored = dict(
+            StructuredChunk.objects.filter(source_hash__in=set(hashes)).values_list("source_hash", "markdown")
+        )
+
+    missing = {}
+    for source, digest in zip(sources, hashes):
+        if digest not in stored:
+            missing.setdefault(digest, source)
+
+    with _stage(timings, "map"):
+        if missing:
+            limit = max_workers or getattr(settings, "STRUCTURE_MAX_CONCURRENCY", 4)
+            with ThreadPoolExecutor(max_workers=max(1, min(limit, len(missing)))) as pool:
+                results = pool.map(_structure_chunk, missing.values())
+                for digest, (markdown, ok) in zip(list(missing), results):
+                    stored[digest] = markdown
+                    if not ok:
+                        if failed is not None:
+                            failed.append(missing[digest])
+                        continue
+                    try:
+                        StructuredChunk.objects.create(source_hash=digest, markdown=markdown)
+                    except IntegrityError:
+                        # structured concurrently by another worker
+                        pass
+
+    logger.info("Structured %d/%d chunks (%d reused)", len(missing), len(sources), len(sources) - len(missing))
+    return [stored[digest] for digest in hashes]
+
+
+# -----------------------------
+# REDUCE: stitch window outputs, drop overlap duplicates
+# -----------------------------
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _split_blocks(markdown):
+    """Blank-line separated blocks; heading lines stand alone, fenced code stays whole."""
+    blocks, current, in_fence = [], [], False
+
+    def flush():
+        if current:
+            blocks.append("\n".join(current))
+            current.clear()
+
+    for line in markdown.split("\n"):
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            if not in_fence:
+                flush()
+            current.append(line)
+            in_fence = not in_fence
+            if not in_fence:
+                flush()
+            continue
+        if in_fence:
+            current.append(line)
+        elif not stripped:
+            flush()
+        elif HEADING_RE.match(stripped):
+            flush()
+            blocks.append(stripped)
+        else:
+            current.append(line)
+    flush()
+    return blocks
+
+
+def merge_structured_parts(parts, lookback=None):
+    """
+    Join structured Markdown parts into one document. Sections (heading +
+    body) identical to an earlier one are dropped, a heading repeating the
+    one already in force at its level is merged into it, and body blocks
+    repeated within the last `lookback` blocks (window overlap) are skipped.
+    """
+    lookback = lookback or getattr(settings, "STRUCTURE_REDUCE_LOOKBACK", 20)
+
+    sections = [[None, []]]
+    for part in parts:
+        for block in _split_blocks(part):
+            if HEADING_RE.match(block):
+                sections.append([block, []])
+            else:
+                sections[-1][1].append(block)
+
+    out = []
+    seen_sections = set()
+    recent_blocks = deque(maxlen=lookback)
+    open_headings = {}  # level -> normalized title of the heading in force
+    for heading, body in sections:
+        if heading is None and not body:
+            continue
+        signature = _normalize("\n".join(([heading] if heading else []) + body))
+        if heading and signature in seen_sections:
+            continue
+        seen_sections.add(signature)
+
+        if heading:
+            hashes, title = HEADING_RE.match(heading).groups()
+            level, title = len(hashes), _normalize(title)
+            if open_headings.get(level) != title:
+                # a new heading closes every deeper one
+                open_headings = {lvl: t for lvl, t in open_headings.items() if lvl < level}
+                open_headings[level] = title
+                out.append(heading)
+
+        for block in body:
+            key = _normalize(block)
+            if key in recent_blocks:
+                continue
+            recent_blocks.append(key)
+            out.append(block)
+
+    return "\n\n".join(out)
+
+
+def structure_lecture_notes(course, lecture, timings=None, failed=None):
+    """
+    Structured Markdown for every SectionNote of a lecture, oldest first.
+    Pass a dict as `timings` to collect seconds per stage
+    (split, lookup, map, reduce), and a list as `failed` to collect the
+    chunks that could not be structured (see structure_chunks).
+    """
+    timings = {} if timings is None else timings
+    started = time.perf_counter()
+
+    with _stage(timings, "split"):
+        notes = SectionNote.objects.filter(course=course, lecture=lecture).only(
+            "extracted_text", "uploaded_at"
+        ).order_by("uploaded_at", "pk")
+        windows = [
+            window
+            for source in chunk_source_texts(notes)
+            for window in split_into_windows(source)
+        ]
+    if not windows:
+        return ""
+
+    parts = structure_chunks(windows, timings=timings, failed=failed)
+
+    with _stage(timings, "reduce"):
+        markdown = merge_structured_parts(parts)
+
+    logger.info(
+        "Structured course %s lecture %s: %d windows in %.2fs (%s)",
+        course.pk, lecture, len(windows), time.perf_counter() - started,
+        ", ".join(f"{name}={seconds:.3f}s" for name, seconds in timings.items()),
+    )
+    return markdown
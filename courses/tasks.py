@@ -1,19 +1,358 @@
-from celery import shared_task
+import logging
+from datetime import timedelta
+from celery import chord, group, shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
+from .locks import LectureBusy, LectureLock
 from .models import LectureFinalNote, SectionNote
+from .search import index_notes, reindex_lectures, reindex_notes
 from .utils import generate_final_pdf_from_notes  # we'll create this util
 from django.core.exceptions import ObjectDoesNotExist
 
+logger = logging.getLogger(__name__)
+
+
+# -----------------------------
+# SCHEDULED PDF GENERATION: one ETA task per lecture
+# -----------------------------
+def _acquire_or_retry(task, lock):
+    """
+    Take the lecture lock or have Celery retry the task later; never wait
+    for it. Without a queue to retry on (eager or direct calls) raise
+    LectureBusy instead.
+    """
+    if lock.acquire():
+        return
+    if task.request.is_eager or task.request.called_directly:
+        raise LectureBusy(lock.key)
+    raise task.retry(countdown=settings.LECTURE_LOCK_RETRY_SECONDS)
+
+
+def _release_pending_batch(lecture_final_id, **fields):
+    """Count one upload batch of the lecture as done, writing `fields` with it."""
+    LectureFinalNote.objects.filter(pk=lecture_final_id, pending_batches__gt=0).update(
+        pending_batches=F("pending_batches") - 1, **fields
+    )
+
+
+def schedule_lecture_pdf(lecture_final):
+    """
+    Queue generation of one lecture for its next_pdf_time, once the current
+    transaction commits. Stale or duplicate tasks are harmless: the task
+    only generates a lecture that is due and not yet generated.
+    """
+    if lecture_final.next_pdf_time:
+        schedule_lecture_pdfs([(lecture_final.pk, lecture_final.next_pdf_time)])
+
+
+def schedule_lecture_pdfs(schedule):
+    """schedule_lecture_pdf for many lectures: an iterable of (pk, next_pdf_time)."""
+    schedule = list(schedule)
+    if not schedule or not getattr(settings, "OCR_USE_CELERY", True):
+        return
+
+    def dispatch():
+        for pk, eta in schedule:
+            try:
+                generate_lecture_pdf_task.apply_async(args=[pk], eta=eta)
+            except Exception:
+                # the safety sweep picks it up once due
+                logger.exception("Could not schedule PDF generation for LectureFinalNote %s", pk)
+
+    transaction.on_commit(dispatch)
+
+
+def _claim_due_lecture(lecture_final_id, lease):
+    """
+    Claim a due, ungenerated lecture by pushing its next_pdf_time `lease`
+    seconds ahead, in a transaction of its own: the row is locked only
+    for that UPDATE, not for the whole generation. A claim whose worker
+    died expires and the sweep queues the lecture again.
+    Returns the claimed lecture, or None.
+    """
+    with transaction.atomic():
+        lec = (
+            LectureFinalNote.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(pk=lecture_final_id, is_generated=False, next_pdf_time__lte=timezone.now())
+            .select_related("course")
+            .first()
+        )
+        if lec is None:
+            return None
+        lec.next_pdf_time = timezone.now() + timedelta(seconds=lease)
+        LectureFinalNote.objects.filter(pk=lec.pk).update(next_pdf_time=lec.next_pdf_time)
+    return lec
+
+
+@shared_task(bind=True, max_retries=None)
+def generate_lecture_pdf_task(self, lecture_final_id):
+    """
+    Generate one due lecture's PDF. The row is claimed with
+    SELECT ... FOR UPDATE SKIP LOCKED (of the lecture row only) in a short
+    transaction, so any number of workers can drain a backlog in parallel
+    without two of them generating the same lecture, while uploads and
+    course saves never wait on a generation. The lecture lock keeps views
+    and upload structuring out meanwhile.
+    Returns True if this call generated the PDF.
+    """
+    lec = LectureFinalNote.objects.filter(
+        pk=lecture_final_id, is_generated=False, next_pdf_time__lte=timezone.now()
+    ).only("pk", "course_id", "lecture").first()
+    if lec is None:
+        # already generated, or rescheduled / claimed for later
+        return False
+
+    # a download or upload batch may be generating it right now
+    lock = LectureLock(lec.course_id, lec.lecture)
+    try:
+        _acquire_or_retry(self, lock)
+    except LectureBusy:
+        # not claimed, so the sweep queues it again
+        return False
+    try:
+        lec = _claim_due_lecture(lecture_final_id, lock.lease)
+        if lec is None:
+            # claimed by another worker in the meantime
+            return False
+        try:
+            # generate_final_pdf_from_notes returns file path or file-like ContentFile
+            generate_final_pdf_from_notes(lec, lock=lock)
+        except Exception:
+            # don't mark generated: the sweep retries it once the claim expires
+            logger.exception("Error generating PDF for %s", lec)
+            return False
+    finally:
+        lock.release()
+    if not lec.pdf_fingerprint:
+        # raw-text fallback: the sweep retries structuring once the claim expires
+        logger.warning("Structuring incomplete for %s; left due", lec)
+        return False
+    LectureFinalNote.objects.filter(pk=lec.pk).update(is_generated=True)
+    return True
+
+
 @shared_task
 def process_due_lectures_task():
-    now = timezone.now()
-    pending = LectureFinalNote.objects.filter(is_generated=False, next_pdf_time__lte=now)
-    for lec in pending:
+    """
+    Safety net behind the per-lecture ETA tasks (lost messages, broker
+    restarts, failed generations): queue every lecture that is due.
+    """
+    due = LectureFinalNote.objects.filter(
+        is_generated=False, next_pdf_time__lte=timezone.now()
+    ).values_list("pk", flat=True)
+    count = 0
+    for pk in due.iterator():
+        generate_lecture_pdf_task.delay(pk)
+        count += 1
+    if count:
+        logger.info("Sweep queued %d overdue lectures", count)
+    return count
+
+
+# -----------------------------
+# UPLOAD PIPELINE: per-image OCR → fan-in structuring
+# -----------------------------
+@shared_task
+def ocr_section_note_task(note_id):
+    """
+    OCR a single uploaded SectionNote and store its extracted_text.
+    Identical images reuse the cached text instead of calling the model.
+    Returns the text so the chord callback can combine the batch in order.
+    """
+    from .ai_helpers import extract_text_from_image_cached
+
+    try:
+        note = SectionNote.objects.get(pk=note_id)
+    except ObjectDoesNotExist:
+        return ""
+
+    try:
+        with note.image.open("rb") as fh:
+            extracted = extract_text_from_image_cached(fh.read())
+    except Exception:
+        logger.exception("OCR failed for SectionNote %s", note_id)
+        extracted = "(Error extracting text)"
+
+    SectionNote.objects.filter(pk=note_id).update(extracted_text=extracted)
+    reindex_notes([note_id])
+    return extracted
+
+
+@shared_task
+def enhance_section_note_task(note_id):
+    """
+    Generate and store the enhanced derivative of one SectionNote.
+    Skips notes that already have one, so retries and backfills are cheap.
+    """
+    from .utils import enhance_pages, read_stored_image, save_enhanced_image
+
+    note = SectionNote.objects.filter(pk=note_id).only("pk", "image", "enhanced_image").first()
+    if note is None or note.enhanced_image:
+        return False
+
+    # one image per task: the worker process itself is the unit of parallelism
+    enhanced = enhance_pages([read_stored_image(note.image)], workers=1)[0]
+    if enhanced is None:
+        logger.warning("Enhancement failed for SectionNote %s", note_id)
+        return False
+    save_enhanced_image(note, enhanced.getvalue())
+    return True
+
+
+@shared_task
+def make_note_derivatives_task(note_id):
+    """
+    Write the gallery thumbnail/preview files for one SectionNote
+    (non-Cloudinary storage). Skips notes whose files all exist, so the
+    upload pipeline and a render that queued the same note do not both
+    rewrite them.
+    """
+    from .derivatives import derivative_name, derivative_sizes, is_cloudinary_url, make_derivatives
+
+    note = SectionNote.objects.filter(pk=note_id).only("pk", "image").first()
+    if note is None or is_cloudinary_url(note.image.url):
+        return False
+    storage = note.image.storage
+    if all(storage.exists(derivative_name(note.image.name, width)) for width in derivative_sizes().values()):
+        return False
+    make_derivatives(note.image)
+    return True
+
+
+@shared_task(bind=True, max_retries=None)
+def structure_lecture_batch_task(self, ocr_texts, lecture_final_id):
+    """
+    Chord callback: runs once every OCR task of an upload batch is done.
+    The OCR results are already on the notes; re-structure the lecture
+    (only the new chunks reach the model) and write LectureFinalNote.notes.
+    If the lecture is being generated elsewhere it retries later, and then
+    reuses the chunks that run stored. Run inline or eagerly there is no
+    queue to retry on, so the batch is left unstructured instead.
+    """
+    from .structuring import structure_lecture_notes
+
+    lecture_final = LectureFinalNote.objects.filter(pk=lecture_final_id).select_related("course").first()
+    if lecture_final is None:
+        return None
+
+    lock = LectureLock(lecture_final.course_id, lecture_final.lecture)
+    try:
+        _acquire_or_retry(self, lock)
+    except LectureBusy:
+        logger.warning("%s is being generated; upload batch left unstructured", lecture_final)
+        _release_pending_batch(lecture_final_id)
+        return None
+
+    try:
+        combined_text = "\n\n".join(t for t in ocr_texts if t)
         try:
-            # generate_final_pdf_from_notes returns file path or file-like ContentFile
-            generate_final_pdf_from_notes(lec)
-            lec.is_generated = True
-            lec.save()
-        except Exception as e:
-            # log error; don't mark generated so it can retry next run
-            print(f"Error generating PDF for {lec}: {e}")
+            generated_notes = structure_lecture_notes(lecture_final.course, lecture_final.lecture)
+        except Exception:
+            logger.exception("Structuring failed for %s", lecture_final)
+            generated_notes = combined_text
+
+        _release_pending_batch(lecture_final_id, notes=generated_notes)
+        reindex_lectures([lecture_final_id])
+    finally:
+        lock.release()
+    return lecture_final_id
+
+
+@shared_task
+def release_upload_batch_task(request, exc, traceback, lecture_final_id):
+    """
+    Errback of the upload chord: an OCR task or the structuring callback
+    failed, so the callback will not decrement pending_batches. Do it here
+    so the lecture leaves "Processing…"; the scheduled PDF generation
+    structures the notes that did get OCR'd.
+    """
+    logger.error("Upload batch for LectureFinalNote %s failed: %r", lecture_final_id, exc)
+    _release_pending_batch(lecture_final_id)
+
+
+def _enqueue_derivatives(note_ids):
+    try:
+        group(
+            [enhance_section_note_task.s(note_id) for note_id in note_ids]
+            + [make_note_derivatives_task.s(note_id) for note_id in note_ids]
+        ).apply_async()
+    except Exception:
+        # downloads enhance on demand; the gallery queues missing thumbnails
+        logger.exception("Could not enqueue derivatives for SectionNotes %s", note_ids)
+
+
+def enqueue_upload_batch(course, lecture, note_ids):
+    """
+    Mark the lecture as pending and schedule OCR for each uploaded note,
+    followed by a single structuring step once all of them have finished.
+    With OCR_USE_CELERY off the same pipeline runs inline in the request.
+    Uploads without a lecture (lecture 0, from the course page) have no
+    lecture notes to structure or render: they only get OCR and derivatives.
+    Returns the LectureFinalNote the batch will write to, or None.
+    """
+    if not lecture:
+        if not getattr(settings, "OCR_USE_CELERY", True):
+            transaction.on_commit(lambda: ocr_notes_inline(note_ids))
+            return None
+
+        def dispatch_ocr():
+            try:
+                group(ocr_section_note_task.s(note_id) for note_id in note_ids).apply_async()
+            except Exception:
+                logger.exception("Could not enqueue OCR for SectionNotes %s", note_ids)
+            _enqueue_derivatives(note_ids)
+
+        transaction.on_commit(dispatch_ocr)
+        return None
+
+    lecture_final, _ = LectureFinalNote.objects.get_or_create(course=course, lecture=lecture)
+    LectureFinalNote.objects.filter(pk=lecture_final.pk).update(
+        pending_batches=F("pending_batches") + 1
+    )
+
+    if not getattr(settings, "OCR_USE_CELERY", True):
+        transaction.on_commit(lambda: run_upload_batch_inline(lecture_final, note_ids))
+        return lecture_final
+
+    def dispatch():
+        try:
+            callback = structure_lecture_batch_task.s(lecture_final.pk).on_error(
+                release_upload_batch_task.s(lecture_final.pk)
+            )
+            chord(ocr_section_note_task.s(note_id) for note_id in note_ids)(callback)
+        except Exception:
+            logger.exception("Could not enqueue OCR batch for %s", lecture_final)
+            _release_pending_batch(lecture_final.pk)
+        _enqueue_derivatives(note_ids)
+
+    transaction.on_commit(dispatch)
+    return lecture_final
+
+
+def ocr_notes_inline(note_ids):
+    """
+    OCR SectionNotes with a bounded thread pool and store their text.
+    Returns the texts in note_ids order (missing notes are skipped).
+    """
+    from .ai_helpers import extract_text_from_images
+
+    notes_by_pk = SectionNote.objects.in_bulk(note_ids)
+    notes = [notes_by_pk[pk] for pk in note_ids if pk in notes_by_pk]
+
+    texts = extract_text_from_images([note.image for note in notes])
+    for note, text in zip(notes, texts):
+        note.extracted_text = text
+    SectionNote.objects.bulk_update(notes, ["extracted_text"])
+    index_notes(notes)
+    return texts
+
+
+def run_upload_batch_inline(lecture_final, note_ids):
+    """
+    Task-queue-free variant of the upload pipeline: OCR the batch with a
+    bounded thread pool, then run the same fan-in structuring step.
+    Enhanced derivatives are left to the first download (or the backfill).
+    """
+    structure_lecture_batch_task(ocr_notes_inline(note_ids), lecture_final.pk)
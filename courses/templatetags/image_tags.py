@@ -0,0 +1,17 @@
+from django import template
+
+from courses.derivatives import derivative_srcset, derivative_url
+
+register = template.Library()
+
+
+@register.filter
+def derivative(image, size):
+    """{{ note.image|derivative:"thumb" }}"""
+    return derivative_url(image, size)
+
+
+@register.filter
+def srcset(image):
+    """{{ note.image|srcset }} -> "url 320w, url 640w" """
+    return derivative_srcset(image)
@@ -1,3 +1,1132 @@
-from django.test import TestCase
+import io
+import threading
+import zipfile
+import time as time_module
+from datetime import datetime, time, timedelta
+from unittest import mock
 
+from celery import current_app
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from PIL import Image
 
+from accounts.models import Account
+from backend.querybudget import QueryBudgetMixin
+from category.models import CourseCategory
+
+from . import ai_helpers, autocomplete, catalog, urls
+from .derivatives import derivative_name, derivative_url, make_derivatives
+from .ai_helpers import (
+    IMAGE_TOKEN_ESTIMATE, OCR_ERROR_TEXT, TokenBucket, estimate_tokens, extract_text_from_image_batch,
+    extract_text_from_image_cached, extract_text_from_images, image_part, ocr_cache_stats, split_page_delimited,
+)
+from .models import Course, LectureFinalNote, OCRCacheEntry, SearchEntry, SectionNote, StructuredChunk
+from .pdf_renderer import LIST_MAX_ITEMS, PARAGRAPH_MAX_CHARS, markdown_to_flowables, render_markdown_pdf
+from .providers import FakeProvider, TransientAIError, get_provider, reset_provider
+from .search import reindex_notes, search_entries
+from .structuring import merge_structured_parts, split_into_windows, structure_chunks, structure_lecture_notes
+from .locks import LectureLock
+from .tasks import enqueue_upload_batch, generate_lecture_pdf_task, structure_lecture_batch_task
+from .utils import create_pdf_from_markdown_bytes, iter_zip_stream, lecture_notes_fingerprint
+from .views import _unique_entries
+from .management.commands.bench_pdf_render import sample_ocr_text
+
+
+class CourseRescheduleTests(TestCase):
+    def setUp(self):
+        category = CourseCategory.objects.create(dep_name="CSE", slug="cse")
+        self.course = Course.objects.create(
+            course_name="Algorithms", course_initial="CSE221", slug="cse221",
+            faculty_initial="ABC", category=category, class_time=time(9, 0),
+        )
+
+    def test_new_lecture_is_scheduled_in_a_single_insert(self):
+        with self.assertNumQueries(1):
+            lecture = LectureFinalNote.objects.create(course=self.course, lecture=1)
+
+        expected_day = (timezone.now() + timedelta(minutes=10)).date()
+        self.assertEqual(
+            lecture.next_pdf_time,
+            timezone.make_aware(datetime.combine(expected_day, time(9, 0))),
+        )
+
+    def test_reschedule_1000_pending_lectures_in_constant_queries(self):
+        LectureFinalNote.objects.bulk_create(
+            LectureFinalNote(course=self.course, lecture=n) for n in range(1000)
+        )
+        LectureFinalNote.objects.filter(lecture__lt=10).update(is_generated=True)
+        course = Course.objects.get(pk=self.course.pk)
+
+        course.class_time = time(14, 40)
+        # UPDATE course, SELECT pending (pk, created_at), one UPDATE ... CASE
+        with self.assertNumQueries(3):
+            course.save()
+
+        times = set(
+            LectureFinalNote.objects.filter(is_generated=False)
+            .values_list("next_pdf_time", flat=True)
+        )
+        self.assertEqual(len(times), 1)
+        self.assertEqual(timezone.localtime(times.pop()).time(), time(14, 40))
+        self.assertFalse(
+            LectureFinalNote.objects.filter(is_generated=True, next_pdf_time__isnull=False).exists()
+        )
+
+    def test_save_without_class_time_change_does_not_touch_lectures(self):
+        LectureFinalNote.objects.create(course=self.course, lecture=1)
+        course = Course.objects.get(pk=self.course.pk)
+        course.faculty_name = "Someone"
+
+        with self.assertNumQueries(1):
+            course.save()
+
+
+def jpeg_bytes(size=(40, 30), color="white"):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+IN_MEMORY_STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+class MalformedBatchModel:
+    """Fake OCR model that loses the page delimiters of multi-image answers."""
+
+    def __init__(self):
+        self.model = FakeProvider(seed=0).get_model("fake")
+        self.calls = []
+
+    def generate_content(self, contents):
+        response = self.model.generate_content(contents)
+        images = sum(isinstance(part, dict) for part in contents)
+        self.calls.append(images)
+        if images > 1:
+            response.text = response.text.replace("=== PAGE 2 ===", "")
+        return response
+
+
+class OCRBatchTests(TestCase):
+    def test_split_page_delimited(self):
+        text = "=== PAGE 1 ===\nfirst\n  === PAGE 2 ===  \n\n=== PAGE 3 ===\nthird\n"
+        self.assertEqual(split_page_delimited(text, 3), ["first", "(No text found)", "third"])
+
+    def test_split_page_delimited_rejects_malformed_output(self):
+        self.assertIsNone(split_page_delimited("=== PAGE 1 ===\na\n=== PAGE 3 ===\nc", 3))  # missing
+        self.assertIsNone(split_page_delimited("=== PAGE 2 ===\nb\n=== PAGE 1 ===\na", 2))  # out of order
+        self.assertIsNone(split_page_delimited("=== PAGE 1 ===\na\n=== PAGE 1 ===\na", 2))  # duplicated
+        self.assertIsNone(split_page_delimited("just text", 1))
+        self.assertIsNone(split_page_delimited(None, 1))
+
+    def test_batch_matches_single_image_answers(self):
+        images = [jpeg_bytes(color=color) for color in ("white", "black", "red")]
+        model = FakeProvider(seed=0).get_model("fake")
+        self.assertEqual(
+            extract_text_from_image_batch(images, model=model),
+            [extract_text_from_image_batch([image], model=model)[0] for image in images],
+        )
+
+    def test_malformed_batch_falls_back_to_one_call_per_image(self):
+        images = [jpeg_bytes(color=color) for color in ("white", "black", "red")]
+        model = MalformedBatchModel()
+        texts = extract_text_from_image_batch(images, model=model)
+        self.assertEqual(model.calls, [3, 1, 1, 1])
+        single = FakeProvider(seed=0).get_model("fake")
+        self.assertEqual(texts, [extract_text_from_image_batch([image], model=single)[0] for image in images])
+        self.assertEqual(len(set(texts)), 3)
+
+
+@override_settings(AI_PROVIDER="fake", AI_FAKE_OPTIONS={})
+class OCRCacheTests(TestCase):
+    def setUp(self):
+        reset_provider()
+        self.addCleanup(reset_provider)
+        ai_helpers._ocr_lru.clear()
+        self.addCleanup(ai_helpers._ocr_lru.clear)
+        self.image = jpeg_bytes(color="blue")
+        self.baseline = ocr_cache_stats()
+
+    def stats(self):
+        stats = ocr_cache_stats()
+        return {key: stats[key] - self.baseline[key] for key in ("lru_hits", "db_hits", "misses")}
+
+    def test_miss_calls_the_model_once_then_hits_the_lru(self):
+        text = extract_text_from_image_cached(self.image)
+        self.assertEqual(extract_text_from_image_cached(self.image), text)
+        self.assertEqual(get_provider().calls, 1)
+        self.assertEqual(self.stats(), {"lru_hits": 1, "db_hits": 0, "misses": 1})
+        self.assertEqual(OCRCacheEntry.objects.get().extracted_text, text)
+
+    def test_other_processes_hit_the_table(self):
+        text = extract_text_from_image_cached(self.image)
+        ai_helpers._ocr_lru.clear()  # as a fresh worker
+        self.assertEqual(extract_text_from_image_cached(self.image), text)
+        self.assertEqual(get_provider().calls, 1)
+        self.assertEqual(self.stats(), {"lru_hits": 0, "db_hits": 1, "misses": 1})
+        self.assertEqual(OCRCacheEntry.objects.get().hit_count, 1)
+        # the table hit was copied into the LRU
+        extract_text_from_image_cached(self.image)
+        self.assertEqual(self.stats()["lru_hits"], 1)
+
+    def test_hit_rate(self):
+        extract_text_from_image_cached(self.image)
+        extract_text_from_image_cached(self.image)
+        extract_text_from_image_cached(self.image)
+        stats = ocr_cache_stats()
+        lookups = sum(stats[key] for key in ("lru_hits", "db_hits", "misses"))
+        self.assertEqual(stats["hit_rate"], (stats["lru_hits"] + stats["db_hits"]) / lookups)
+        self.assertEqual(self.stats(), {"lru_hits": 2, "db_hits": 0, "misses": 1})
+
+    def test_new_key_version_invalidates_old_entries(self):
+        extract_text_from_image_cached(self.image)
+        with mock.patch("courses.ai_helpers.OCR_CACHE_KEY_VERSION", "prompt-v2"):
+            extract_text_from_image_cached(self.image)
+        self.assertEqual(get_provider().calls, 2)
+        self.assertEqual(OCRCacheEntry.objects.count(), 2)
+
+    def test_errors_are_never_stored(self):
+        with mock.patch("courses.ai_helpers.extract_text_from_image", return_value=OCR_ERROR_TEXT) as ocr:
+            self.assertEqual(extract_text_from_image_cached(self.image), OCR_ERROR_TEXT)
+            self.assertEqual(extract_text_from_image_cached(self.image), OCR_ERROR_TEXT)
+        self.assertEqual(ocr.call_count, 2)
+        self.assertFalse(OCRCacheEntry.objects.exists())
+
+
+class OCRPoolTests(SimpleTestCase):
+    """extract_text_from_images with one model call per image (OCR_BATCH_SIZE=1)."""
+
+    def setUp(self):
+        self.active = self.peak = 0
+        self.lock = threading.Lock()
+
+    def slow_ocr(self, data):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time_module.sleep(0.01 * (data[-1] % 3))  # finish out of order
+            if data.startswith(b"bad"):
+                raise RuntimeError("model exploded")
+            return data.decode().upper()
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def ocr(self, images, max_workers):
+        with mock.patch("courses.ai_helpers.extract_text_from_image_cached", side_effect=self.slow_ocr):
+            return extract_text_from_images(images, max_workers=max_workers, batch_size=1)
+
+    def test_results_keep_input_order(self):
+        images = [f"page{n}".encode() for n in range(10)]
+        self.assertEqual(self.ocr(images, 4), [f"PAGE{n}" for n in range(10)])
+
+    def test_a_failing_image_only_fails_itself(self):
+        texts = self.ocr([b"page0", b"bad1", b"page2"], 3)
+        self.assertEqual(texts, ["PAGE0", OCR_ERROR_TEXT, "PAGE2"])
+
+    def test_concurrency_is_bounded_by_max_workers(self):
+        self.ocr([f"page{n}".encode() for n in range(12)], 3)
+        self.assertLessEqual(self.peak, 3)
+        self.assertGreater(self.peak, 1)
+
+
+class FakeClock:
+    """Stands in for the time module; sleep() advances the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    monotonic = time
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("courses.ai_helpers.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # 1 token per second, burst of 3
+        self.bucket = TokenBucket(f"test-{self.id()}", per_minute=60, capacity=3)
+        self.addCleanup(self.bucket.cache.delete, self.bucket.key)
+
+    def test_burst_then_wait_for_refill(self):
+        self.assertEqual([self.bucket.acquire() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(self.bucket.acquire(), 1.0)
+        self.assertAlmostEqual(self.bucket.acquire(2), 2.0)
+        self.assertEqual(len(self.clock.sleeps), 2)
+
+    def test_refill_is_capped_at_capacity(self):
+        self.bucket.acquire(3)
+        self.clock.now += 3600
+        self.assertEqual(self.bucket.acquire(3), 0.0)
+        self.assertAlmostEqual(self.bucket.acquire(), 1.0)
+
+    def test_adjust_debits_and_credits_without_waiting(self):
+        self.bucket.acquire(3)
+        self.bucket.adjust(2)  # the call used more tokens than estimated
+        self.assertAlmostEqual(self.bucket.acquire(), 3.0)
+        self.bucket.adjust(-3)  # ...or fewer
+        self.assertEqual(self.bucket.acquire(), 0.0)
+        self.assertEqual(self.clock.sleeps, [3.0])
+
+
+@override_settings(AI_PROVIDER="fake", AI_FAKE_OPTIONS={}, STRUCTURE_CHUNK_NOTES=2)
+class ChunkReuseTests(TestCase):
+    def setUp(self):
+        reset_provider()
+        self.addCleanup(reset_provider)
+        category = CourseCategory.objects.create(dep_name="CSE", slug="cse")
+        self.course = Course.objects.create(
+            course_name="Algorithms", course_initial="CSE221", slug="cse221", category=category,
+        )
+        self.user = Account.objects.create_user(
+            first_name="Student", last_name="One", username="student", email="student@example.com", password="pw",
+        )
+        for n in range(4):
+            self.add_note(f"page {n} text")
+
+    def add_note(self, text):
+        return SectionNote.objects.create(
+            user=self.user, course=self.course, lecture=1, image="section_uploads/page.jpg", extracted_text=text,
+        )
+
+    def test_only_new_chunks_reach_the_model(self):
+        first = structure_lecture_notes(self.course, 1)
+        self.assertEqual(get_provider().calls, 2)
+        self.assertEqual(StructuredChunk.objects.count(), 2)
+
+        self.assertEqual(structure_lecture_notes(self.course, 1), first)
+        self.assertEqual(get_provider().calls, 2)
+
+        # appending a note only changes the last chunk
+        self.add_note("page 4 text")
+        self.assertIn("page 4 text", structure_lecture_notes(self.course, 1))
+        self.assertEqual(get_provider().calls, 3)
+        self.assertEqual(StructuredChunk.objects.count(), 3)
+
+
+class OtherProvider(FakeProvider):
+    """A second backend, for checking that cached output stays with its provider."""
+    name = "other"
+
+
+class FakeProviderTests(SimpleTestCase):
+    def setUp(self):
+        sleep = mock.patch("courses.providers.time.sleep")
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+        self.page = image_part(jpeg_bytes(color="white"))
+
+    def test_answers_depend_only_on_the_input(self):
+        first, second = FakeProvider(seed=0).get_model("m"), FakeProvider(seed=1).get_model("m")
+        self.assertEqual(first.generate_content(["ocr", self.page]).text, second.generate_content(["ocr", self.page]).text)
+        other_page = image_part(jpeg_bytes(color="black"))
+        self.assertNotEqual(first.generate_content(["ocr", self.page]).text, first.generate_content(["ocr", other_page]).text)
+        self.assertEqual(first.generate_content(["structure", "a\nb"]).text, second.generate_content(["structure", "a\nb"]).text)
+
+    def test_latency_and_token_accounting(self):
+        provider = FakeProvider(latency=0.2, per_image_latency=0.1, seed=0)
+        response = provider.get_model("m").generate_content(["prompt", self.page, self.page])
+        self.sleep.assert_called_once_with(mock.ANY)
+        self.assertAlmostEqual(self.sleep.call_args.args[0], 0.4)
+        self.assertEqual(
+            response.usage_metadata.total_token_count,
+            len("prompt") // 4 + 1 + 2 * IMAGE_TOKEN_ESTIMATE + len(response.text) // 4,
+        )
+        self.assertEqual((provider.calls, provider.errors), (1, 0))
+
+    def test_injected_errors_are_transient_and_counted(self):
+        provider = FakeProvider(error_rate=1.0, seed=0)
+        with self.assertRaises(TransientAIError):
+            provider.get_model("m").generate_content("prompt")
+        self.assertEqual((provider.calls, provider.errors), (1, 1))
+
+
+@override_settings(AI_FAKE_OPTIONS={})
+class ProviderCacheTests(TestCase):
+    def setUp(self):
+        reset_provider()
+        self.addCleanup(reset_provider)
+
+    def use(self, provider):
+        override = override_settings(AI_PROVIDER=provider)
+        override.enable()
+        self.addCleanup(override.disable)
+        reset_provider()
+
+    def test_ocr_results_stay_with_their_provider(self):
+        data = jpeg_bytes(color="gray")
+        self.use("fake")
+        text = extract_text_from_image_cached(data)
+        self.assertEqual(extract_text_from_image_cached(data), text)
+        self.assertEqual(get_provider().calls, 1)
+
+        self.use("courses.tests.OtherProvider")
+        extract_text_from_image_cached(data)
+        self.assertEqual(get_provider().calls, 1)
+        self.assertEqual(OCRCacheEntry.objects.count(), 2)
+
+    def test_structured_chunks_stay_with_their_provider(self):
+        self.use("fake")
+        structure_chunks(["page text"])
+        structure_chunks(["page text"])
+        self.assertEqual(get_provider().calls, 1)
+
+        self.use("courses.tests.OtherProvider")
+        structure_chunks(["page text"])
+        self.assertEqual(get_provider().calls, 1)
+        self.assertEqual(StructuredChunk.objects.count(), 2)
+
+
+class WindowSplitMergeTests(SimpleTestCase):
+    def test_text_within_budget_is_one_window(self):
+        self.assertEqual(split_into_windows("short text", window_tokens=100, overlap_tokens=10), ["short text"])
+
+    def test_windows_fit_the_budget_and_overlap(self):
+        lines = [f"line {n:03d} of the notes" for n in range(200)]
+        windows = split_into_windows("\n".join(lines), window_tokens=60, overlap_tokens=15)
+
+        self.assertGreater(len(windows), 1)
+        for window in windows:
+            self.assertLessEqual(sum(estimate_tokens(line) for line in window.split("\n")), 60)
+        for previous, window in zip(windows, windows[1:]):
+            overlap = set(previous.split("\n")) & set(window.split("\n"))
+            self.assertTrue(overlap)
+            self.assertLessEqual(sum(estimate_tokens(line) for line in overlap), 15)
+        # every line, in order, once the overlaps are removed
+        seen = []
+        for window in windows:
+            seen.extend(line for line in window.split("\n") if line not in seen)
+        self.assertEqual(seen, lines)
+
+    def test_overlong_line_is_hard_split(self):
+        windows = split_into_windows("x" * 1000, window_tokens=50, overlap_tokens=0)
+        self.assertEqual("".join(windows), "x" * 1000)
+        self.assertTrue(all(len(window) <= 200 for window in windows))
+
+    def test_merge_drops_overlap_duplicates(self):
+        parts = [
+            "# Sorting\n\n## Merge sort\n\nSplit the array.\n\nMerge the halves.",
+            # the next window starts inside the same section and repeats its tail
+            "# Sorting\n\n## Merge sort\n\nMerge the halves.\n\nO(n log n) time.\n\n## Quick sort\n\nPick a pivot.",
+            "## Quick sort\n\nPick a pivot.",  # a whole section repeated
+        ]
+        self.assertEqual(merge_structured_parts(parts), "\n\n".join([
+            "# Sorting", "## Merge sort", "Split the array.", "Merge the halves.", "O(n log n) time.",
+            "## Quick sort", "Pick a pivot.",
+        ]))
+
+    def test_merge_keeps_repeated_headings_under_different_parents(self):
+        parts = ["# Arrays\n\n## Example\n\nA[0] = 1", "# Lists\n\n## Example\n\nhead.next = None"]
+        self.assertEqual(merge_structured_parts(parts).count("## Example"), 2)
+
+
+class PdfRendererTests(SimpleTestCase):
+    def test_unbroken_ocr_text_is_cut_into_bounded_paragraphs(self):
+        text = sample_ocr_text(10_000)
+        flowables = markdown_to_flowables(text)
+        self.assertGreater(len(flowables), 1)
+        self.assertTrue(all(len(f.text) <= PARAGRAPH_MAX_CHARS for f in flowables))
+        self.assertEqual(" ".join(f.text for f in flowables), " ".join(text.splitlines()))
+
+    def test_10k_line_note_renders_in_bounded_time(self):
+        started = time_module.perf_counter()
+        pdf = render_markdown_pdf(sample_ocr_text(10_000)).getvalue()
+        # a single 10k-line Paragraph took minutes to split across pages
+        self.assertLess(time_module.perf_counter() - started, 30)
+        self.assertTrue(pdf.startswith(b"%PDF"))
+
+    def test_one_very_long_line_is_cut_at_spaces(self):
+        line = " ".join(sample_ocr_text(10_000).split())
+        started = time_module.perf_counter()
+        flowables = markdown_to_flowables(line)
+        self.assertGreater(len(flowables), 1)
+        self.assertTrue(all(len(f.text) <= PARAGRAPH_MAX_CHARS for f in flowables))
+        self.assertEqual(" ".join(f.text for f in flowables), line)
+        self.assertTrue(render_markdown_pdf(line).getvalue().startswith(b"%PDF"))
+        self.assertLess(time_module.perf_counter() - started, 30)
+
+        unspaced = markdown_to_flowables("x" * (2 * PARAGRAPH_MAX_CHARS + 1))
+        self.assertEqual([len(f.text) for f in unspaced], [PARAGRAPH_MAX_CHARS, PARAGRAPH_MAX_CHARS, 1])
+
+    def test_long_ordered_list_keeps_numbering(self):
+        text = "\n".join(f"{n}. step {n}" for n in range(1, LIST_MAX_ITEMS + 11))
+        lists = markdown_to_flowables(text)
+        self.assertEqual([len(flowable._flowables) for flowable in lists], [LIST_MAX_ITEMS, 10])
+        self.assertEqual(lists[1]._start, LIST_MAX_ITEMS + 1)
+
+
+class ZipStreamTests(SimpleTestCase):
+    def test_one_chunk_per_entry_and_a_valid_archive(self):
+        entries = [(f"page_{n}.png", bytes([n]) * 1000) for n in range(5)]
+        chunks = list(iter_zip_stream(iter(entries)))
+        self.assertEqual(len(chunks), len(entries) + 1)  # + central directory
+        with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+            self.assertEqual([(info.filename, zf.read(info)) for info in zf.infolist()], entries)
+            self.assertTrue(all(info.compress_type == zipfile.ZIP_STORED for info in zf.infolist()))
+
+    def test_duplicate_names_and_failed_images(self):
+        results = [("page.png", b"a"), None, ("page.png", b"b"), ("page.png", b"c")]
+        with zipfile.ZipFile(io.BytesIO(b"".join(iter_zip_stream(_unique_entries(results))))) as zf:
+            self.assertEqual(zf.namelist(), ["page.png", "page_1.png", "page_2.png"])
+
+    def test_empty(self):
+        with zipfile.ZipFile(io.BytesIO(b"".join(iter_zip_stream([])))) as zf:
+            self.assertEqual(zf.namelist(), [])
+
+
+@override_settings(STORAGES=IN_MEMORY_STORAGES)
+class DerivativeTests(TestCase):
+    def setUp(self):
+        category = CourseCategory.objects.create(dep_name="CSE", slug="cse")
+        course = Course.objects.create(course_name="Algorithms", course_initial="CSE221", slug="cse221", category=category)
+        user = Account.objects.create_user(
+            first_name="Student", last_name="One", username="student", email="student@example.com", password="pw",
+        )
+        self.note = SectionNote(user=user, course=course, lecture=1)
+        self.note.image.save("page.jpg", ContentFile(jpeg_bytes((1600, 1200))), save=True)
+        cache.clear()
+        self.thumb = derivative_name(self.note.image.name, 320)
+
+    def test_missing_derivative_is_queued_not_rendered(self):
+        with mock.patch("courses.tasks.make_note_derivatives_task.delay") as delay:
+            self.assertEqual(derivative_url(self.note.image, "thumb"), self.note.image.url)
+            self.assertEqual(derivative_url(self.note.image, "preview"), self.note.image.url)
+        delay.assert_called_once_with(self.note.pk)
+        self.assertFalse(self.note.image.storage.exists(self.thumb))
+
+    def test_broker_outage_does_not_slow_the_page(self):
+        other = SectionNote(user=self.note.user, course=self.note.course, lecture=1)
+        other.image.save("other.jpg", ContentFile(jpeg_bytes()), save=True)
+        with mock.patch("courses.tasks.make_note_derivatives_task.delay", side_effect=OSError) as delay:
+            derivative_url(self.note.image, "thumb")
+            self.assertEqual(derivative_url(other.image, "thumb"), other.image.url)
+        self.assertEqual(delay.call_count, 1)
+
+    def test_existing_derivative_is_served(self):
+        make_derivatives(self.note.image)
+        with mock.patch("courses.tasks.make_note_derivatives_task.delay") as delay:
+            self.assertEqual(derivative_url(self.note.image, "thumb"), self.note.image.storage.url(self.thumb))
+        delay.assert_not_called()
+
+
+@override_settings(STORAGES=IN_MEMORY_STORAGES)
+class BackfillEnhancedImagesTests(TestCase):
+    def setUp(self):
+        category = CourseCategory.objects.create(dep_name="CSE", slug="cse")
+        course = Course.objects.create(course_name="Algorithms", course_initial="CSE221", slug="cse221", category=category)
+        user = Account.objects.create_user(
+            first_name="Student", last_name="One", username="student", email="student@example.com", password="pw",
+        )
+        self.notes = []
+        for color in ("white", "black", "red", "green", "blue"):
+            note = SectionNote(user=user, course=course, lecture=1)
+            note.image.save(f"{color}.jpg", ContentFile(jpeg_bytes(color=color)), save=True)
+            self.notes.append(note)
+        self.enhanced = []  # image bytes handed to enhance_pages
+        self.failing = set()
+
+    def fake_enhance(self, images):
+        self.enhanced += images
+        return [None if data in self.failing else io.BytesIO(b"png") for data in images]
+
+    def backfill(self, **options):
+        out = io.StringIO()
+        with mock.patch(
+            "courses.management.commands.backfill_enhanced_images.enhance_pages", side_effect=self.fake_enhance
+        ):
+            call_command("backfill_enhanced_images", stdout=out, batch_size=2, **options)
+        return out.getvalue()
+
+    def enhanced_pks(self):
+        return set(SectionNote.objects.exclude(enhanced_image="").values_list("pk", flat=True))
+
+    def test_limit_and_after_resume_in_id_order(self):
+        pks = [note.pk for note in self.notes]
+        output = self.backfill(limit=3)
+        self.assertEqual(self.enhanced_pks(), set(pks[:3]))
+        self.assertIn(f"resume with --after {pks[2]}", output)
+
+        self.backfill(after=pks[3], limit=3)  # skips pks[3]
+        self.assertEqual(self.enhanced_pks(), set(pks[:3]) | {pks[4]})
+        self.assertEqual(len(self.enhanced), 4)
+
+    def test_notes_already_enhanced_are_skipped(self):
+        done = self.notes[1]
+        SectionNote.objects.filter(pk=done.pk).update(enhanced_image="section_uploads/enhanced/done.png")
+        output = self.backfill()
+        self.assertEqual(len(self.enhanced), 4)
+        self.assertNotIn(jpeg_bytes(color="black"), self.enhanced)
+        self.assertIn("Finished: 4 enhanced, 0 failed", output)
+
+    def test_failures_do_not_stop_the_run(self):
+        self.failing.add(jpeg_bytes(color="black"))
+        self.notes[3].image.storage.delete(self.notes[3].image.name)  # unreadable
+        output = self.backfill()
+        self.assertEqual(self.enhanced_pks(), {self.notes[n].pk for n in (0, 2, 4)})
+        self.assertIn("Finished: 3 enhanced, 2 failed", output)
+
+
+@override_settings(STORAGES=IN_MEMORY_STORAGES, AI_PROVIDER="fake", AI_FAKE_OPTIONS={}, LECTURE_LOCK_REDIS_URL="")
+class LecturePdfTaskTests(TestCase):
+    def setUp(self):
+        reset_provider()
+        self.addCleanup(reset_provider)
+        category = CourseCategory.objects.create(dep_name="CSE", slug="cse")
+        course = Course.objects.create(course_name="Algorithms", course_initial="CSE221", slug="cse221", category=category)
+        user = Account.objects.create_user(
+            first_name="Student", last_name="One", username="student", email="student@example.com", password="pw",
+        )
+        SectionNote.objects.create(
+            user=user, course=course, lecture=1, image="section_uploads/page.jpg", extracted_text="page text",
+        )
+        self.lecture = LectureFinalNote.objects.create(
+            course=course, lecture=1, next_pdf_time=timezone.now() - timedelta(minutes=1),
+        )
+
+    def test_generates_a_due_lecture_without_touching_pending_batches(self):
+        def upload_meanwhile(course, lecture, failed=None):
+            # enqueue_upload_batch while the PDF is being generated
+            LectureFinalNote.objects.filter(pk=self.lecture.pk).update(pending_batches=F("pending_batches") + 1)
+            return "# Notes\n\npage text"
+
+        with mock.patch("courses.structuring.structure_lecture_notes", side_effect=upload_meanwhile):
+            self.assertTrue(generate_lecture_pdf_task.apply(args=[self.lecture.pk]).get())
+
+        self.lecture.refresh_from_db()
+        self.assertTrue(self.lecture.is_generated)
+        self.assertTrue(self.lecture.pdf_file)
+        self.assertIn("page text", self.lecture.notes)
+        self.assertEqual(self.lecture.pending_batches, 1)
+
+    def test_failed_generation_stays_claimed_until_the_claim_expires(self):
+        with mock.patch("courses.tasks.generate_final_pdf_from_notes", side_effect=RuntimeError):
+            self.assertFalse(generate_lecture_pdf_task.apply(args=[self.lecture.pk]).get())
+        # the failed claim holds the lecture back until it expires
+        self.lecture.refresh_from_db()
+        self.assertFalse(self.lecture.is_generated)
+        self.assertGreater(self.lecture.next_pdf_time, timezone.now())
+        self.assertFalse(generate_lecture_pdf_task.apply(args=[self.lecture.pk]).get())
+
+    def test_unstructured_fallback_is_not_taken_as_current(self):
+        with mock.patch("courses.structuring.structure_text", side_effect=RuntimeError("quota")):
+            self.assertFalse(generate_lecture_pdf_task.apply(args=[self.lecture.pk]).get())
+        self.lecture.refresh_from_db()
+        self.assertTrue(self.lecture.pdf_file)  # the raw text is still readable
+        self.assertEqual(self.lecture.notes, "page text")
+        self.assertEqual(self.lecture.pdf_fingerprint, "")
+        self.assertFalse(self.lecture.is_generated)
+        self.assertFalse(StructuredChunk.objects.exists())
+
+        # once the claim expires the sweep's retry structures it
+        LectureFinalNote.objects.filter(pk=self.lecture.pk).update(next_pdf_time=timezone.now())
+        self.assertTrue(generate_lecture_pdf_task.apply(args=[self.lecture.pk]).get())
+        self.lecture.refresh_from_db()
+        self.assertEqual(
+            self.lecture.pdf_fingerprint,
+            lecture_notes_fingerprint(SectionNote.objects.filter(course=self.lecture.course, lecture=1)),
+        )
+        self.assertTrue(self.lecture.is_generated)
+
+    def hold_lecture_lock(self):
+        lock = LectureLock(self.lecture.course_id, self.lecture.lecture)
+        self.assertTrue(lock.acquire())
+        self.addCleanup(lock.release)
+
+    def test_busy_lecture_is_not_waited_for_or_claimed(self):
+        self.hold_lecture_lock()
+        started = time_module.monotonic()
+        self.assertFalse(generate_lecture_pdf_task.apply(args=[self.lecture.pk]).get())
+        self.assertLess(time_module.monotonic() - started, 5)
+        self.lecture.refresh_from_db()
+        self.assertLess(self.lecture.next_pdf_time, timezone.now())  # still due for the sweep
+
+    def test_inline_structuring_of_a_busy_lecture_gives_up_the_batch(self):
+        LectureFinalNote.objects.filter(pk=self.lecture.pk).update(pending_batches=1, notes="earlier notes")
+        self.hold_lecture_lock()
+        self.assertIsNone(structure_lecture_batch_task(["page text"], self.lecture.pk))
+        self.lecture.refresh_from_db()
+        self.assertEqual((self.lecture.pending_batches, self.lecture.notes), (0, "earlier notes"))
+
+
+@override_settings(STORAGES=IN_MEMORY_STORAGES, LECTURE_LOCK_REDIS_URL="")
+class LectureDownloadTests(TestCase):
+    def setUp(self):
+        category = CourseCategory.objects.create(dep_name="CSE", slug="cse")
+        self.course = Course.objects.create(
+            course_name="Algorithms", course_initial="CSE221", slug="cse221", category=category,
+        )
+        self.user = Account.objects.create_user(
+            first_name="Student", last_name="One", username="student", email="student@example.com", password="pw",
+        )
+        self.note = SectionNote.objects.create(
+            user=self.user, course=self.course, lecture=1, image="section_uploads/page.jpg", extracted_text="page one",
+        )
+        self.url = reverse("download_lecture_notes_pdf", args=["cse", "cse221", 1, 1])
+        self.client.force_login(self.user)
+
+    def lecture(self):
+        return LectureFinalNote.objects.get(course=self.course, lecture=1)
+
+    def render_count(self):
+        return mock.patch("courses.views.create_pdf_from_markdown_bytes", wraps=create_pdf_from_markdown_bytes)
+
+    def test_matching_etag_is_not_modified(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        b"".join(first.streaming_content)
+        with self.render_count() as render:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+        render.assert_not_called()
+
+    def test_changed_notes_rebuild_the_pdf(self):
+        first = self.client.get(self.url)
+        b"".join(first.streaming_content)
+        stored = self.lecture().pdf_fingerprint
+
+        SectionNote.objects.filter(pk=self.note.pk).update(extracted_text="page one, corrected")
+        with self.render_count() as render:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+            b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        render.assert_called_once()
+        self.assertNotEqual(response["ETag"], first["ETag"])
+        self.assertNotEqual(self.lecture().pdf_fingerprint, stored)
+
+    def test_download_keeps_pending_batches(self):
+        LectureFinalNote.objects.create(course=self.course, lecture=1, pending_batches=2)
+        response = self.client.get(self.url)
+        b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        lecture = self.lecture()
+        self.assertEqual(lecture.pending_batches, 2)
+        self.assertTrue(lecture.pdf_fingerprint)
+
+    def test_busy_lecture_is_not_waited_for(self):
+        lock = LectureLock(self.course.pk, 1)
+        self.assertTrue(lock.acquire())
+        self.addCleanup(lock.release)
+        LectureFinalNote.objects.create(course=self.course, lecture=1, notes="# Structured", pending_batches=1)
+
+        with self.render_count() as render, mock.patch("time.sleep") as sleep:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "10")
+
+        lecture = self.lecture()
+        lecture.pdf_file.save("previous.pdf", ContentFile(b"%PDF-previous"), save=False)
+        lecture.pdf_fingerprint = "previous"
+        lecture.save(update_fields=["pdf_file", "pdf_fingerprint"])
+        with self.render_count() as render, mock.patch("time.sleep") as sleep:
+            response = self.client.get(self.url)
+            self.assertEqual(b"".join(response.streaming_content), b"%PDF-previous")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("max-age=0", response["Cache-Control"])
+        render.assert_not_called()
+        sleep.assert_not_called()
+        lecture = self.lecture()
+        self.assertEqual((lecture.notes, lecture.pending_batches), ("# Structured", 1))
+
+
+@override_settings(STORAGES=IN_MEMORY_STORAGES)
+class UploadBatchTests(TestCase):
+    def setUp(self):
+        category = CourseCategory.objects.create(dep_name="CSE", slug="cse")
+        self.course = Course.objects.create(
+            course_name="Algorithms", course_initial="CSE221", slug="cse221", category=category,
+        )
+        user = Account.objects.create_user(
+            first_name="Student", last_name="One", username="student", email="student@example.com", password="pw",
+        )
+        self.note = SectionNote(user=user, course=self.course, lecture=1)
+        self.note.image.save("page.jpg", ContentFile(jpeg_bytes()), save=True)
+
+    def test_failed_batch_is_no_longer_pending(self):
+        with mock.patch("courses.tasks.chord") as chord, mock.patch("courses.tasks.group"), \
+                mock.patch("courses.tasks.generate_lecture_pdf_task"):
+            with self.captureOnCommitCallbacks(execute=True):
+                lecture_final = enqueue_upload_batch(self.course, 1, [self.note.pk])
+        lecture_final.refresh_from_db()
+        self.assertEqual(lecture_final.pending_batches, 1)
+
+        # what Celery does with the callback's errbacks when a chord part fails
+        callback = chord.return_value.call_args.args[0]
+        for errback in callback.options["link_error"]:
+            current_app.signature(errback)(mock.Mock(id="ocr"), RuntimeError("worker lost"), None)
+        lecture_final.refresh_from_db()
+        self.assertEqual(lecture_final.pending_batches, 0)
+
+
+    def test_course_page_uploads_are_only_ocrd(self):
+        self.client.force_login(self.note.user)
+        url = reverse("course_detail", args=["cse", "cse221", 1])
+        with mock.patch("courses.tasks.chord") as chord, mock.patch("courses.tasks.group") as group:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, {"images": [io.BytesIO(jpeg_bytes()), io.BytesIO(jpeg_bytes())]})
+        self.assertEqual(response.status_code, 302)
+        chord.assert_not_called()
+        self.assertFalse(LectureFinalNote.objects.exists())
+        note_ids = list(SectionNote.objects.filter(lecture=0).values_list("pk", flat=True))
+        self.assertEqual(len(note_ids), 2)
+        ocr, derivatives = (list(call.args[0]) for call in group.call_args_list)
+        self.assertEqual([task.args for task in ocr], [(pk,) for pk in note_ids])
+        self.assertEqual(len(derivatives), 4)
+
+    @override_settings(OCR_USE_CELERY=False)
+    def test_inline_course_page_uploads_are_only_ocrd(self):
+        note = SectionNote(user=self.note.user, course=self.course, lecture=0)
+        note.image.save("loose.jpg", ContentFile(jpeg_bytes(color="black")), save=True)
+        with mock.patch("courses.ai_helpers.extract_text_from_images", return_value=["loose page"]), \
+                mock.patch("courses.tasks.structure_lecture_batch_task") as structure:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertIsNone(enqueue_upload_batch(self.course, 0, [note.pk]))
+        note.refresh_from_db()
+        self.assertEqual(note.extracted_text, "loose page")
+        structure.assert_not_called()
+        self.assertFalse(LectureFinalNote.objects.exists())
+
+
+@override_settings(STORAGES=IN_MEMORY_STORAGES)
+class CourseRouteQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every route in courses.urls stays within settings.QUERY_BUDGETS."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = CourseCategory.objects.create(courseCategory="CSE", dep_name="CSE", slug="cse")
+        CourseCategory.objects.create(courseCategory="EEE", dep_name="EEE", slug="eee")
+        with cls.captureOnCommitCallbacks(execute=True):  # search index
+            cls.courses = [
+                Course.objects.create(
+                    course_name=f"Course {n}", course_initial=f"CSE22{n}", slug=f"cse22{n}",
+                    faculty_initial="ABC", category=cls.category,
+                )
+                for n in range(5)
+            ]
+        cls.course = cls.courses[0]
+        cls.users = [
+            Account.objects.create_user(
+                first_name="Student", last_name=str(n), username=f"student{n}",
+                email=f"student{n}@example.com", password="pw",
+            )
+            for n in range(3)
+        ]
+
+    def setUp(self):
+        catalog.bump_version()  # budgets are for a cold catalog cache
+        patcher = mock.patch("courses.tasks.make_note_derivatives_task.delay")  # gallery thumbnails
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # files live in the per-test in-memory storage
+        for user in self.users:
+            for page in range(3):
+                note = SectionNote(user=user, course=self.course, lecture=1, extracted_text=f"page {page}")
+                note.image.save(f"{user.username}_{page}.jpg", ContentFile(jpeg_bytes()), save=False)
+                note.enhanced_image.save(f"{user.username}_{page}.png", ContentFile(jpeg_bytes()), save=False)
+                note.save()
+        notes = SectionNote.objects.filter(course=self.course, lecture=1).order_by("uploaded_at", "pk")
+        final = LectureFinalNote.objects.create(
+            course=self.course, lecture=1, notes="notes", is_generated=True,
+            pdf_fingerprint=lecture_notes_fingerprint(notes), pdf_updated_at=timezone.now(),
+        )
+        final.pdf_file.save("cse220_lecture_1.pdf", ContentFile(b"%PDF-1.4"), save=True)
+        self.client.force_login(self.users[0])
+
+    def lecture_args(self):
+        return [self.category.slug, self.course.slug, self.course.section, 1]
+
+    def get_within_budget(self, name, args=(), **params):
+        with self.assertQueryBudget(name):
+            response = self.client.get(reverse(name, args=args), params)
+            if response.streaming:
+                response.body = b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_every_route_has_a_budget(self):
+        from django.conf import settings
+
+        names = {p.name for p in urls.urlpatterns if isinstance(p, URLPattern)}
+        self.assertEqual(names - set(settings.QUERY_BUDGETS), set())
+
+    def test_home(self):
+        with self.assertQueryBudget("home"):
+            self.assertEqual(self.client.get(reverse("home")).status_code, 200)
+
+    def test_course_list(self):
+        self.get_within_budget("course")
+
+    def test_course_by_category(self):
+        self.get_within_budget("course_by_category", [self.category.slug])
+
+    def test_search(self):
+        response = self.get_within_budget("search", keyword="CSE")
+        self.assertEqual(len(response.context["results"]), 5)
+
+    def test_autocomplete(self):
+        response = self.get_within_budget("course_autocomplete", q="cse22")
+        self.assertEqual(len(response.json()["results"]), 5)
+
+    def test_course_detail(self):
+        self.get_within_budget("course_detail", self.lecture_args()[:3])
+
+    def test_lecture_page(self):
+        self.get_within_budget("course_detail_per_section", self.lecture_args())
+
+    def test_download_lecture_pdf_from_stored_file(self):
+        response = self.get_within_budget("download_lecture_notes_pdf", self.lecture_args())
+        self.assertEqual(response["Content-Type"], "application/pdf")
+
+    def test_download_user_images(self):
+        response = self.get_within_budget("download_user_images", [self.users[0].pk, *self.lecture_args()])
+        with zipfile.ZipFile(io.BytesIO(response.body)) as zf:
+            self.assertEqual(len(zf.namelist()), 3)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = CourseCategory.objects.create(courseCategory="CSE", dep_name="CSE", slug="cse")
+        cls.user = Account.objects.create_user(
+            first_name="Student", last_name="One", username="student",
+            email="student@example.com", password="pw",
+        )
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.course = Course.objects.create(
+                course_name="Algorithms", course_initial="CSE221", slug="cse221",
+                faculty_name="Ada Lovelace", faculty_initial="ADL", category=category,
+            )
+            cls.notes = [
+                SectionNote.objects.create(
+                    user=cls.user, course=cls.course, lecture=n % 3 + 1, image="section_uploads/p.jpg",
+                    extracted_text="Dijkstra relaxes the edges of the graph. " + "relaxation " * n,
+                )
+                for n in range(12)
+            ]
+
+    def test_ranked_hits_with_escaped_highlighted_snippets(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            best = SectionNote.objects.create(
+                user=self.user, course=self.course, lecture=1, image="section_uploads/d.jpg",
+                extracted_text="Dijkstra: relax, relax, relax <edges>",
+            )
+        hits, next_cursor = search_entries("relax dijkstra")
+
+        self.assertEqual(len(hits), 13)
+        self.assertIsNone(next_cursor)
+        self.assertEqual(hits[0]["object_id"], best.pk)
+        self.assertIn("<mark>Dijkstra</mark>", hits[0]["snippet"])
+        self.assertIn("&lt;edges&gt;", hits[0]["snippet"])
+        self.assertEqual(hits[0]["course"], self.course)
+
+    def test_course_metadata_and_prefixes_match(self):
+        hits, _ = search_entries("cse lovelace")
+        self.assertEqual([(hit["kind"], hit["object_id"]) for hit in hits], [("course", self.course.pk)])
+
+    def test_keyset_pages_cover_every_hit_once(self):
+        seen, cursor = [], None
+        while True:
+            hits, cursor = search_entries("graph", after=cursor, limit=5)
+            seen += [hit["id"] for hit in hits]
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 12)
+        self.assertEqual(len(set(seen)), 12)
+
+    @override_settings(SEARCH_RANK_WINDOW=5)
+    def test_common_terms_are_listed_newest_first(self):
+        seen, cursor = [], None
+        while True:
+            hits, cursor = search_entries("graph", after=cursor, limit=5)
+            seen += [hit["object_id"] for hit in hits]
+            if cursor is None:
+                break
+        self.assertEqual(seen, sorted((note.pk for note in self.notes), reverse=True))
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(search_entries('"NEAR( -* OR'), ([], None))
+        self.assertEqual(search_entries("  "), ([], None))
+
+    def test_index_follows_ocr_and_deletes(self):
+        note = SectionNote.objects.create(
+            user=self.user, course=self.course, lecture=4, image="section_uploads/new.jpg"
+        )
+        self.assertFalse(SearchEntry.objects.filter(kind=SearchEntry.KIND_NOTE, object_id=note.pk).exists())
+
+        SectionNote.objects.filter(pk=note.pk).update(extracted_text="Bellman-Ford negative cycles")
+        reindex_notes([note.pk])
+        self.assertEqual([hit["object_id"] for hit in search_entries("bellman")[0]], [note.pk])
+
+        note.delete()
+        self.assertEqual(search_entries("bellman"), ([], None))
+
+    def test_anonymous_visitors_only_find_courses(self):
+        response = self.client.get(reverse("search"), {"keyword": "dijkstra"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["results"], [])
+        response = self.client.get(reverse("search"), {"keyword": "algorithms"})
+        self.assertEqual([hit["kind"] for hit in response.context["results"]], ["course"])
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("search"), {"keyword": "dijkstra"})
+        self.assertEqual(len(response.context["results"]), 12)
+        self.assertContains(response, "<mark>Dijkstra</mark>")
+
+    def test_other_databases_fall_back_to_substring_matching(self):
+        with mock.patch.object(connection, "vendor", "mysql"):
+            seen, cursor = [], None
+            while True:
+                hits, cursor = search_entries("graph dijk", after=cursor, limit=5)
+                seen += [hit["object_id"] for hit in hits]
+                if cursor is None:
+                    break
+            self.assertEqual(seen, sorted((note.pk for note in self.notes), reverse=True))
+            self.assertIn("<mark>Dijk</mark>stra", hits[0]["snippet"])
+            hits, _ = search_entries("lovelace", kinds=[SearchEntry.KIND_COURSE])
+        self.assertEqual([hit["object_id"] for hit in hits], [self.course.pk])
+
+    def test_search_page_without_keyword(self):
+        response = self.client.get(reverse("search"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["results"], [])
+
+
+@override_settings(AUTOCOMPLETE_CHECK_SECONDS=0)
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = CourseCategory.objects.create(courseCategory="CSE", dep_name="CSE", slug="cse")
+        for initial, name, faculty, section in [
+            ("CSE425", "Neural Networks", "ABC", 1),
+            ("CSE425", "Neural Networks", "XYZ", 2),
+            ("CSE421", "Computer Networks", "ABC", 1),
+            ("CSE221", "Algorithms", "DEF", 1),
+            ("MAT120", "Calculus", "CSE", 1),
+        ]:
+            Course.objects.create(
+                course_name=name, course_initial=initial, slug=f"{initial.lower()}-{section}",
+                faculty_initial=faculty, section=section, category=cls.category,
+            )
+
+    def setUp(self):
+        autocomplete.bump_version()  # rebuild from this test's data
+
+    def labels(self, prefix, limit=None):
+        return [hit["label"] for hit in autocomplete.complete(prefix, limit)]
+
+    def test_course_initials_first_then_faculty_then_name_words(self):
+        self.assertEqual(self.labels("cse42"), [
+            "CSE421 – Computer Networks (Section 1)",
+            "CSE425 – Neural Networks (Section 1)",
+            "CSE425 – Neural Networks (Section 2)",
+        ])
+        # course initials before the MAT120 course taught by "CSE"
+        self.assertEqual(self.labels("cse")[-1], "MAT120 – Calculus (Section 1)")
+        self.assertEqual(len(self.labels("abc")), 2)
+        self.assertEqual(self.labels("netw", limit=2), [
+            "CSE421 – Computer Networks (Section 1)",
+            "CSE425 – Neural Networks (Section 1)",
+        ])
+        self.assertEqual(self.labels("  "), [])
+
+    def test_results_link_to_the_course(self):
+        hit = autocomplete.complete("cse221")[0]
+        self.assertEqual(hit["url"], reverse("course_detail", args=["cse", "cse221-1", 1]))
+
+    def test_keystrokes_run_no_sql(self):
+        self.client.get(reverse("course_autocomplete"), {"q": "c"})  # build
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("course_autocomplete"), {"q": "cse4", "limit": 2})
+        self.assertEqual(len(response.json()["results"]), 2)
+
+    def test_course_changes_rebuild_the_index(self):
+        self.assertEqual(self.labels("eee"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            course = Course.objects.create(
+                course_name="Circuits", course_initial="EEE101", slug="eee101",
+                faculty_initial="GHI", category=self.category,
+            )
+        self.assertEqual(self.labels("eee"), ["EEE101 – Circuits (Section 1)"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            course.delete()
+        self.assertEqual(self.labels("eee"), [])
+
+
+@override_settings(CATALOG_CACHE_STATS_FLUSH=1)
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = CourseCategory.objects.create(courseCategory="CSE", dep_name="CSE", slug="cse")
+        for n in range(10):
+            Course.objects.create(
+                course_name=f"Course {n}", course_initial=f"CSE10{n}", slug=f"cse10{n}",
+                faculty_initial="ABC", category=cls.category,
+            )
+
+    def setUp(self):
+        catalog.bump_version()
+        catalog.reset_stats()
+
+    def test_warm_pages_run_no_sql(self):
+        for url in (reverse("home"), reverse("course"), reverse("course_by_category", args=["cse"])):
+            self.client.get(url, {"page": 2})
+            with self.assertNumQueries(0):
+                response = self.client.get(url, {"page": 2})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([c.course_initial for c in response.context["courses"]], ["CSE109"])
+            self.assertEqual(response.context["courses"].paginator.num_pages, 2)
+            self.assertEqual([c.slug for c in response.context["links"]], ["cse"])
+
+    def test_home_is_paginated(self):
+        response = self.client.get(reverse("home"))
+        self.assertEqual(len(response.context["courses"]), 9)
+        self.assertTrue(response.context["courses"].has_next())
+        # out of range and garbage pages fall back like Paginator.get_page
+        self.assertEqual(self.client.get(reverse("home"), {"page": 99}).context["courses"].number, 2)
+        self.assertEqual(self.client.get(reverse("home"), {"page": "x"}).context["courses"].number, 1)
+
+    def test_unknown_category_is_404(self):
+        self.assertEqual(self.client.get(reverse("course_by_category", args=["nope"])).status_code, 404)
+
+    def test_saves_and_deletes_invalidate(self):
+        self.client.get(reverse("course_by_category", args=["cse"]))
+        with self.captureOnCommitCallbacks(execute=True):
+            eee = CourseCategory.objects.create(courseCategory="EEE", dep_name="EEE", slug="eee")
+            Course.objects.create(
+                course_name="Circuits", course_initial="EEE101", slug="eee101", faculty_initial="GHI", category=eee,
+            )
+        response = self.client.get(reverse("course_by_category", args=["eee"]))
+        self.assertEqual([c.course_initial for c in response.context["courses"]], ["EEE101"])
+        self.assertEqual([c.slug for c in response.context["links"]], ["cse", "eee"])
+        self.assertEqual(self.client.get(reverse("home"), {"page": 2}).context["courses"].paginator.count, 11)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            eee.delete()
+        self.assertEqual(self.client.get(reverse("course_by_category", args=["eee"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("home")).context["courses"].paginator.count, 10)
+
+    def test_hit_rate(self):
+        self.assertIsNone(catalog.stats()["hit_rate"])
+        self.client.get(reverse("course"))  # menu, count, page: 3 misses
+        self.client.get(reverse("course"))  # 3 hits
+        stats = catalog.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (3, 3))
+        self.assertEqual(stats["hit_rate"], 0.5)
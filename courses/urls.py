@@ -13,6 +13,7 @@ urlpatterns = [
          name='course_by_category'),
      path('category/<slug:category_slug>/<slug:course_slug>/<int:section>/', views.course_detail, name='course_detail'),
      path('search/', views.search, name='search'),
+     path('autocomplete/', views.autocomplete, name='course_autocomplete'),
     # Lecture page (each lecture separate)
     path("category/<slug:category_slug>/<slug:course_slug>/<int:section>/<int:lecture>/",
          views.course_detail_per_section,
@@ -1,126 +1,71 @@
 import os
+import hashlib
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
 from io import BytesIO
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.utils import timezone
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Preformatted
-from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
 from .models import SectionNote, LectureFinalNote
+from .pdf_renderer import render_markdown_pdf
+from image_enhancer.utils.batch import enhance_documents
 
 
 # -----------------------------
 # Markdown → PDF GENERATOR
 # -----------------------------
 def create_pdf_from_markdown_bytes(md_text: str) -> BytesIO:
-    buffer = BytesIO()
-
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        leftMargin=40,
-        rightMargin=40,
-        topMargin=40,
-        bottomMargin=40,
-    )
-    
-    styles = getSampleStyleSheet()
-    
-    header = ParagraphStyle(
-        name="Header",
-        parent=styles["Heading1"],
-        fontSize=20,
-        spaceAfter=12,
-        spaceBefore=12,
-    )
-    
-    subheader = ParagraphStyle(
-        name="SubHeader",
-        parent=styles["Heading2"],
-        fontSize=16,
-        spaceAfter=10,
-        spaceBefore=10,
-    )
-    
-    body = ParagraphStyle(
-        name="Body",
-        parent=styles["BodyText"],
-        fontSize=12,
-        leading=16,
-    )
-    
-    bullet = ParagraphStyle(
-        name="Bullet",
-        parent=styles["BodyText"],
-        bulletIndent=20,
-        leftIndent=20,
-        spaceAfter=5,
-    )
-    
-    elements = []
-    
-    for line in md_text.split("\n"):
-        line = line.strip()
-    
-        if not line:
-            elements.append(Spacer(1, 10))
-            continue
-    
-        # Headers
-        if line.startswith("# "):
-            elements.append(Paragraph(line[2:], header))
-            continue
-    
-        if line.startswith("### "):
-            elements.append(Paragraph(line[3:], subheader))
-            continue
-    
-        # Bullet points
-        if line.startswith("* "):
-            elements.append(Paragraph("• " + line[2:], bullet))
-            continue
-    
-        # Normal paragraph
-        elements.append(Paragraph(line, body))
-    
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+    return render_markdown_pdf(md_text)
+
+
+# Bump when rendering changes so cached PDFs are regenerated
+PDF_RENDER_VERSION = "2"
+
+
+def lecture_notes_fingerprint(notes) -> str:
+    """
+    Content hash of a lecture's SectionNotes (id, uploader, OCR text).
+    A stored PDF is current while its pdf_fingerprint matches this.
+    """
+    digest = hashlib.sha256(f"v{PDF_RENDER_VERSION}".encode())
+    for note in notes:
+        digest.update(f"\0{note.pk}:{note.user_id}:".encode())
+        digest.update((note.extracted_text or "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+def lecture_notes_for_fingerprint(course, lecture):
+    return SectionNote.objects.filter(course=course, lecture=lecture).only(
+        "pk", "user_id", "extracted_text"
+    ).order_by("uploaded_at", "pk")
 
 
 # -----------------------------
 # PDF CREATOR FOR LECTURE FINAL NOTES
 # -----------------------------
-def generate_final_pdf_from_notes(lecture_final_obj: LectureFinalNote):
+def generate_final_pdf_from_notes(lecture_final_obj: LectureFinalNote, lock=None):
     """
     Combine all SectionNote OCR text → structure with Gemini → export PDF.
+    Structuring is chunk-level: only new or changed chunks reach the model.
     Attach generated PDF to LectureFinalNote.pdf_file field.
+    Callers hold the lecture's LectureLock (`lock`, extended between stages).
+    If structuring failed for any chunk the PDF falls back to its raw text
+    and no fingerprint is stored, so the PDF is not taken as current.
     """
 
-    from .ai_helpers import structure_text_with_gemini  # safe import
+    from .structuring import structure_lecture_notes  # safe import
 
     course = lecture_final_obj.course
     lecture_no = lecture_final_obj.lecture
 
-    notes_qs = SectionNote.objects.filter(
-        course=course, lecture=lecture_no
-    ).order_by("uploaded_at")
-
-    combined_text = ""
-
-    for note in notes_qs:
-        if note.extracted_text:
-            combined_text += note.extracted_text + "\n\n"
-        else:
-            combined_text += "(No extracted text)\n\n"
-
-    # Use existing notes if user edited them previously
-    raw_input = lecture_final_obj.notes or combined_text
-
-    # Run Gemini if available
-    try:
-        markdown = structure_text_with_gemini(raw_input)
-    except Exception:
-        markdown = raw_input
+    fingerprint = lecture_notes_fingerprint(lecture_notes_for_fingerprint(course, lecture_no))
+    failed = []
+    markdown = structure_lecture_notes(course, lecture_no, failed=failed) or "(No extracted text)"
+    if lock is not None:
+        lock.extend()
 
     # Convert markdown → PDF
     pdf_buffer = create_pdf_from_markdown_bytes(markdown)
@@ -132,9 +77,117 @@ def generate_final_pdf_from_notes(lecture_final_obj: LectureFinalNote):
     )
 
     content = ContentFile(pdf_buffer.read())
-    lecture_final_obj.pdf_file.save(filename, content)
+    lecture_final_obj.pdf_file.save(filename, content, save=False)
 
     lecture_final_obj.notes = markdown
-    lecture_final_obj.save()
+    lecture_final_obj.pdf_fingerprint = "" if failed else fingerprint
+    lecture_final_obj.pdf_updated_at = timezone.now()
+    # only what this step wrote: pending_batches / next_pdf_time may have
+    # changed since the row was read
+    lecture_final_obj.save(update_fields=["pdf_file", "notes", "pdf_fingerprint", "pdf_updated_at"])
+
+    # storage name, not .path: remote storages (Cloudinary) have no local path
+    return lecture_final_obj.pdf_file.name
+
+
+# -----------------------------
+# STREAMING ZIP EXPORT
+# -----------------------------
+@lru_cache(maxsize=None)
+def get_http_session() -> requests.Session:
+    """Process-wide session so image fetches reuse pooled keep-alive connections."""
+    session = requests.Session()
+    pool_size = max(getattr(settings, "IMAGE_EXPORT_CONCURRENCY", 4), 10)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def read_stored_image(field_file) -> bytes:
+    """Bytes of a stored image: pooled HTTP GET for remote URLs, storage read otherwise."""
+    url = field_file.url
+    if url.startswith(("http://", "https://")):
+        resp = get_http_session().get(url, timeout=getattr(settings, "IMAGE_FETCH_TIMEOUT", 15))
+        resp.raise_for_status()
+        return resp.content
+    with field_file.open("rb") as fh:
+        return fh.read()
+
+
+def enhance_pages(images, workers=None):
+    """Enhance page photos on the shared process pool using the IMAGE_ENHANCE_* settings."""
+    return enhance_documents(
+        images,
+        workers=workers or settings.IMAGE_ENHANCE_WORKERS or None,
+        background_scale=settings.IMAGE_ENHANCE_BACKGROUND_SCALE,
+        crop=settings.IMAGE_ENHANCE_CROP,
+        max_side=settings.IMAGE_ENHANCE_MAX_SIDE,
+    )
+
+
+def enhanced_image_name(note) -> str:
+    return f"enhanced_{os.path.splitext(os.path.basename(note.image.name))[0]}.png"
+
+
+def save_enhanced_image(note, png_bytes):
+    """Store a SectionNote's enhanced derivative without touching its other fields."""
+    note.enhanced_image.save(enhanced_image_name(note), ContentFile(png_bytes), save=False)
+    SectionNote.objects.filter(pk=note.pk).update(enhanced_image=note.enhanced_image.name)
+
+
+def map_unordered_bounded(func, items, workers):
+    """
+    Yield func(item) results as they finish, keeping at most 2 * workers
+    items in flight so memory stays flat however many items there are.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+
+        def fill():
+            for item in items:
+                pending.add(pool.submit(func, item))
+                if len(pending) >= workers * 2:
+                    break
 
-    return lecture_final_obj.pdf_file.path
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                yield future.result()
+            fill()
+
+
+class _ZipChunkBuffer:
+    """Write-only sink for ZipFile; the streaming generator drains it after each entry."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_zip_stream(entries):
+    """
+    Build a ZIP from (name, bytes) pairs and yield it chunk by chunk, one
+    chunk per finished entry. Images are already compressed, so entries
+    are stored rather than deflated.
+    """
+    sink = _ZipChunkBuffer()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+        for name, data in entries:
+            zf.writestr(name, data)
+            yield sink.drain()
+    yield sink.drain()
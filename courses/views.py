@@ -3,21 +3,34 @@ import io
 import logging
 import zipfile
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import content_disposition_header, http_date
 from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponse, FileResponse, HttpResponseBadRequest
+from django.http import Http404, HttpResponse, FileResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from collections import defaultdict
 from django.core.files.storage import default_storage
+from django.db import connection
 from django.db.models import Q
-from .models import Course, SectionNote, LectureFinalNote
+from .models import Course, SectionNote, LectureFinalNote, SearchEntry
 from category.models import CourseCategory
-from .ai_helpers import extract_text_from_image, structure_text_with_gemini
-from .utils import create_pdf_from_markdown_bytes, generate_final_pdf_from_notes
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-import requests
+from .utils import (
+    create_pdf_from_markdown_bytes,
+    enhance_pages,
+    enhanced_image_name,
+    iter_zip_stream,
+    lecture_notes_fingerprint,
+    map_unordered_bounded,
+    read_stored_image,
+    save_enhanced_image,
+)
+from .tasks import enqueue_upload_batch
+from .locks import LectureLock
+from .search import reindex_lectures, search_entries
+from .autocomplete import complete
+from .catalog import CachedPaginator, category_by_slug
 from django.core.files.base import ContentFile
-from image_enhancer.utils.document_enhancer import enhance_document
 
 logger = logging.getLogger(__name__)
 
@@ -27,32 +40,49 @@ def course(request, category_slug=None):
     List courses or list courses in a category.
     """
     category = None
+    # course.get_url needs the category slug
+    courses = Course.objects.select_related("category").order_by("pk")
     if category_slug:
-        category = get_object_or_404(CourseCategory, slug=category_slug)
-        courses = Course.objects.filter(category=category)
-        paginator = Paginator(courses, 9)
-        page = request.GET.get('page')
-        paged_courses= paginator.get_page(page)
-    else:
-        courses = Course.objects.all()
-        paginator = Paginator(courses, 9)
-        page = request.GET.get('page')
-        paged_courses= paginator.get_page(page)
+        category = category_by_slug(category_slug)
+        if category is None:
+            raise Http404("No course category matches the given query.")
+        courses = courses.filter(category=category)
+    paginator = CachedPaginator(courses, 9, f"courses:{category_slug or '*'}")
+    paged_courses = paginator.get_page(request.GET.get('page'))
     return render(request, "course/course.html", {"courses": paged_courses, "category": category})
 
     
 def search(request):
-    if 'keyword' in request.GET:
-        keyword = request.GET['keyword']
-        if keyword:
-            courses = Course.objects.filter(Q(faculty_initial__icontains=keyword) | Q(course_initial__icontains=keyword))
-            course_count = courses.count()
+    """
+    Full-text search over course names / faculty, OCR'd notes and lecture
+    notes: ranked hits with highlighted snippets, paged by ?after=<cursor>.
+    Note text is for signed-in students; anonymous visitors only find courses.
+    """
+    keyword = request.GET.get("keyword", "").strip()
+    kinds = None if request.user.is_authenticated else [SearchEntry.KIND_COURSE]
+    results, next_cursor = search_entries(keyword, after=request.GET.get("after"), kinds=kinds)
     context = {
-        'courses': courses,
-        'course_count': course_count,
+        "keyword": keyword,
+        "results": results,
+        "next_cursor": next_cursor,
     }
+    return render(request, "course/search.html", context)
+
+
+def autocomplete(request):
+    """
+    Course suggestions for the search box as JSON, from this process's
+    prefix index (no SQL unless courses changed since the last rebuild).
+    """
+    try:
+        limit = min(max(int(request.GET.get("limit", settings.AUTOCOMPLETE_LIMIT)), 1), 20)
+    except ValueError:
+        limit = settings.AUTOCOMPLETE_LIMIT
+    response = JsonResponse({"results": complete(request.GET.get("q", ""), limit)})
+    patch_cache_control(response, max_age=60)
+    return response
+
 
-    return render(request, "course/course.html",context)
 @login_required(login_url="login")
 def course_detail(request, category_slug, course_slug, section):
     """
@@ -60,43 +90,34 @@ def course_detail(request, category_slug, course_slug, section):
     """
     category = get_object_or_404(CourseCategory, slug=category_slug)
     course = get_object_or_404(Course, category=category, slug=course_slug, section=section)
-    generated_notes = None
 
     if request.method == "POST":
         images = request.FILES.getlist("images")
         if not images:
             return HttpResponseBadRequest("No images uploaded.")
 
-        all_text = []
-        for img_file in images:
-            # Save SectionNote without lecture (lecture=None)
-            sn = SectionNote.objects.create(
+        # Save SectionNotes without lecture (lecture=0); OCR and derivatives run in Celery
+        note_ids = [
+            SectionNote.objects.create(
                 user=request.user,
                 course=course,
-                lecture=0,  # or None if your model allows null
+                lecture=0,
                 image=img_file
-            )
-
-            # Extract text from uploaded image
-            try:
-                extracted = extract_text_from_image(sn.image.path)
-            except Exception:
-                extracted = "(Error extracting text)"
-
-            sn.extracted_text = extracted
-            sn.save()
-            all_text.append(extracted)
+            ).pk
+            for img_file in images
+        ]
+        enqueue_upload_batch(course, 0, note_ids)
 
-        combined = "\n\n".join(all_text)
-        try:
-            generated_notes = structure_text_with_gemini(combined)
-        except Exception:
-            generated_notes = combined
+        return redirect(
+            "course_detail",
+            category_slug=category_slug,
+            course_slug=course_slug,
+            section=section,
+        )
 
     context = {
         "single_course": course,
         "category": category,
-        "notes": generated_notes,
     }
     return render(request, "course/course_detail.html", context)
 
@@ -108,6 +129,7 @@ def course_detail(request, category_slug, course_slug, section):
 def course_detail_per_section(request, category_slug, course_slug, section, lecture):
     """
     Handle per-lecture page: image uploads, OCR, AI notes.
+    Uploads are saved immediately; OCR and structuring run as Celery jobs.
     """
     category = get_object_or_404(CourseCategory, slug=category_slug)
     course = get_object_or_404(Course, category=category, slug=course_slug, section=section)
@@ -128,36 +150,17 @@ def course_detail_per_section(request, category_slug, course_slug, section, lect
         if not images:
             return HttpResponseBadRequest("No images uploaded.")
 
-        all_text_parts = []
-        for img_file in images:
-            sn = SectionNote.objects.create(
+        # Save SectionNotes right away; OCR + structuring run in Celery
+        note_ids = [
+            SectionNote.objects.create(
                 user=request.user,
                 course=course,
                 lecture=lecture,
                 image=img_file
-            )
-
-            try:
-                extracted = extract_text_from_image(sn.image.path)
-            except Exception:
-                extracted = "(Error extracting text)"
-
-            sn.extracted_text = extracted
-            sn.save()
-            all_text_parts.append(extracted)
-
-        combined_text = "\n\n".join(all_text_parts)
-
-        try:
-            generated_notes = structure_text_with_gemini(combined_text)
-        except Exception:
-            generated_notes = combined_text
-
-        if final_note_obj:
-            final_note_obj.notes = generated_notes
-            final_note_obj.save()
-        else:
-            LectureFinalNote.objects.create(course=course, lecture=lecture, notes=generated_notes)
+            ).pk
+            for img_file in images
+        ]
+        enqueue_upload_batch(course, lecture, note_ids)
 
         return redirect(
             "course_detail_per_section",
@@ -178,11 +181,29 @@ def course_detail_per_section(request, category_slug, course_slug, section, lect
     }
     return render(request, "course/lecture_detail.html", context)
 
+def _pdf_response(fileobj, filename, fingerprint, updated_at, max_age=None):
+    response = FileResponse(
+        fileobj,
+        as_attachment=True,
+        filename=filename,
+        content_type="application/pdf"
+    )
+    response["ETag"] = quote_etag(fingerprint)
+    if updated_at:
+        response["Last-Modified"] = http_date(updated_at.timestamp())
+    patch_cache_control(
+        response, private=True,
+        max_age=settings.PDF_CACHE_MAX_AGE if max_age is None else max_age,
+    )
+    return response
+
+
 @login_required(login_url="login")
 def download_lecture_notes_pdf(request, category_slug, course_slug, section, lecture):
     """
     Combine all SectionNote.extracted_text from all users for a lecture into a single PDF.
-    Optionally saves it to LectureFinalNote.pdf_file for caching.
+    The PDF is cached in LectureFinalNote.pdf_file and only re-rendered when the
+    notes' fingerprint changes; clients revalidate with ETag / Last-Modified.
     """
     # 1️⃣ Get the course safely
     course = Course.objects.filter(
@@ -192,105 +213,183 @@ def download_lecture_notes_pdf(request, category_slug, course_slug, section, lec
         return HttpResponse("Course not found.", status=404)
 
     # 2️⃣ Get all SectionNote objects for this lecture
-    notes_qs = SectionNote.objects.filter(course=course, lecture=lecture)
-    if not notes_qs.exists():
+    notes = list(
+        SectionNote.objects.filter(course=course, lecture=lecture)
+        .select_related("user")
+        .order_by("uploaded_at", "pk")
+    )
+    if not notes:
         return HttpResponse("No notes uploaded for this lecture.", status=404)
 
-    # 3️⃣ Combine all extracted_text
+    fingerprint = lecture_notes_fingerprint(notes)
+    filename = f"{course.slug}_lecture_{lecture}_all_users.pdf"
+
+    lecture_final, created = LectureFinalNote.objects.get_or_create(
+        course=course,
+        lecture=lecture,
+        defaults={"is_generated": True, "next_pdf_time": timezone.now()}
+    )
+
+    # 3️⃣ Serve the stored PDF while it matches the notes
+    def cached_response():
+        if not (lecture_final.pdf_file and lecture_final.pdf_fingerprint == fingerprint):
+            return None
+        not_modified = get_conditional_response(
+            request,
+            etag=quote_etag(fingerprint),
+            last_modified=int(lecture_final.pdf_updated_at.timestamp()) if lecture_final.pdf_updated_at else None,
+        )
+        if not_modified is not None:
+            patch_cache_control(not_modified, private=True, max_age=settings.PDF_CACHE_MAX_AGE)
+            return not_modified
+        try:
+            fileobj = lecture_final.pdf_file.open("rb")
+        except Exception:
+            logger.exception("Stored PDF for %s unreadable; re-rendering", lecture_final)
+            return None
+        return _pdf_response(fileobj, filename, fingerprint, lecture_final.pdf_updated_at)
+
+    def previous_pdf_or_busy():
+        """Lecture busy: hand out the previous PDF (revalidated next time), if any."""
+        if lecture_final.pdf_file:
+            try:
+                return _pdf_response(
+                    lecture_final.pdf_file.open("rb"), filename,
+                    lecture_final.pdf_fingerprint or "previous", lecture_final.pdf_updated_at,
+                    max_age=0,
+                )
+            except Exception:
+                logger.exception("Stored PDF for %s unreadable", lecture_final)
+        response = HttpResponse("The PDF for this lecture is being generated. Try again shortly.", status=503)
+        response["Retry-After"] = "10"
+        return response
+
+    response = cached_response()
+    if response is not None:
+        return response
+
+    # 4️⃣ One generation per lecture at a time (shared with Celery tasks);
+    # never wait for a running one in the request
+    lock = LectureLock(course.pk, lecture)
+    if not lock.acquire():
+        return previous_pdf_or_busy()
+
+    # 5️⃣ Combine all extracted_text
     combined_text = ""
-    for i, note in enumerate(notes_qs, start=1):
+    for i, note in enumerate(notes, start=1):
         user_name = getattr(note.user, "username", "User")
         combined_text += f"## Note {i} by {user_name}\n\n"
         combined_text += (note.extracted_text or "(No text available)") + "\n\n"
 
-    # 4️⃣ Generate PDF
     try:
-        pdf_buffer = create_pdf_from_markdown_bytes(combined_text)
-        pdf_bytes = pdf_buffer.getvalue()
-    except Exception as e:
-        logger.exception("Failed to generate PDF: %s", e)
-        return HttpResponse("Failed to generate PDF.", status=500)
-
-    # 5️⃣ Save to LectureFinalNote for caching (optional)
-    lecture_final, created = LectureFinalNote.objects.get_or_create(
-        course=course,
-        lecture=lecture,
-        defaults={"notes": combined_text, "is_generated": True, "next_pdf_time": timezone.now()}
-    )
+        try:
+            pdf_bytes = create_pdf_from_markdown_bytes(combined_text).getvalue()
+        except Exception as e:
+            logger.exception("Failed to generate PDF: %s", e)
+            return HttpResponse("Failed to generate PDF.", status=500)
 
-    if not created:
-        lecture_final.notes = combined_text
+        # 6️⃣ Store for later downloads. Only the PDF fields: upload structuring
+        # may have written notes / pending_batches since the row was read
         lecture_final.is_generated = True
         lecture_final.next_pdf_time = timezone.now()
+        lecture_final.pdf_fingerprint = fingerprint
+        lecture_final.pdf_updated_at = timezone.now()
         lecture_final.pdf_file.save(
             f"{course.slug}_lecture_{lecture}_combined.pdf",
-            io.BytesIO(pdf_bytes),
-            save=True
-        )
-    else:
-        lecture_final.pdf_file.save(
-            f"{course.slug}_lecture_{lecture}_combined.pdf",
-            io.BytesIO(pdf_bytes),
-            save=True
+            ContentFile(pdf_bytes),
+            save=False
         )
-
-    # 6️⃣ Return PDF to user
-    filename = f"{course.slug}_lecture_{lecture}_all_users.pdf"
-    return FileResponse(
-        io.BytesIO(pdf_bytes),
-        as_attachment=True,
-        filename=filename,
-        content_type="application/pdf"
-    )
+        lecture_final.save(update_fields=[
+            "pdf_file", "pdf_fingerprint", "pdf_updated_at", "is_generated", "next_pdf_time",
+        ])
+        # the combined text stands in for notes that were never structured
+        unstructured = Q(notes__isnull=True) | Q(notes="")
+        if LectureFinalNote.objects.filter(unstructured, pk=lecture_final.pk).update(notes=combined_text):
+            reindex_lectures([lecture_final.pk])
+    finally:
+        lock.release()
+
+    # 7️⃣ Return PDF to user
+    return _pdf_response(io.BytesIO(pdf_bytes), filename, fingerprint, lecture_final.pdf_updated_at)
 
 # -----------------------------
 # Download User Images (ZIP)
 # -----------------------------
+def _export_note_image(note):
+    """
+    (zip entry name, bytes) for one note: the stored enhanced page, else a
+    freshly enhanced one (stored for next time), else the original.
+    None if the image cannot be fetched.
+    """
+    if note.enhanced_image:
+        try:
+            return enhanced_image_name(note), read_stored_image(note.enhanced_image)
+        except Exception:
+            logger.warning("Stored enhanced image %s unreadable; re-enhancing", note.enhanced_image.name, exc_info=True)
+
+    basename = os.path.basename(note.image.name)
+    try:
+        original = read_stored_image(note.image)
+    except Exception:
+        logger.warning("Skipping image %s: download failed", note.image.name, exc_info=True)
+        return None
+
+    # runs on the shared process pool, so concurrent fetch threads use every core
+    enhanced = enhance_pages([original])[0]
+    if enhanced is None:
+        # fallback: original image
+        logger.warning("Enhancement failed for %s; exporting original", note.image.name)
+        return basename, original
+    try:
+        save_enhanced_image(note, enhanced.getvalue())
+    except Exception:
+        logger.warning("Could not store enhanced image for note %s", note.pk, exc_info=True)
+    finally:
+        connection.close()  # this pool thread's own connection
+    return enhanced_image_name(note), enhanced.getvalue()
+
+
+def _unique_entries(results):
+    seen = set()
+    for result in results:
+        if result is None:
+            continue
+        name, data = result
+        stem, ext = os.path.splitext(name)
+        n = 1
+        while name in seen:
+            name = f"{stem}_{n}{ext}"
+            n += 1
+        seen.add(name)
+        yield name, data
+
+
 @login_required(login_url="login")
 def download_user_images(request, user_id, category_slug, course_slug, section, lecture):
+    """
+    Stream a ZIP of a user's enhanced lecture images. Stored enhanced pages
+    are sent as they are; only notes without one are enhanced (and stored).
+    Images are fetched concurrently over a pooled HTTP session and each entry
+    is sent as soon as it is ready, so memory stays flat and the first bytes
+    go out quickly.
+    """
     course = get_object_or_404(Course, slug=course_slug, category__slug=category_slug, section=section)
-    notes = SectionNote.objects.filter(user_id=user_id, course=course, lecture=lecture)
+    notes = SectionNote.objects.filter(user_id=user_id, course=course, lecture=lecture).only(
+        "pk", "image", "enhanced_image"
+    )
 
     if not notes.exists():
         return HttpResponse("No images found for this user.", status=404)
 
-    buffer = io.BytesIO()
-
-    with zipfile.ZipFile(buffer, "w") as zip_file:
-        for note in notes:
-            try:
-                # Download image from Cloudinary
-                resp = requests.get(note.image.url)
-                resp.raise_for_status()
-            except Exception:
-                continue  # skip this image if download fails
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(note.image.name)[1]) as tmp:
-                tmp.write(resp.content)
-                tmp_path = tmp.name
+    results = map_unordered_bounded(
+        _export_note_image, notes.iterator(), settings.IMAGE_EXPORT_CONCURRENCY
+    )
+    filename = f"user_{user_id}_lecture_{lecture}_images.zip"
+    response = StreamingHttpResponse(iter_zip_stream(_unique_entries(results)), content_type="application/zip")
+    response["Content-Disposition"] = content_disposition_header(True, filename)
+    return response
 
-            try:
-                # Enhance image
-                enhanced_path = tmp_path.replace(".", "_enhanced.", 1)
-                enhance_document(tmp_path, enhanced_path)
 
-                # Add enhanced image to ZIP
-                with open(enhanced_path, "rb") as f:
-                    zip_file.writestr(f"enhanced_{os.path.basename(note.image.name)}", f.read())
-            except Exception:
-                # fallback: original image
-                with open(tmp_path, "rb") as f:
-                    zip_file.writestr(os.path.basename(note.image.name), f.read())
-            finally:
-                # Clean up temp files
-                if os.path.exists(tmp_path):
-                    os.remove(tmp_path)
-                if os.path.exists(enhanced_path):
-                    os.remove(enhanced_path)
-
-    buffer.seek(0)
-    filename = f"user_{user_id}_lecture_{lecture}_images.zip"
-    return FileResponse(buffer, as_attachment=True, filename=filename, content_type="application/zip")
 @login_required(login_url="login")
 def enhance_view(request):
     """
@@ -306,19 +405,15 @@ def enhance_view(request):
     if not files:
         return HttpResponseBadRequest("No images uploaded.")
 
-    output_files = []
-
-    for file in files:
-        # Read uploaded file into BytesIO
-        img_bytes = io.BytesIO(file.read())
-
-        try:
-            # Pass BytesIO to enhance_document
-            enhanced_bytes = enhance_document(img_bytes)  # modify enhance_document to accept BytesIO
-        except Exception as e:
-            logger.exception("Enhancement failed for %s: %s", file.name, e)
-            enhanced_bytes = img_bytes  # fallback to original
+    # Enhance the whole batch across CPU cores; results come back in order
+    originals = [file.read() for file in files]
+    enhanced = enhance_pages(originals)
 
+    output_files = []
+    for file, original, enhanced_bytes in zip(files, originals, enhanced):
+        if enhanced_bytes is None:
+            logger.error("Enhancement failed for %s", file.name)
+            enhanced_bytes = io.BytesIO(original)  # fallback to original
         output_files.append((file.name, enhanced_bytes))
 
     # If only one file, return directly
@@ -0,0 +1,75 @@
+import time
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from image_enhancer.utils.document_enhancer import find_document_quad, order_corners, warp_document
+
+
+def sample_page_photos(count, width, height, seed=0):
+    """
+    Grayscale 'phone photos' (enhance_array crops the gray image) of a page
+    lying on a darker desk at an angle. Returns (image, true corners) pairs.
+    """
+    rng = np.random.default_rng(seed)
+    photos = []
+    for _ in range(count):
+        desk = rng.normal(70, 12, (height, width)).clip(0, 255).astype(np.uint8)
+        pw, ph = int(width * 0.7), int(height * 0.7)
+        page = np.full((ph, pw), 225, np.uint8)
+        for _ in range(40):
+            x, y = int(rng.integers(20, pw - 220)), int(rng.integers(20, ph - 40))
+            cv2.line(page, (x, y), (x + int(rng.integers(40, 200)), y), 40, 3)
+
+        jitter = lambda: rng.uniform(-0.08, 0.08)  # noqa: E731
+        corners = np.array([
+            [width * (0.12 + jitter()), height * (0.10 + jitter())],
+            [width * (0.88 + jitter()), height * (0.12 + jitter())],
+            [width * (0.90 + jitter()), height * (0.90 + jitter())],
+            [width * (0.10 + jitter()), height * (0.88 + jitter())],
+        ], dtype="float32")
+        src = np.array([[0, 0], [pw - 1, 0], [pw - 1, ph - 1], [0, ph - 1]], dtype="float32")
+        M = cv2.getPerspectiveTransform(src, corners)
+        warped = cv2.warpPerspective(page, M, (width, height))
+        mask = cv2.warpPerspective(np.full_like(page, 255), M, (width, height))
+        photo = np.where(mask > 0, warped, desk)
+        photos.append((photo, corners))
+    return photos
+
+
+class Command(BaseCommand):
+    help = "Benchmark page detection + crop: full-resolution vs proxy contour search."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--photos", type=int, default=5)
+        parser.add_argument("--resolutions", nargs="+", default=["1600x1200", "4000x3000", "8000x6000"])
+        parser.add_argument("--proxy-width", type=int, default=500)
+
+    def handle(self, *args, **opts):
+        for resolution in opts["resolutions"]:
+            width, height = (int(v) for v in resolution.lower().split("x"))
+            photos = sample_page_photos(opts["photos"], width, height)
+            self.stdout.write(f"{width}x{height}, {len(photos)} photos")
+
+            for label, proxy_width in (("full-res", width), (f"proxy {opts['proxy_width']}px", opts["proxy_width"])):
+                detect = warp = 0.0
+                found, errors = 0, []
+                for image, truth in photos:
+                    start = time.perf_counter()
+                    quad = find_document_quad(image, proxy_width)
+                    detect += time.perf_counter() - start
+                    if quad is None:
+                        continue
+                    found += 1
+                    errors.append(np.abs(order_corners(quad) - truth).max() / width * 100)
+                    start = time.perf_counter()
+                    warp_document(image, quad)
+                    warp += time.perf_counter() - start
+
+                n = len(photos)
+                self.stdout.write(
+                    f"  {label:<14} detect {detect * 1000 / n:7.1f} ms  warp {warp * 1000 / max(found, 1):7.1f} ms  "
+                    f"found {found}/{n}  max corner error "
+                    f"{max(errors) if errors else float('nan'):.2f}% of width"
+                )
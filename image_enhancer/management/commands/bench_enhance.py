@@ -0,0 +1,56 @@
+import io
+import time
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from image_enhancer.utils.batch import cpu_count, enhance_documents, get_pool
+from image_enhancer.utils.document_enhancer import enhance_document
+
+
+def sample_photos(count, width, height, seed=0):
+    """JPEG 'phone photos': paper with a shading gradient and pen strokes."""
+    rng = np.random.default_rng(seed)
+    photos = []
+    for _ in range(count):
+        shade = np.linspace(150, 235, width, dtype=np.float32)[None, :].repeat(height, axis=0)
+        page = (shade + rng.normal(0, 6, (height, width))).clip(0, 255).astype(np.uint8)
+        for _ in range(60):
+            x, y = int(rng.integers(0, width - 200)), int(rng.integers(0, height - 40))
+            cv2.line(page, (x, y), (x + int(rng.integers(40, 200)), y + int(rng.integers(-20, 20))), 40, 3)
+        ok, buf = cv2.imencode(".jpg", cv2.cvtColor(page, cv2.COLOR_GRAY2BGR), [cv2.IMWRITE_JPEG_QUALITY, 90])
+        photos.append(buf.tobytes())
+    return photos
+
+
+class Command(BaseCommand):
+    help = "Benchmark batch document enhancement: serial vs the process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--photos", type=int, default=20)
+        parser.add_argument("--width", type=int, default=3000)
+        parser.add_argument("--height", type=int, default=4000)
+        parser.add_argument("--workers", type=int, default=0, help="0 = one per CPU")
+
+    def handle(self, *args, **opts):
+        photos = sample_photos(opts["photos"], opts["width"], opts["height"])
+        workers = opts["workers"] or cpu_count()
+        self.stdout.write(f"{len(photos)} photos {opts['width']}x{opts['height']}, {workers} workers")
+
+        start = time.perf_counter()
+        serial = [enhance_document(io.BytesIO(data)).getvalue() for data in photos]
+        serial_time = time.perf_counter() - start
+        self.stdout.write(f"serial   {serial_time:7.2f}s")
+
+        # start the pool's processes outside the timed run
+        get_pool(workers)
+        enhance_documents(photos[:1], workers=workers)
+
+        start = time.perf_counter()
+        pooled = enhance_documents(photos, workers=workers)
+        pool_time = time.perf_counter() - start
+        self.stdout.write(f"pool     {pool_time:7.2f}s  speedup x{serial_time / pool_time:.2f}")
+
+        if [p.getvalue() if p else None for p in pooled] != serial:
+            self.stderr.write(self.style.ERROR("pool output differs from serial output"))
@@ -0,0 +1,119 @@
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from image_enhancer.utils.document_enhancer import decode_image, enhance_array
+
+RESOLUTIONS = ("1600x1200", "4000x3000", "6000x4500", "8000x6000")
+PHOTO_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def shadowed_photos(count, width, height, seed=0):
+    """
+    Synthetic pages as phones capture them: uneven light, a hard-edged cast
+    shadow (hand / phone) crossing the writing, and pen strokes.
+    Returns [(BGR image, ink mask)]; the mask marks the drawn strokes.
+    """
+    rng = np.random.default_rng(seed)
+    unit = min(width, height) / 1000  # strokes and shadows scale with the photo
+    photos = []
+    for _ in range(count):
+        light = np.linspace(150, 235, width, dtype=np.float32)[None, :].repeat(height, axis=0)
+        page = light + rng.normal(0, 6, (height, width)).astype(np.float32)
+
+        shadow = np.zeros((height, width), np.uint8)
+        corners = rng.integers(0, [width, height], size=(5, 2)).astype(np.int32)
+        cv2.fillPoly(shadow, [cv2.convexHull(corners)], 255)
+        penumbra = _odd(4 * unit)
+        shadow = cv2.GaussianBlur(shadow, (penumbra, penumbra), 0).astype(np.float32) / 255
+        page *= 1 - 0.5 * shadow
+
+        ink = np.zeros((height, width), np.uint8)
+        thickness = max(2, int(round(3 * unit)))
+        for _ in range(int(400 * unit * unit) + 60):
+            x = int(rng.integers(0, width - 200 * unit))
+            y = int(rng.integers(0, height - 40 * unit))
+            end = (x + int(rng.integers(40, 200) * unit), y + int(rng.integers(-20, 20) * unit))
+            cv2.line(ink, (x, y), end, 255, thickness)
+        page[ink > 0] = 40 * (1 - 0.5 * shadow[ink > 0])
+
+        photo = cv2.cvtColor(page.clip(0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+        ok, buf = cv2.imencode(".jpg", photo, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        photos.append((decode_image(buf.tobytes()), ink > 0))
+    return photos
+
+
+def _odd(n):
+    return max(3, int(round(n)) | 1)
+
+
+def ink_f1(output, truth):
+    """F1 of the output's ink pixels (0) against a boolean ink mask."""
+    found = output == 0
+    hits = np.count_nonzero(found & truth)
+    if not hits:
+        return 0.0
+    precision = hits / np.count_nonzero(found)
+    recall = hits / np.count_nonzero(truth)
+    return 2 * precision * recall / (precision + recall)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare full-resolution shadow removal with the downsampled background "
+        "estimate: ms/image and how well the ink (text) pixels agree. Pixel "
+        "agreement over the whole page is mostly white paper and says little, so "
+        "ink is compared: against the drawn strokes of synthetic shadowed pages, "
+        "and against the full-res output for real photos (--photos-dir)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--photos", type=int, default=3)
+        parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS),
+                            help="WIDTHxHEIGHT sizes to test")
+        parser.add_argument("--scales", nargs="+", type=float, default=[0.5, 0.25, 0.125])
+        parser.add_argument("--photos-dir",
+                            help="Directory of real page photos (with shadows) to use instead of synthetic ones")
+
+    def handle(self, *args, **opts):
+        if opts["photos_dir"]:
+            paths = sorted(p for p in Path(opts["photos_dir"]).iterdir() if p.suffix.lower() in PHOTO_SUFFIXES)
+            images = [decode_image(path.read_bytes()) for path in paths]
+            self.stdout.write(f"{len(images)} photos from {opts['photos_dir']}")
+            self.compare(images, truths=None, scales=opts["scales"])
+            return
+
+        for resolution in opts["resolutions"]:
+            width, height = (int(v) for v in resolution.lower().split("x"))
+            photos = shadowed_photos(opts["photos"], width, height)
+            self.stdout.write(f"{width}x{height} ({width * height / 1e6:.1f} MP), {len(photos)} photos")
+            self.compare([image for image, _ in photos], [truth for _, truth in photos], opts["scales"])
+
+    def compare(self, images, truths, scales):
+        reference, elapsed = self._run(images, 1.0)
+        line = f"  scale 1.0    {elapsed:8.1f} ms/image"
+        if truths:
+            line += f"  ink F1 vs strokes {self._mean(ink_f1, reference, truths):.3f}"
+        self.stdout.write(line)
+
+        for scale in scales:
+            outputs, fast = self._run(images, scale)
+            line = (
+                f"  scale {scale:<6} {fast:8.1f} ms/image  x{elapsed / fast:.2f}  "
+                f"ink F1 vs full-res {self._mean(ink_f1, outputs, [ref == 0 for ref in reference]):.3f}"
+            )
+            if truths:
+                line += f"  vs strokes {self._mean(ink_f1, outputs, truths):.3f}"
+            self.stdout.write(line)
+
+    @staticmethod
+    def _mean(metric, outputs, truths):
+        return float(np.mean([metric(output, truth) for output, truth in zip(outputs, truths)]))
+
+    def _run(self, images, scale):
+        start = time.perf_counter()
+        outputs = [enhance_array(img, scale) for img in images]
+        return outputs, (time.perf_counter() - start) * 1000 / len(images)
@@ -1,3 +1,35 @@
-from django.test import TestCase
+import os
+import signal
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from .management.commands.bench_enhance import sample_photos
+from .utils import batch
+
+
+class EnhancePoolTests(SimpleTestCase):
+    def setUp(self):
+        self.photos = sample_photos(4, 400, 300)
+        self.addCleanup(self.shutdown_pools)
+
+    def shutdown_pools(self):
+        for pool in list(batch._pools.values()):
+            batch._discard_pool(pool)
+
+    def test_pool_per_worker_count(self):
+        self.assertIs(batch.get_pool(2), batch.get_pool(2))
+        self.assertIsNot(batch.get_pool(2), batch.get_pool(3))
+
+    def test_pool_is_replaced_after_a_worker_dies(self):
+        expected = [png.getvalue() for png in batch.enhance_documents(self.photos, workers=2)]
+        pool = batch.get_pool(2)
+        for process in list(pool._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)  # as the OOM killer would
+
+        # images of the dead pool fail, the call itself does not
+        results = batch.enhance_documents(self.photos, workers=2)
+        self.assertEqual(len(results), len(self.photos))
+        self.assertIsNot(batch.get_pool(2), pool)
+
+        results = batch.enhance_documents(self.photos, workers=2)
+        self.assertEqual([png.getvalue() for png in results], expected)
@@ -0,0 +1,151 @@
+"""
+Multi-core batch enhancement.
+
+Images are decoded in the calling process (threads; OpenCV releases the
+GIL) straight into shared memory blocks. Worker processes attach to the
+block, run the enhancement chain on the pixels in place and send back only
+the small PNG result, so full-size pixel buffers are never pickled.
+
+If a worker dies (e.g. OOM-killed on a huge photo) the pool is broken for
+good; the images it was handling come back as None and the pool is
+replaced on the next batch.
+"""
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+from .document_enhancer import decode_image, encode_png, enhance_array
+
+_pools = {}  # worker count -> ProcessPoolExecutor
+_pool_lock = threading.Lock()
+
+
+def cpu_count():
+    """CPUs this process may run on (respects container/affinity limits)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_pool(workers=None):
+    """
+    Process pool of `workers` processes shared by every batch in this
+    process, created on first use (one pool per worker count). Uses the
+    spawn start method: forking a threaded web worker is unsafe.
+    """
+    workers = workers or cpu_count()
+    with _pool_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+    return pool
+
+
+def _discard_pool(pool):
+    """Forget a broken pool so the next get_pool() starts a fresh one."""
+    with _pool_lock:
+        for workers, current in list(_pools.items()):
+            if current is pool:
+                del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _enhance_shared(name, shape, dtype, background_scale, crop):
+    """Worker: enhance the image held in shared memory block `name`; returns PNG bytes."""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        img = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        result = encode_png(enhance_array(img, background_scale, crop), bilevel=True).getvalue()
+        del img  # release the buffer export before closing
+        return result
+    finally:
+        shm.close()
+
+
+def _to_shared(data, max_side):
+    """Decode image bytes into a new shared memory block; returns (shm, shape, dtype)."""
+    img = decode_image(data, max_side)
+    shm = shared_memory.SharedMemory(create=True, size=img.nbytes)
+    np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)[...] = img
+    return shm, img.shape, img.dtype.str
+
+
+def _as_bytes(image):
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+    image.seek(0)
+    return image.read()
+
+
+def enhance_documents(images, workers=None, background_scale=1.0, crop=False, max_side=0):
+    """
+    Enhance many images across a pool of `workers` processes (default: one per CPU).
+    images: iterable of bytes or BytesIO
+    background_scale, crop: see document_enhancer.enhance_array
+    max_side: decode at reduced size, longest side at most this (0 = full size)
+    returns: list of BytesIO (PNG) in input order; None where an image failed
+    """
+    images = [_as_bytes(image) for image in images]
+    if not images:
+        return []
+
+    workers = workers or cpu_count()
+    if workers <= 1:
+        return [_enhance_local(data, background_scale, crop, max_side) for data in images]
+
+    results = [None] * len(images)
+    # decode at most two images per worker ahead, to bound shared memory use
+    window = workers * 2
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(images))) as decoders:
+        for offset in range(0, len(images), window):
+            batch = images[offset:offset + window]
+            decoded = list(decoders.map(lambda data: _decode_or_none(data, max_side), batch))
+            pool = get_pool(workers)
+            broken = False
+            try:
+                futures = {}
+                for i, item in enumerate(decoded):
+                    if item is not None:
+                        shm, shape, dtype = item
+                        try:
+                            futures[offset + i] = pool.submit(
+                                _enhance_shared, shm.name, shape, dtype, background_scale, crop
+                            )
+                        except BrokenProcessPool:
+                            broken = True
+                            break
+                for index, future in futures.items():
+                    try:
+                        results[index] = io.BytesIO(future.result())
+                    except BrokenProcessPool:
+                        broken = True
+                    except Exception:
+                        results[index] = None
+            finally:
+                if broken:
+                    _discard_pool(pool)
+                for item in decoded:
+                    if item is not None:
+                        item[0].close()
+                        item[0].unlink()
+    return results
+
+
+def _decode_or_none(data, max_side):
+    try:
+        return _to_shared(data, max_side)
+    except Exception:
+        return None
+
+
+def _enhance_local(data, background_scale, crop, max_side):
+    try:
+        return encode_png(enhance_array(decode_image(data, max_side), background_scale, crop), bilevel=True)
+    except Exception:
+        return None
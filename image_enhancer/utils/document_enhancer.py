@@ -2,29 +2,41 @@ import cv2
 import numpy as np
 import io
 
-def detect_document(image):
-    orig = image.copy()
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+from .prep import decode_reduced
+
+def find_document_quad(image, proxy_width=500):
+    """
+    Corners of the page in `image` (BGR or grayscale) as float32 4x2 in
+    full-resolution coordinates, or None if no convincing 4-sided contour is
+    found. Edges and contours are computed on a copy scaled down to
+    `proxy_width` pixels wide.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    ratio = min(1.0, proxy_width / float(gray.shape[1]))
+    if ratio < 1.0:
+        gray = cv2.resize(gray, None, fx=ratio, fy=ratio, interpolation=cv2.INTER_AREA)
     gray = cv2.GaussianBlur(gray, (5,5), 0)
 
     edges = cv2.Canny(gray, 75, 200)
     edges = cv2.dilate(edges, np.ones((5,5), np.uint8), iterations=1)
 
-    cnts, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-    cnts = sorted(cnts, key=cv2.contourArea, reverse=True)
+    cnts, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    cnts = sorted(cnts, key=cv2.contourArea, reverse=True)[:5]
 
-    doc_cnt = None
+    # a quad covering a small part of the frame is text or a table cell, not the page
+    min_area = 0.2 * gray.shape[0] * gray.shape[1]
     for c in cnts:
+        if cv2.contourArea(c) < min_area:
+            break
         peri = cv2.arcLength(c, True)
         approx = cv2.approxPolyDP(c, 0.02 * peri, True)
         if len(approx) == 4:
-            doc_cnt = approx
-            break
+            return approx.reshape(4, 2).astype("float32") / ratio
+    return None
 
-    if doc_cnt is None:
-        return orig
 
-    pts = doc_cnt.reshape(4, 2)
+def order_corners(pts):
+    """4 points -> top-left, top-right, bottom-right, bottom-left"""
     rect = np.zeros((4,2), dtype="float32")
     s = pts.sum(axis=1)
     rect[0] = pts[np.argmin(s)]
@@ -32,7 +44,12 @@ def detect_document(image):
     diff = np.diff(pts, axis=1)
     rect[1] = pts[np.argmin(diff)]
     rect[3] = pts[np.argmax(diff)]
+    return rect
+
 
+def warp_document(image, quad):
+    """Single full-resolution perspective warp of the page inside `quad`."""
+    rect = order_corners(quad)
     (tl, tr, br, bl) = rect
     widthA = np.linalg.norm(br - bl)
     widthB = np.linalg.norm(tr - tl)
@@ -43,28 +60,63 @@ def detect_document(image):
 
     dst = np.array([[0,0],[maxWidth-1,0],[maxWidth-1,maxHeight-1],[0,maxHeight-1]], dtype="float32")
     M = cv2.getPerspectiveTransform(rect, dst)
-    warped = cv2.warpPerspective(orig, M, (maxWidth, maxHeight))
+    return cv2.warpPerspective(image, M, (maxWidth, maxHeight))
 
-    return warped
 
+def detect_document(image, proxy_width=500):
+    """Crop and deskew the page; returns the image unchanged if none is found."""
+    quad = find_document_quad(image, proxy_width)
+    if quad is None:
+        return image
+    return warp_document(image, quad)
 
-def enhance_document(input_bytesio):
+
+def decode_image(data, max_side=0):
+    """bytes -> BGR numpy array, longest side capped at max_side (0 = full size)"""
+    if max_side:
+        return decode_reduced(data, max_side)
+    file_bytes = np.frombuffer(data, np.uint8)
+    img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return img
+
+
+def _odd(n):
+    return max(3, int(round(n)) | 1)
+
+
+def estimate_background(gray, scale=1.0):
     """
-    input_bytesio: BytesIO containing image data
-    returns: BytesIO with enhanced image
+    Paper background (shadows, uneven light) for shadow removal.
+    scale < 1 estimates it on a downsampled copy with proportionally smaller
+    kernels and upsamples the result, which is much cheaper on large photos.
     """
-    # Convert BytesIO -> numpy array
-    file_bytes = np.frombuffer(input_bytesio.read(), np.uint8)
-    img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+    if scale >= 1.0:
+        dilated = cv2.dilate(gray, np.ones((9,9), np.uint8))
+        return cv2.medianBlur(dilated, 25)
+
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    k = _odd(9 * scale)
+    dilated = cv2.dilate(small, np.ones((k, k), np.uint8))
+    bg = cv2.medianBlur(dilated, _odd(25 * scale))
+    return cv2.resize(bg, (gray.shape[1], gray.shape[0]), interpolation=cv2.INTER_LINEAR)
 
-    # Optional: detect document and crop
-    # img = detect_document(img)
 
+def enhance_array(img, background_scale=1.0, crop=False):
+    """
+    img: BGR numpy array
+    background_scale: resolution factor for the background estimate (1.0 = full)
+    crop: detect the page and crop/deskew to it first
+    returns: binary (0/255) grayscale numpy array
+    """
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if crop:
+        # the output is grayscale, so warp one channel instead of three
+        gray = detect_document(gray)
 
     # 1. Remove shadows
-    dilated = cv2.dilate(gray, np.ones((9,9), np.uint8))
-    bg = cv2.medianBlur(dilated, 25)
+    bg = estimate_background(gray, background_scale)
     no_shadow = 255 - cv2.absdiff(gray, bg)
 
     # 2. CLAHE
@@ -76,12 +128,31 @@ def enhance_document(input_bytesio):
 
     # 4. Clean background
     _, cleaned = cv2.threshold(smooth, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return cleaned
 
-    # Convert back to BytesIO
-    is_success, buffer = cv2.imencode(".png", cleaned)
+
+def encode_png(img, bilevel=False):
+    """
+    numpy array -> BytesIO with PNG data
+    bilevel: write a 1-bit PNG (for binary 0/255 images such as enhance_array output)
+    """
+    params = [cv2.IMWRITE_PNG_BILEVEL, 1] if bilevel else []
+    is_success, buffer = cv2.imencode(".png", img, params)
     if not is_success:
         raise Exception("Failed to encode image")
 
     output_bytesio = io.BytesIO(buffer.tobytes())
     output_bytesio.seek(0)
     return output_bytesio
+
+
+def enhance_document(input_bytesio, background_scale=1.0, crop=False, max_side=0):
+    """
+    input_bytesio: BytesIO containing image data
+    background_scale, crop: see enhance_array
+    max_side: decode at reduced size, longest side at most this (0 = full size)
+    returns: BytesIO with enhanced image
+    """
+    # Convert BytesIO -> numpy array
+    img = decode_image(input_bytesio.read(), max_side)
+    return encode_png(enhance_array(img, background_scale, crop), bilevel=True)
@@ -0,0 +1,107 @@
+"""
+Image preparation shared by OCR and enhancement.
+
+Phone photos arrive as 12-48 MP JPEGs. Both consumers only need a
+bounded resolution, so images are decoded at reduced size where the codec
+supports it (JPEG DCT scaling through PIL's draft mode, or OpenCV's
+IMREAD_REDUCED_* flags), rotated upright from their EXIF orientation,
+capped at a longest side and, for the model, re-encoded as a compact JPEG.
+"""
+import io
+import logging
+import math
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+REDUCED_COLOR_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def open_reduced(data, max_side):
+    """
+    PIL image from bytes, upright, with its longest side at most `max_side`
+    (0 = no cap). JPEGs are decoded at the smallest DCT scale still at
+    least that large.
+    """
+    img = Image.open(io.BytesIO(data))
+    width, height = img.size
+    if max_side and max(width, height) > max_side:
+        scale = max_side / max(width, height)
+        img.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+        # the box is square, so scaling before rotating gives the same size
+        img.thumbnail((max_side, max_side))
+    return ImageOps.exif_transpose(img)
+
+
+def prepare_image(data, max_side=2048, quality=85):
+    """
+    Compact an image for upload to the model.
+    returns: (bytes, mime_type); the original bytes when re-encoding would
+    not make them smaller and nothing needed rotating or scaling.
+    """
+    started = time.perf_counter()
+    original = Image.open(io.BytesIO(data))
+    in_size, in_format = original.size, original.format
+    rotated = original.getexif().get(0x0112, 1) != 1  # EXIF Orientation
+
+    img = open_reduced(data, max_side)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=True)
+    out = buf.getvalue()
+
+    if in_format in ("JPEG", "PNG", "WEBP") and img.size == in_size and not rotated and len(out) >= len(data):
+        out, mime_type = data, Image.MIME[in_format]
+    else:
+        mime_type = "image/jpeg"
+
+    logger.info(
+        "Prepared image for OCR: %d -> %d bytes (%.0f%% saved), %dx%d -> %dx%d in %.1f ms",
+        len(data), len(out), (1 - len(out) / len(data)) * 100, *in_size, *img.size,
+        (time.perf_counter() - started) * 1000,
+    )
+    return out, mime_type
+
+
+def decode_reduced(data, max_side):
+    """
+    bytes -> BGR numpy array with its longest side at most `max_side`,
+    letting libjpeg skip detail we would throw away (IMREAD_REDUCED_*).
+    OpenCV applies the EXIF orientation itself.
+    """
+    started = time.perf_counter()
+    try:
+        width, height = Image.open(io.BytesIO(data)).size  # header only
+    except OSError:
+        width = height = 0  # not a format PIL knows; let OpenCV decode it at full size
+    longest = max(width, height)
+
+    flag, scale = cv2.IMREAD_COLOR, 1
+    for factor, reduced in REDUCED_COLOR_FLAGS:
+        if longest / factor >= max_side:
+            flag, scale = reduced, factor
+            break
+
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+    if img is None:
+        raise ValueError("Could not decode image")
+    if max(img.shape[:2]) > max_side:
+        ratio = max_side / max(img.shape[:2])
+        img = cv2.resize(img, None, fx=ratio, fy=ratio, interpolation=cv2.INTER_AREA)
+
+    logger.info(
+        "Decoded image for enhancement: %d bytes, %dx%d -> %dx%d (1/%d decode) in %.1f ms",
+        len(data), width, height, img.shape[1], img.shape[0], scale,
+        (time.perf_counter() - started) * 1000,
+    )
+    return img